@@ -49,6 +49,8 @@ from routes.project_routes import router as project_router
 from routes.tts_routes import router as tts_router
 from routes.prompts_routes import router as prompts_router
 from modules.ws_manager import manager
+from modules.encoder_registry import encoder_registry
+from services.ai_service import ai_service
 
 # 配置日志
 logging.basicConfig(
@@ -361,11 +363,34 @@ async def startup_event():
     logger.info("AI智能视频剪辑后端服务启动")
     # 启动心跳任务
     asyncio.create_task(send_periodic_heartbeat())
+    # 后台探测编码器能力（按 ffmpeg 版本持久化，版本不变时直接复用；随后执行预设基准）
+    asyncio.create_task(encoder_registry.ensure())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("AI智能视频剪辑后端服务关闭")
+    # 关闭池化的AI客户端长连接
+    try:
+        await ai_service.aclose()
+    except Exception as e:
+        logger.warning(f"关闭AI客户端池失败: {e}")
+    # 落盘缓存索引中延迟写入的访问时间
+    try:
+        from modules.asr_cache import asr_result_cache
+        from modules.tts_cache import tts_cache
+        from modules.ai.response_cache import llm_response_cache
+        asr_result_cache.flush()
+        tts_cache.flush()
+        llm_response_cache.flush()
+    except Exception as e:
+        logger.warning(f"写入缓存索引失败: {e}")
+    # 关闭本地语音识别进程池（未使用时为空操作）
+    try:
+        from services.asr_whisper import shutdown_whisper_pool
+        shutdown_whisper_pool()
+    except Exception as e:
+        logger.warning(f"关闭本地识别进程池失败: {e}")
 
 if __name__ == "__main__":
     # 获取端口配置
@@ -6,14 +6,49 @@ AI模型提供商抽象基类
 """
 
 from abc import ABC, abstractmethod
+from collections import deque
 from typing import Dict, List, Optional, Any, AsyncGenerator
 from pydantic import BaseModel
+import asyncio
+import copy
 import httpx
 import json
 import logging
+import os
+import random
+import time
+
+from .concurrency import parse_retry_after
+from .tracing import LLMTracer, add_queue_wait, current_stage, note_attempt
 
 logger = logging.getLogger(__name__)
 
+try:
+    # httpx 的 HTTP/2 支持依赖可选包 h2（pip install "httpx[http2]"），缺失时回退 HTTP/1.1 keep-alive
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except Exception:
+    _HTTP2_AVAILABLE = False
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _http2_enabled() -> bool:
+    flag = (os.getenv("AI_HTTP2", "1") or "1").strip().lower()
+    return _HTTP2_AVAILABLE and flag not in {"0", "false", "no", "off"}
+
 
 class AIModelConfig(BaseModel):
     """AI模型配置"""
@@ -41,15 +76,96 @@ class ChatResponse(BaseModel):
     finish_reason: Optional[str] = None  # 完成原因
 
 
+class ResiliencePolicy(BaseModel):
+    """单次 chat_completion 的重试/对冲策略"""
+    max_attempts: int = 3  # 最多尝试次数（含首次）
+    base_delay: float = 1.0  # 指数退避基数（秒），实际等待为 [0, base*2^n] 的全抖动
+    max_delay: float = 20.0
+    attempt_timeout: Optional[float] = None  # 单次尝试截止时间（秒），None 时取配置 timeout
+    hedge_percentile: Optional[float] = None  # 超过该延迟分位仍未返回时发出一次对冲请求；None 关闭（AI_HEDGE=1 开启）
+    hedge_min_samples: int = 10  # 延迟样本不足时不对冲
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        # 对冲会对同一请求重复计费，默认关闭
+        hedge = (os.getenv("AI_HEDGE", "0") or "0").strip().lower() in {"1", "true", "yes", "on"}
+        timeout = _env_float("AI_ATTEMPT_TIMEOUT", 0.0)
+        return cls(
+            max_attempts=max(1, _env_int("AI_MAX_ATTEMPTS", 3)),
+            attempt_timeout=timeout if timeout > 0 else None,
+            hedge_percentile=_env_float("AI_HEDGE_PERCENTILE", 0.9) if hedge else None,
+        )
+
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """限流、服务端错误、超时与网络错误可重试；鉴权/参数错误等直接失败"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response is not None and int(exc.response.status_code) in _RETRYABLE_STATUS
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError))
+
+
+def _retry_after_seconds(exc: BaseException) -> Optional[float]:
+    # 与自适应并发控制器共用解析（秒数或 HTTP 日期）
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response is not None:
+        return parse_retry_after(exc.response.headers.get("Retry-After"))
+    return None
+
+
 class AIProviderBase(ABC):
     """AI模型提供商抽象基类"""
     
     def __init__(self, config: AIModelConfig):
         self.config = config
+        self.http2 = _http2_enabled()
+        # 连接复用统计：requests 为发出的请求数，connections_opened 为新建 TCP 连接数
+        self.conn_stats: Dict[str, int] = {"requests": 0, "connections_opened": 0}
+        # 提供商实例由 AIService 按配置池化长期持有，客户端保持长连接供各分块请求复用
         self.client = httpx.AsyncClient(
             timeout=httpx.Timeout(config.timeout or 600),
-            headers=self._get_headers()
+            headers=self._get_headers(),
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=_env_int("AI_HTTP_MAX_CONNECTIONS", 20),
+                max_keepalive_connections=_env_int("AI_HTTP_MAX_KEEPALIVE", 10),
+                keepalive_expiry=float(_env_int("AI_HTTP_KEEPALIVE_EXPIRY", 90)),
+            ),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
         )
+        self.policy = ResiliencePolicy.from_env()
+        # 并发控制器（由 AIService 池化时注入）：每次尝试（含对冲请求）各占一个名额
+        self.limiter = None
+        # 成功请求的延迟样本（按业务阶段分组，剧情点/分块文案/润色的输出长度差异很大），用于计算对冲触发阈值
+        self._latencies: Dict[str, deque] = {}
+        self.resilience_stats: Dict[str, int] = {"attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self.conn_stats["requests"] += 1
+        # httpcore trace 回调：仅在新建连接时触发 connect_tcp 事件
+        request.extensions["trace"] = self._on_trace
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        # 响应头到达即触发（早于读取响应体），作为调用记录的首字节时间
+        LLMTracer.mark("ttfb_ms")
+
+    async def _on_trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.conn_stats["connections_opened"] += 1
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """连接复用统计"""
+        requests = self.conn_stats["requests"]
+        opened = self.conn_stats["connections_opened"]
+        return {
+            **self.resilience_stats,
+            "http2": self.http2,
+            "requests": requests,
+            "connections_opened": opened,
+            "reused_requests": max(0, requests - opened),
+            "reuse_ratio": round(max(0, requests - opened) / requests, 3) if requests else None,
+        }
     
     @abstractmethod
     def _get_headers(self) -> Dict[str, str]:
@@ -71,16 +187,20 @@ class AIProviderBase(ABC):
         """发送请求到AI服务"""
         pass
     
-    async def chat_completion(self, messages: List[ChatMessage], extra_params: Optional[Dict[str, Any]] = None) -> ChatResponse:
+    async def chat_completion(self, messages: List[ChatMessage], extra_params: Optional[Dict[str, Any]] = None,
+                              policy: Optional[ResiliencePolicy] = None) -> ChatResponse:
         """
         聊天完成接口
         
         Args:
             messages: 聊天消息列表
+            extra_params: 按请求覆盖的参数（结构化输出等）
+            policy: 重试/对冲策略，默认取环境变量配置
             
         Returns:
             ChatResponse: 聊天响应
         """
+        policy = policy or self.policy
         try:
             # 格式化消息
             payload = self._format_messages(messages)
@@ -90,16 +210,87 @@ class AIProviderBase(ABC):
                     payload.update(extra_params)
                 except Exception:
                     pass
-            
-            # 发送请求
-            response_data = await self._make_request(payload)
-            
-            # 解析响应
-            return self._parse_response(response_data)
-            
         except Exception as e:
             logger.error(f"AI聊天完成请求失败: {e}")
             raise
+
+        last_error: Optional[BaseException] = None
+        for attempt in range(max(1, policy.max_attempts)):
+            if attempt > 0:
+                # 全抖动指数退避；服务端给出 Retry-After 时不早于该时间
+                delay = random.uniform(0.0, min(policy.max_delay, policy.base_delay * (2 ** attempt)))
+                delay = max(delay, _retry_after_seconds(last_error) or 0.0)
+                self.resilience_stats["retries"] += 1
+                logger.warning(f"AI请求第{attempt}次重试（{delay:.1f}s 后）: {last_error}")
+                await asyncio.sleep(delay)
+            try:
+                return await self._hedged_attempt(payload, policy)
+            except Exception as e:
+                last_error = e
+                if not is_retryable_error(e):
+                    break
+        logger.error(f"AI聊天完成请求失败: {last_error}")
+        raise last_error
+
+    def _hedge_delay(self, policy: ResiliencePolicy) -> Optional[float]:
+        if policy.hedge_percentile is None:
+            return None
+        samples = self._latencies.get(current_stage())
+        if not samples or len(samples) < policy.hedge_min_samples:
+            return None
+        data = sorted(samples)
+        q = min(1.0, max(0.0, float(policy.hedge_percentile)))
+        return data[min(len(data) - 1, int(round(q * (len(data) - 1))))]
+
+    async def _attempt(self, payload: Dict[str, Any], policy: ResiliencePolicy) -> ChatResponse:
+        """单次尝试：独立的请求体副本 + 截止时间；有并发控制器时占用一个名额"""
+        timeout = policy.attempt_timeout or float(self.config.timeout or 600)
+
+        async def _once() -> ChatResponse:
+            self.resilience_stats["attempts"] += 1
+            note_attempt()
+            t0 = time.monotonic()
+            # 各提供商的 _make_request 可能修改请求体（如弹出 thinking），每次尝试使用副本
+            data = await asyncio.wait_for(self._make_request(copy.deepcopy(payload)), timeout=timeout)
+            resp = self._parse_response(data)
+            self._latencies.setdefault(current_stage(), deque(maxlen=100)).append(time.monotonic() - t0)
+            return resp
+
+        if self.limiter is None:
+            return await _once()
+        t_wait = time.monotonic()
+        async with self.limiter.slot():
+            add_queue_wait(time.monotonic() - t_wait)
+            return await _once()
+
+    async def _hedged_attempt(self, payload: Dict[str, Any], policy: ResiliencePolicy) -> ChatResponse:
+        """
+        主请求超过历史延迟分位仍未返回时，再发一个相同的对冲请求，取先成功者并取消另一个，
+        使分块并发的尾延迟接近中位数而非最慢的一块。延迟分位按当前业务阶段（llm_tracer.stage）分别统计。
+        """
+        hedge_after = self._hedge_delay(policy)
+        if hedge_after is None:
+            return await self._attempt(payload, policy)
+        primary = asyncio.ensure_future(self._attempt(payload, policy))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.resilience_stats["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._attempt(payload, policy)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not primary:
+                            self.resilience_stats["hedge_wins"] += 1
+                        return t.result()
+                    error = error or t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
     
     async def stream_chat_completion(self, messages: List[ChatMessage], extra_params: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
         """
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型请求自适应并发控制（AIMD）
+
+按提供商配置各自维护并发上限：
+- 延迟稳定（近期 p95 未明显劣化于基线）时加性增长：每完成约一个并发窗口的请求，上限 +1
+- 遇到 429 / 503 / 超时时乘性减半，并在一个冷却期内只减一次，避免同批失败连续腰斩
+- 响应带 Retry-After 时，在该时间之前暂停发放新的并发名额
+替代各业务处写死的 asyncio.Semaphore(N)，不同提供商的限流与延迟差异由控制器自行适应。
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 各提供商初始并发（未知提供商取默认值）
+INITIAL_LIMITS: Dict[str, int] = {
+    "deepseek": 4,
+    "doubao": 5,
+    "qwen": 4,
+    "openrouter": 3,
+}
+DEFAULT_INITIAL_LIMIT = 4
+LATENCY_WINDOW = 50
+MIN_SAMPLES = 8
+# 近期 p95 超过基线该倍数视为延迟劣化
+LATENCY_TOLERANCE = 1.5
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _p95(values) -> Optional[float]:
+    data = sorted(values)
+    if not data:
+        return None
+    return data[min(len(data) - 1, int(round(0.95 * (len(data) - 1))))]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），返回需等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except Exception:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+        return max(0.0, dt.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def classify_error(exc: BaseException) -> Dict[str, Any]:
+    """
+    判断异常是否属于过载信号（限流 / 服务繁忙 / 超时），并提取 Retry-After。
+    返回 {"overload": bool, "retry_after": Optional[float], "status": Optional[int]}
+    """
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response is not None:
+        status = int(exc.response.status_code)
+        retry_after = parse_retry_after(exc.response.headers.get("Retry-After"))
+    overload = (
+        status in (429, 503)
+        or isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError))
+    )
+    return {"overload": overload, "retry_after": retry_after, "status": status}
+
+
+class AdaptiveLimiter:
+    """单个提供商配置的 AIMD 并发控制器"""
+
+    def __init__(self, name: str, initial: int = DEFAULT_INITIAL_LIMIT,
+                 min_limit: int = 1, max_limit: Optional[int] = None):
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit or _env_int("AI_MAX_CONCURRENCY", 16)))
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.inflight = 0
+        self.blocked_until = 0.0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._baseline_p95: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+        self.stats: Dict[str, int] = {"completed": 0, "overloads": 0, "decreases": 0, "increases": 0}
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """占用一个并发名额；请求耗时与结果用于调整上限"""
+        cond = self._condition()
+        async with cond:
+            while True:
+                wait = self.blocked_until - time.monotonic()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.inflight < int(self.limit):
+                    break
+                await cond.wait()
+            self.inflight += 1
+        t0 = time.monotonic()
+        error: Optional[BaseException] = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            async with cond:
+                self.inflight -= 1
+                if error is None:
+                    self._on_success(time.monotonic() - t0)
+                elif not isinstance(error, asyncio.CancelledError):
+                    self._on_error(error)
+                cond.notify_all()
+
+    def _on_success(self, latency: float) -> None:
+        self.stats["completed"] += 1
+        self._latencies.append(latency)
+        if len(self._latencies) < MIN_SAMPLES:
+            return
+        p95 = _p95(self._latencies)
+        if p95 is None:
+            return
+        if self._baseline_p95 is None or p95 < self._baseline_p95:
+            self._baseline_p95 = p95
+        else:
+            # 基线缓慢跟随，避免一次偶然的低延迟永久压制增长
+            self._baseline_p95 = self._baseline_p95 * 0.98 + p95 * 0.02
+        if p95 <= self._baseline_p95 * LATENCY_TOLERANCE:
+            if self.limit < self.max_limit:
+                old = int(self.limit)
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                if int(self.limit) > old:
+                    self.stats["increases"] += 1
+        else:
+            self._decrease(0.9, "延迟升高")
+
+    def _on_error(self, error: BaseException) -> None:
+        info = classify_error(error)
+        if not info["overload"]:
+            return
+        self.stats["overloads"] += 1
+        if info["retry_after"]:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + float(info["retry_after"]))
+        self._decrease(0.5, f"过载信号 status={info['status']}")
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        now = time.monotonic()
+        # 冷却期：约一个 p95 延迟内只减一次
+        cooldown = max(1.0, _p95(self._latencies) or 1.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        old = self.limit
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.stats["decreases"] += 1
+        # 清空窗口，按新的并发水平重新采样
+        self._latencies.clear()
+        logger.info(f"AI并发控制[{self.name}] {reason}: 上限 {old:.2f} -> {self.limit:.2f}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = _p95(self._latencies)
+        return {
+            "limit": int(self.limit),
+            "limit_raw": round(self.limit, 2),
+            "inflight": self.inflight,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "baseline_p95": round(self._baseline_p95, 3) if self._baseline_p95 is not None else None,
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            **self.stats,
+        }
+
+
+class AdaptiveLimiterRegistry:
+    """按提供商配置指纹管理并发控制器"""
+
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, key: str, provider: str, label: Optional[str] = None) -> AdaptiveLimiter:
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            initial = INITIAL_LIMITS.get((provider or "").lower(), DEFAULT_INITIAL_LIMIT)
+            limiter = AdaptiveLimiter(label or provider, initial=initial)
+            self._limiters[key] = limiter
+        return limiter
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {key[:12]: {"name": lim.name, **lim.snapshot()} for key, lim in self._limiters.items()}
+
+
+# 全局实例
+adaptive_limiter = AdaptiveLimiterRegistry()
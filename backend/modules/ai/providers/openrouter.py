@@ -8,6 +8,8 @@ OpenRouter AI模型提供商实现
 from typing import Dict, List, Any, Optional
 import logging
 
+import httpx
+
 from ..base import AIProviderBase, AIModelConfig, ChatMessage, ChatResponse
 
 logger = logging.getLogger(__name__)
@@ -107,13 +109,19 @@ class OpenRouterProvider(AIProviderBase):
                 json=payload,
                 headers=headers,
             )
-            response_data = response.json()
             if response.status_code >= 400:
-                err = response_data.get("error") if isinstance(response_data, dict) else None
-                if isinstance(err, dict):
-                    raise Exception(f"OpenRouter API错误: {err.get('message') or response.text}")
-                else:
-                    raise Exception(f"OpenRouter API请求失败: {response.text}")
+                # 抛出 HTTPStatusError，使 429/5xx 可被重试策略识别（含 Retry-After）并触发故障转移
+                try:
+                    err = response.json().get("error")
+                except Exception:
+                    err = None
+                message = err.get("message") if isinstance(err, dict) else None
+                raise httpx.HTTPStatusError(
+                    f"OpenRouter API错误({response.status_code}): {message or response.text}",
+                    request=response.request,
+                    response=response,
+                )
+            response_data = response.json()
 
             if "error" in response_data:
                 error_info = response_data["error"]
@@ -9,6 +9,8 @@ from typing import Dict, List, Any, Optional
 import json
 import logging
 
+import httpx
+
 from ..base import AIProviderBase, AIModelConfig, ChatMessage, ChatResponse
 
 logger = logging.getLogger(__name__)
@@ -149,13 +151,19 @@ class QwenProvider(AIProviderBase):
                 json=payload,
                 headers=constant_headers
             )
-            response_data = response.json()
             if response.status_code >= 400:
-                err = response_data.get("error") if isinstance(response_data, dict) else None
-                if isinstance(err, dict):
-                    raise Exception(f"Qwen API错误: {err.get('message') or response.text}")
-                else:
-                    raise Exception(f"Qwen API请求失败: {response.text}")
+                # 抛出 HTTPStatusError，使 429/5xx 可被重试策略识别（含 Retry-After）并触发故障转移
+                try:
+                    err = response.json().get("error")
+                except Exception:
+                    err = None
+                message = err.get("message") if isinstance(err, dict) else None
+                raise httpx.HTTPStatusError(
+                    f"Qwen API错误({response.status_code}): {message or response.text}",
+                    request=response.request,
+                    response=response,
+                )
+            response_data = response.json()
             
             # 检查API错误
             if "error" in response_data:
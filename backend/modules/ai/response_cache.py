@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型响应磁盘缓存
+
+以 (提供商, 模型, 温度, response_format, 规范化消息哈希) 为键缓存 ChatResponse，
+位于 uploads/llm_cache。文案生成失败后重试时，未变化阶段（剧情点提取、分块文案、整体润色）直接命中，
+只为变化的阶段重新调用模型。条目按 TTL 过期，并按最近访问时间（LRU）与总大小上限淘汰。
+命中只更新内存中的访问时间，索引按 LLM_CACHE_INDEX_FLUSH_S 间隔延迟落盘（写入/淘汰时及退出时一并落盘）。
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .base import ChatMessage, ChatResponse
+
+logger = logging.getLogger(__name__)
+
+# 键格式版本：规范化规则变化时递增，使旧缓存自动失效
+RESPONSE_CACHE_VERSION = 1
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        # 行尾空白与首尾空行不影响模型语义
+        return "\n".join(line.rstrip() for line in content.strip().splitlines())
+    return content
+
+
+class LLMResponseCache:
+    """大模型响应缓存（每条一个 JSON 文件 + index.json 索引）"""
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, max_entries: int = 20000):
+        if cache_dir is None:
+            # backend/modules/ai/ -> 项目根目录为上三级
+            project_root = Path(__file__).resolve().parents[3]
+            cache_dir = project_root / "uploads" / "llm_cache"
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / "index.json"
+        if max_bytes is None:
+            max_bytes = int(_env_float("LLM_CACHE_MAX_MB", 256) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = _env_float("LLM_CACHE_TTL_HOURS", 72) * 3600.0
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = (os.getenv("LLM_CACHE_ENABLED", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self.flush_interval = max(0.0, _env_float("LLM_CACHE_INDEX_FLUSH_S", 30.0))
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: Optional[float],
+                 response_format: Optional[Dict[str, Any]], messages: List[ChatMessage],
+                 extra: Optional[Dict[str, Any]] = None) -> str:
+        normalized = [{"role": m.role, "content": _normalize_content(m.content)} for m in messages]
+        messages_hash = hashlib.sha256(
+            json.dumps(normalized, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        payload = json.dumps(
+            {
+                "v": RESPONSE_CACHE_VERSION,
+                "provider": (provider or "").lower(),
+                "model": model or "",
+                "temperature": temperature,
+                "response_format": response_format or None,
+                "extra": extra or {},
+                "messages": messages_hash,
+            },
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is not None:
+            return self._index
+        index: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.index_path.exists():
+                data = json.loads(self.index_path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    index = {k: v for k, v in data.items() if isinstance(v, dict)}
+        except Exception as e:
+            logger.warning(f"读取大模型响应缓存索引失败，将重建: {e}")
+        self._index = index
+        return index
+
+    def _save_index(self) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._index or {}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except Exception as e:
+            logger.warning(f"写入大模型响应缓存索引失败: {e}")
+
+    def flush(self) -> None:
+        """将延迟的访问时间更新写入索引"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _drop_locked(self, key: str) -> None:
+        entry = (self._index or {}).pop(key, None)
+        if entry:
+            try:
+                (self.cache_dir / str(entry.get("file") or "")).unlink(missing_ok=True)
+            except Exception:
+                pass
+
+    def get(self, key: str) -> Optional[ChatResponse]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+            now = time.time()
+            resp: Optional[ChatResponse] = None
+            if self.ttl_seconds <= 0 or now - float(entry.get("created") or 0.0) <= self.ttl_seconds:
+                try:
+                    data = json.loads((self.cache_dir / str(entry.get("file") or "")).read_text(encoding="utf-8"))
+                    resp = ChatResponse(**data)
+                except Exception:
+                    resp = None
+            if resp is None:
+                self._drop_locked(key)
+                self._save_index()
+                self.misses += 1
+                return None
+            entry["last_access"] = now
+            entry["hits"] = int(entry.get("hits") or 0) + 1
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.flush_interval:
+                self._save_index()
+            self.hits += 1
+            return resp
+
+    def discard(self, key: str) -> None:
+        """移除一条缓存（如命中的响应未通过调用方校验）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._load_index():
+                self._drop_locked(key)
+                self._save_index()
+
+    def put(self, key: str, resp: ChatResponse, meta: Optional[Dict[str, Any]] = None) -> None:
+        """写入缓存；空内容或因长度截断的响应不缓存"""
+        if not self.enabled or not (resp.content or "").strip() or resp.finish_reason == "length":
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{key}.json"
+            dst = self.cache_dir / name
+            tmp = dst.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(resp.model_dump(), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, dst)
+            now = time.time()
+            with self._lock:
+                index = self._load_index()
+                index[key] = {
+                    "file": name,
+                    "size": dst.stat().st_size,
+                    "created": now,
+                    "last_access": now,
+                    "hits": 0,
+                    **(meta or {}),
+                }
+                self._evict_locked()
+                self._save_index()
+        except Exception as e:
+            logger.warning(f"写入大模型响应缓存失败: {e}")
+
+    def _evict_locked(self) -> None:
+        index = self._index or {}
+        if self.ttl_seconds > 0:
+            cutoff = time.time() - self.ttl_seconds
+            for key in [k for k, v in index.items() if float(v.get("created") or 0.0) < cutoff]:
+                self._drop_locked(key)
+        total = sum(int(v.get("size") or 0) for v in index.values())
+        if total <= self.max_bytes and len(index) <= self.max_entries:
+            return
+        for key, entry in sorted(index.items(), key=lambda kv: float(kv[1].get("last_access") or 0.0)):
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            total -= int(entry.get("size") or 0)
+            self._drop_locked(key)
+
+    def record_bypass(self) -> None:
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._load_index()
+            return {
+                "enabled": self.enabled,
+                "entries": len(index),
+                "bytes": sum(int(v.get("size") or 0) for v in index.values()),
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+            }
+
+
+# 全局实例
+llm_response_cache = LLMResponseCache()
+atexit.register(llm_response_cache.flush)
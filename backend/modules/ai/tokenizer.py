@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 token 估算与上下文预算
+
+不调用远端接口，按提供商使用可插拔的本地估算器：
+- 默认估算器按 CJK 字符与其他字符分别计数（各家分词器对中文的压缩率不同，按提供商取系数）
+- 安装了 tiktoken 时，openai/openrouter 使用 o200k_base 精确计数
+- 可通过 register_token_estimator 为任意提供商注册自定义估算器
+配合模型上下文窗口表计算单次请求可放入的输入 token 预算，供分块逻辑按真实窗口切分。
+"""
+
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 中文（含标点、全角字符）与日韩文字
+_CJK_RE = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+# 每个 CJK 字符约合多少 token（保守取偏大的值）
+CJK_TOKENS_PER_CHAR: Dict[str, float] = {
+    "qwen": 0.8,
+    "deepseek": 0.7,
+    "doubao": 0.7,
+    "openai": 1.0,
+    "openrouter": 1.1,
+    "claude": 1.3,
+}
+DEFAULT_CJK_TOKENS_PER_CHAR = 1.1
+# 非 CJK 字符约每 3.5 个字符一个 token
+LATIN_CHARS_PER_TOKEN = 3.5
+# 每条消息的角色/分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 6
+
+# 模型上下文窗口（按模型名前缀匹配，取最长前缀）
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "qwen3-max": 262144,
+    "qwen-max": 32768,
+    "qwen-plus": 131072,
+    "qwen-turbo": 1000000,
+    "qwen-long": 1000000,
+    "qwen3": 131072,
+    "deepseek-chat": 131072,
+    "deepseek-reasoner": 131072,
+    "doubao-seed-1-6": 262144,
+    "doubao-1-5": 131072,
+    "doubao": 32768,
+    "openai/gpt-4o": 128000,
+    "openai/gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "anthropic/claude": 200000,
+    "claude": 200000,
+    "google/gemini": 1000000,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+DEFAULT_OUTPUT_RESERVE = 8192
+
+_ESTIMATORS: Dict[str, Callable[[str], int]] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def register_token_estimator(provider: str, estimator: Callable[[str], int]) -> None:
+    """为提供商注册自定义 token 估算器（输入文本，返回 token 数）"""
+    _ESTIMATORS[(provider or "").lower()] = estimator
+
+
+def _heuristic_estimator(cjk_tokens_per_char: float) -> Callable[[str], int]:
+    def _estimate(text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(_CJK_RE.findall(text))
+        other = len(text) - cjk
+        return int(cjk * cjk_tokens_per_char + other / LATIN_CHARS_PER_TOKEN) + 1
+    return _estimate
+
+
+try:
+    # 可选依赖：精确计数 OpenAI 系模型
+    import tiktoken
+
+    _o200k = tiktoken.get_encoding("o200k_base")
+
+    def _tiktoken_estimate(text: str) -> int:
+        return len(_o200k.encode(text or "", disallowed_special=()))
+
+    register_token_estimator("openai", _tiktoken_estimate)
+    register_token_estimator("openrouter", _tiktoken_estimate)
+except Exception:
+    pass
+
+
+def get_token_estimator(provider: Optional[str]) -> Callable[[str], int]:
+    key = (provider or "").lower()
+    est = _ESTIMATORS.get(key)
+    if est is None:
+        est = _heuristic_estimator(CJK_TOKENS_PER_CHAR.get(key, DEFAULT_CJK_TOKENS_PER_CHAR))
+    return est
+
+
+def estimate_tokens(text: str, provider: Optional[str] = None) -> int:
+    return get_token_estimator(provider)(text or "")
+
+
+def estimate_messages_tokens(messages: List[Any], provider: Optional[str] = None) -> int:
+    """估算消息列表的 token 数（消息可为 ChatMessage 或 {"role","content"} 字典）"""
+    est = get_token_estimator(provider)
+    total = 0
+    for m in messages:
+        content = m.get("content") if isinstance(m, dict) else getattr(m, "content", "")
+        total += MESSAGE_OVERHEAD_TOKENS + est(content if isinstance(content, str) else str(content or ""))
+    return total
+
+
+def context_window(model_name: Optional[str]) -> int:
+    """模型上下文窗口；AI_CONTEXT_TOKENS 可强制覆盖"""
+    override = _env_int("AI_CONTEXT_TOKENS", 0)
+    if override > 0:
+        return override
+    name = (model_name or "").lower()
+    best = ""
+    for prefix in CONTEXT_WINDOWS:
+        if name.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return CONTEXT_WINDOWS[best] if best else DEFAULT_CONTEXT_WINDOW
+
+
+def input_token_budget(model_name: Optional[str], max_output_tokens: Optional[int] = None,
+                       prompt_tokens: int = 0, safety_ratio: float = 0.9) -> int:
+    """
+    单次请求可用于正文（字幕等可变内容）的 token 预算：
+    上下文窗口 × 安全系数 − 输出预留 − 提示词模板开销；AI_CHUNK_MAX_TOKENS 可额外设上限。
+    """
+    reserve = int(max_output_tokens or DEFAULT_OUTPUT_RESERVE)
+    budget = int(context_window(model_name) * safety_ratio) - reserve - int(prompt_tokens)
+    cap = _env_int("AI_CHUNK_MAX_TOKENS", 0)
+    if cap > 0:
+        budget = min(budget, cap)
+    return max(1000, budget)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用追踪与 token/延迟统计
+
+每次 AIService 调用记录一个 LLMSpan：阶段、分块序号、提供商/模型、prompt/completion token、
+并发排队等待、首字节时间（TTFB）与总耗时、是否命中缓存、故障转移次数。
+运行/阶段上下文通过 contextvars 传递：在项目脚本生成入口 start_run，业务各阶段用 stage(...) 标注，
+其后创建的并发任务自动继承上下文，无需层层传参。
+每次运行结束时按阶段/模型聚合并写入 uploads/llm_traces/{project_id}_{run_id}.json，供健康接口查询与导出。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+_RUN_ID_RE = re.compile(r"^[\w-]+$")
+
+_current_run: ContextVar[Optional[str]] = ContextVar("llm_trace_run", default=None)
+_current_stage: ContextVar[Tuple[str, Optional[int]]] = ContextVar("llm_trace_stage", default=("unknown", None))
+_current_span: ContextVar[Optional["LLMSpan"]] = ContextVar("llm_trace_span", default=None)
+
+
+def _now_ts() -> str:
+    return datetime.now().isoformat()
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    data = sorted(values)
+    if not data:
+        return None
+    return round(data[min(len(data) - 1, int(round(q * (len(data) - 1))))], 1)
+
+
+class LLMSpan(BaseModel):
+    """单次大模型调用记录（耗时单位毫秒）"""
+    run_id: Optional[str] = None
+    stage: str = "unknown"
+    chunk_id: Optional[int] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    streamed: bool = False
+    cache_hit: bool = False
+    status: str = "ok"  # ok / degraded（重试用尽后使用部分结果）/ error / cancelled
+    error: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # 流式响应不返回 usage，token 数为本地估算
+    usage_estimated: bool = False
+    attempts: int = 0
+    failovers: int = 0
+    queue_wait_ms: float = 0.0
+    ttfb_ms: Optional[float] = None
+    first_token_ms: Optional[float] = None
+    total_ms: float = 0.0
+    started_at: str = ""
+    _t0: float = PrivateAttr(default_factory=time.monotonic)
+
+    def set_usage(self, usage: Optional[Dict[str, int]]) -> None:
+        usage = usage or {}
+        self.prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        self.completion_tokens = int(usage.get("completion_tokens") or 0)
+        self.usage_estimated = False
+
+
+def current_span() -> Optional[LLMSpan]:
+    return _current_span.get()
+
+
+def current_stage() -> str:
+    """当前业务阶段名（未标注时为 unknown）"""
+    return _current_stage.get()[0]
+
+
+def add_queue_wait(seconds: float) -> None:
+    """并发名额排队等待（对冲请求与重试的等待累加）"""
+    sp = _current_span.get()
+    if sp is not None and seconds > 0:
+        sp.queue_wait_ms += seconds * 1000.0
+
+
+def note_attempt() -> None:
+    sp = _current_span.get()
+    if sp is not None:
+        sp.attempts += 1
+
+
+class LLMTracer:
+    """按项目运行聚合调用记录；内存中保留最近若干次运行，完成后落盘"""
+
+    def __init__(self, trace_dir: Optional[Path] = None, max_runs: int = 50):
+        if trace_dir is None:
+            # backend/modules/ai/ -> 项目根目录为上三级
+            project_root = Path(__file__).resolve().parents[3]
+            trace_dir = project_root / "uploads" / "llm_traces"
+        self.trace_dir = trace_dir
+        self.enabled = (os.getenv("LLM_TRACE_ENABLED", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+        self.max_runs = max(1, int(max_runs))
+        self._runs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 不属于任何运行的调用（如连接测试、单独的剧情分析接口）
+        self._adhoc: Deque[LLMSpan] = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    # ---- 上下文 ----
+
+    def start_run(self, project_id: Optional[str]) -> str:
+        """开始一次运行并绑定到当前上下文，返回 run_id"""
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        with self._lock:
+            self._runs[run_id] = {
+                "run_id": run_id,
+                "project_id": project_id,
+                "started_at": _now_ts(),
+                "finished_at": None,
+                "status": "running",
+                "_t0": time.monotonic(),
+                "spans": [],
+            }
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        _current_run.set(run_id)
+        return run_id
+
+    @contextmanager
+    def stage(self, name: str, chunk_id: Optional[int] = None) -> Iterator[None]:
+        """标注当前阶段（及分块序号），作用于其中发起的所有调用"""
+        token = _current_stage.set((name, chunk_id))
+        try:
+            yield
+        finally:
+            _current_stage.reset(token)
+
+    @contextmanager
+    def span(self, streamed: bool = False) -> Iterator[LLMSpan]:
+        """
+        记录一次调用。已处于调用记录中时（如流式失败回退非流式）复用外层记录，不重复计数。
+        """
+        outer = _current_span.get()
+        if outer is not None:
+            yield outer
+            return
+        stage, chunk_id = _current_stage.get()
+        sp = LLMSpan(
+            run_id=_current_run.get(),
+            stage=stage,
+            chunk_id=chunk_id,
+            streamed=streamed,
+            started_at=_now_ts(),
+        )
+        token = _current_span.set(sp)
+        try:
+            yield sp
+        except BaseException as e:
+            sp.status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            sp.error = str(e)[:300] or e.__class__.__name__
+            raise
+        finally:
+            sp.total_ms = round((time.monotonic() - sp._t0) * 1000.0, 1)
+            sp.queue_wait_ms = round(sp.queue_wait_ms, 1)
+            _current_span.reset(token)
+            self._record(sp)
+
+    @staticmethod
+    def mark(field: str = "ttfb_ms") -> None:
+        """记录首字节（响应头到达）或流式首个片段的时间，只记录第一次"""
+        sp = _current_span.get()
+        if sp is None or getattr(sp, field, None) is not None:
+            return
+        setattr(sp, field, round((time.monotonic() - sp._t0) * 1000.0, 1))
+
+    def _record(self, sp: LLMSpan) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            run = self._runs.get(sp.run_id) if sp.run_id else None
+            if run is not None:
+                run["spans"].append(sp)
+            else:
+                self._adhoc.append(sp)
+
+    # ---- 聚合与导出 ----
+
+    @staticmethod
+    def summarize(spans: List[LLMSpan]) -> Dict[str, Any]:
+        def _group(items: List[LLMSpan]) -> Dict[str, Any]:
+            billed = [s for s in items if not s.cache_hit]
+            totals = [s.total_ms for s in billed if s.status == "ok"]
+            ttfbs = [s.ttfb_ms for s in billed if s.ttfb_ms is not None]
+            waits = [s.queue_wait_ms for s in billed]
+            return {
+                "calls": len(items),
+                "errors": sum(1 for s in items if s.status == "error"),
+                "degraded": sum(1 for s in items if s.status == "degraded"),
+                "cancelled": sum(1 for s in items if s.status == "cancelled"),
+                "cache_hits": sum(1 for s in items if s.cache_hit),
+                "failovers": sum(s.failovers for s in items),
+                # 重试与对冲请求合计
+                "extra_attempts": sum(max(0, s.attempts - 1) for s in billed),
+                "prompt_tokens": sum(s.prompt_tokens for s in billed),
+                "completion_tokens": sum(s.completion_tokens for s in billed),
+                "estimated_calls": sum(1 for s in billed if s.usage_estimated),
+                "latency_ms_p50": _percentile(totals, 0.5),
+                "latency_ms_p95": _percentile(totals, 0.95),
+                "ttfb_ms_p50": _percentile(ttfbs, 0.5),
+                "queue_wait_ms_total": round(sum(waits), 1),
+                "queue_wait_ms_max": round(max(waits), 1) if waits else 0.0,
+            }
+
+        by_stage: Dict[str, List[LLMSpan]] = {}
+        by_model: Dict[str, List[LLMSpan]] = {}
+        for s in spans:
+            by_stage.setdefault(s.stage, []).append(s)
+            by_model.setdefault(f"{s.provider or '-'}/{s.model or '-'}", []).append(s)
+        return {
+            **_group(spans),
+            "by_stage": {k: _group(v) for k, v in by_stage.items()},
+            "by_model": {k: _group(v) for k, v in by_model.items()},
+        }
+
+    def _export(self, run: Dict[str, Any], include_spans: bool = True) -> Dict[str, Any]:
+        spans: List[LLMSpan] = list(run["spans"])
+        out = {k: v for k, v in run.items() if not k.startswith("_") and k != "spans"}
+        if run.get("finished_at") is None:
+            out["wall_ms"] = round((time.monotonic() - run["_t0"]) * 1000.0, 1)
+        out["summary"] = self.summarize(spans)
+        if include_spans:
+            out["spans"] = [s.model_dump() for s in spans]
+        return out
+
+    def finish_run(self, run_id: str, status: str = "completed") -> Optional[Path]:
+        """结束运行：解除上下文绑定、聚合并原子写入追踪文件，返回文件路径"""
+        if _current_run.get() == run_id:
+            _current_run.set(None)
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            run["finished_at"] = _now_ts()
+            run["status"] = status
+            run["wall_ms"] = round((time.monotonic() - run["_t0"]) * 1000.0, 1)
+            data = self._export(run)
+        if not self.enabled:
+            return None
+        try:
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+            dst = self.trace_dir / f"{run.get('project_id') or 'adhoc'}_{run_id}.json"
+            tmp = dst.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, dst)
+            s = data["summary"]
+            logger.info(
+                f"大模型调用统计[{run_id}]: {s['calls']} 次调用, 缓存命中 {s['cache_hits']}, "
+                f"tokens {s['prompt_tokens']}+{s['completion_tokens']}, 耗时 {data['wall_ms'] / 1000.0:.1f}s"
+            )
+            return dst
+        except Exception as e:
+            logger.warning(f"写入大模型调用追踪失败: {e}")
+            return None
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """内存中的运行（含进行中）优先，否则读取落盘文件"""
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None:
+                return self._export(run)
+        if not _RUN_ID_RE.match(run_id or ""):
+            return None
+        try:
+            for p in self.trace_dir.glob(f"*_{run_id}.json"):
+                return json.loads(p.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"读取大模型调用追踪失败: {e}")
+        return None
+
+    def list_runs(self, project_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的运行摘要（不含逐次调用明细），内存与磁盘合并，按开始时间倒序"""
+        out: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.trace_dir.exists():
+                files = sorted(self.trace_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+                for p in files:
+                    if len(out) >= limit:
+                        break
+                    if project_id and not p.name.startswith(f"{project_id}_"):
+                        continue
+                    try:
+                        data = json.loads(p.read_text(encoding="utf-8"))
+                    except Exception:
+                        continue
+                    data.pop("spans", None)
+                    if data.get("run_id") and (not project_id or data.get("project_id") == project_id):
+                        out[data["run_id"]] = data
+        except Exception as e:
+            logger.warning(f"读取大模型调用追踪目录失败: {e}")
+        with self._lock:
+            for run_id, run in self._runs.items():
+                if project_id and run.get("project_id") != project_id:
+                    continue
+                out[run_id] = self._export(run, include_spans=False)
+        runs = sorted(out.values(), key=lambda r: str(r.get("started_at") or ""), reverse=True)
+        return runs[: max(1, limit)]
+
+    def adhoc_summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return self.summarize(list(self._adhoc))
+
+
+# 全局实例
+llm_tracer = LLMTracer()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音识别结果持久缓存
+
+键 = (ASR 后端与识别模型, 音频内容指纹)，指纹不依赖 MP3 文件字节（每次重新提取都会变化）：
+- 源视频指纹：文件大小 + 均匀抽样若干数据块的 SHA-256，提取音频前即可计算，命中时连音频提取一并跳过
+- PCM 指纹：ffmpeg 解码为固定采样率单声道 PCM 后流式 SHA-256，与封装/标签/码率无关
+缓存位于 uploads/asr_cache，条目写入带内容校验和（读取时校验，损坏即丢弃），
+原子写入（临时文件 + os.replace），按最近访问时间（LRU）与总大小上限淘汰。
+命中只更新内存中的访问时间，索引按 ASR_CACHE_INDEX_FLUSH_S 间隔延迟落盘（写入/淘汰时及退出时一并落盘）；
+异步调用方使用 aget/aput，文件读写与校验在线程中执行，不阻塞事件循环。
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 键格式/音频处理流程版本：指纹算法或识别前处理变化时递增，使旧缓存自动失效
+ASR_CACHE_VERSION = 1
+# 源文件抽样：块数与块大小
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 1024 * 1024
+# PCM 指纹的解码参数（与识别服务实际收到的音频无关，仅用于内容判等）
+PCM_SAMPLE_RATE = 8000
+PCM_READ_SIZE = 256 * 1024
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return (os.getenv(name, default) or default).strip().lower() not in {"0", "false", "no", "off"}
+
+
+def source_fingerprint(path: Path) -> str:
+    """
+    源文件内容指纹：文件大小 + 首尾及均匀分布的 SAMPLE_BLOCKS 个数据块。
+    对 GB 级视频也只读取约 16MB；同一素材重新上传/改名仍可命中。
+    """
+    size = path.stat().st_size
+    h = hashlib.sha256()
+    h.update(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        if size <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE:
+            while True:
+                block = f.read(SAMPLE_BLOCK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+        else:
+            step = (size - SAMPLE_BLOCK_SIZE) / (SAMPLE_BLOCKS - 1)
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(int(i * step))
+                h.update(f.read(SAMPLE_BLOCK_SIZE))
+    return f"src:{h.hexdigest()}"
+
+
+async def pcm_fingerprint(path: Path) -> Optional[str]:
+    """解码后 PCM 的 SHA-256（ffmpeg 不可用或解码失败时返回 None）"""
+    if not _env_flag("ASR_PCM_FINGERPRINT"):
+        return None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", str(path),
+            "-vn", "-ac", "1", "-ar", str(PCM_SAMPLE_RATE), "-f", "s16le", "-",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except Exception as e:
+        logger.debug(f"PCM 指纹计算不可用: {e}")
+        return None
+    h = hashlib.sha256()
+    total = 0
+    try:
+        while True:
+            chunk = await process.stdout.read(PCM_READ_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            total += len(chunk)
+        _, stderr = await process.communicate()
+    except BaseException:
+        try:
+            process.kill()
+        except Exception:
+            pass
+        raise
+    if process.returncode != 0 or total == 0:
+        logger.warning(f"PCM 指纹计算失败: {(stderr or b'').decode(errors='ignore')[:200]}")
+        return None
+    return f"pcm{PCM_SAMPLE_RATE}:{h.hexdigest()}"
+
+
+def _payload_digest(data: Dict[str, Any]) -> str:
+    return hashlib.sha256(
+        json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class AsrResultCache:
+    """识别结果缓存（每条一个 JSON 文件 + index.json 索引）"""
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None,
+                 max_entries: int = 5000):
+        if cache_dir is None:
+            # backend/modules/ -> 项目根目录为上上级
+            project_root = Path(__file__).resolve().parents[2]
+            cache_dir = project_root / "uploads" / "asr_cache"
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / "index.json"
+        if max_bytes is None:
+            max_bytes = int(_env_float("ASR_CACHE_MAX_MB", 512) * 1024 * 1024)
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = _env_flag("ASR_CACHE_ENABLED")
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self.flush_interval = max(0.0, _env_float("ASR_CACHE_INDEX_FLUSH_S", 30.0))
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.corrupted = 0
+
+    @staticmethod
+    def make_key(variant: str, fingerprint: str) -> str:
+        """variant 为 ASR 后端与识别模型标识，fingerprint 为音频内容指纹"""
+        payload = json.dumps(
+            {"v": ASR_CACHE_VERSION, "variant": variant or "", "fingerprint": fingerprint or ""},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is not None:
+            return self._index
+        index: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.index_path.exists():
+                data = json.loads(self.index_path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    index = {k: v for k, v in data.items() if isinstance(v, dict)}
+        except Exception as e:
+            logger.warning(f"读取 ASR 缓存索引失败，将重建: {e}")
+        self._index = index
+        return index
+
+    def _save_index(self) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._index or {}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except Exception as e:
+            logger.warning(f"写入 ASR 缓存索引失败: {e}")
+
+    def flush(self) -> None:
+        """将延迟的访问时间更新写入索引"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _drop_locked(self, key: str) -> None:
+        entry = (self._index or {}).pop(key, None)
+        if entry:
+            try:
+                (self.cache_dir / str(entry.get("file") or "")).unlink(missing_ok=True)
+            except Exception:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """命中且校验通过时返回识别结果（含 'utterances' 列表）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+            data: Optional[Dict[str, Any]] = None
+            try:
+                wrapper = json.loads((self.cache_dir / str(entry.get("file") or "")).read_text(encoding="utf-8"))
+                payload = wrapper.get("data")
+                if (
+                    wrapper.get("key") == key
+                    and isinstance(payload, dict)
+                    and isinstance(payload.get("utterances"), list)
+                    and wrapper.get("sha256") == entry.get("sha256") == _payload_digest(payload)
+                ):
+                    data = payload
+            except Exception:
+                data = None
+            if data is None:
+                logger.warning(f"ASR 缓存条目校验失败，已丢弃: {key[:12]}")
+                self.corrupted += 1
+                self.misses += 1
+                self._drop_locked(key)
+                self._save_index()
+                return None
+            entry["last_access"] = time.time()
+            entry["hits"] = int(entry.get("hits") or 0) + 1
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.flush_interval:
+                self._save_index()
+            self.hits += 1
+            return data
+
+    def discard(self, keys: List[str]) -> None:
+        """移除若干条目（如分段结果已合并为整段结果后）"""
+        if not self.enabled or not keys:
+            return
+        with self._lock:
+            index = self._load_index()
+            dropped = [k for k in keys if k in index]
+            for k in dropped:
+                self._drop_locked(k)
+            if dropped:
+                self._save_index()
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, data: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> None:
+        await asyncio.to_thread(self.put, key, data, meta)
+
+    def put(self, key: str, data: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> None:
+        """写入识别结果；空结果不缓存"""
+        if not self.enabled or not isinstance(data, dict) or not data.get("utterances"):
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            digest = _payload_digest(data)
+            name = f"{key}.json"
+            dst = self.cache_dir / name
+            tmp = dst.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(
+                json.dumps({"key": key, "sha256": digest, "data": data}, ensure_ascii=False),
+                encoding="utf-8",
+            )
+            os.replace(tmp, dst)
+            now = time.time()
+            with self._lock:
+                index = self._load_index()
+                index[key] = {
+                    "file": name,
+                    "size": dst.stat().st_size,
+                    "sha256": digest,
+                    "utterances": len(data.get("utterances") or []),
+                    "created": now,
+                    "last_access": now,
+                    "hits": 0,
+                    **(meta or {}),
+                }
+                self._evict_locked()
+                self._save_index()
+        except Exception as e:
+            logger.warning(f"写入 ASR 缓存失败: {e}")
+
+    def _evict_locked(self) -> None:
+        index = self._index or {}
+        total = sum(int(v.get("size") or 0) for v in index.values())
+        if total <= self.max_bytes and len(index) <= self.max_entries:
+            return
+        for key, entry in sorted(index.items(), key=lambda kv: float(kv[1].get("last_access") or 0.0)):
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            total -= int(entry.get("size") or 0)
+            self._drop_locked(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._load_index()
+            return {
+                "enabled": self.enabled,
+                "entries": len(index),
+                "bytes": sum(int(v.get("size") or 0) for v in index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "corrupted": self.corrupted,
+            }
+
+
+# 全局实例
+asr_result_cache = AsrResultCache()
+atexit.register(asr_result_cache.flush)
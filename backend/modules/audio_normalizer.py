@@ -1,9 +1,10 @@
 import asyncio
 import json
 import logging
+import math
 import os
 import re
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +14,86 @@ class AudioNormalizer:
         self.max_peak = max_peak
 
     async def _first_pass(self, input_path: str) -> Optional[Dict[str, float]]:
+        return await self.measure_file(input_path)
+
+    async def measure_file(self, input_path: str) -> Optional[Dict[str, float]]:
+        """仅解码音轨测量单个文件的响度统计"""
+        return await self.measure(
+            ["-i", input_path, "-vn"],
+            "-af", f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7:print_format=json",
+        )
+
+    @staticmethod
+    def merge_measurements(items: List[Tuple[Optional[Dict[str, float]], float]]) -> Optional[Dict[str, float]]:
+        """
+        将逐片段的 loudnorm 测量值合并为整段统计（解析近似，避免对成片再做一次完整测量）。
+
+        items: [(片段测量值, 片段时长秒)]；任一片段缺少测量值时返回 None，由调用方改走整段测量。
+        - 积分响度：按时长加权的能量平均，先做 -70 LUFS 绝对门限，再做 -10 LU 相对门限
+        - 真峰值：取各片段最大值
+        - 响度范围：取片段 LRA 最大值与片段间响度分布（10%~95% 分位）跨度的较大者
+        - 目标偏移：各片段首遍输出响度（目标 − target_offset）同样按时长做能量平均，整段偏移 = 目标 − 平均输出响度；
+          片段均无 target_offset 时不返回该项（loudnorm_filter 退化为单遍动态模式）
+        """
+        if not items:
+            return None
+        for m, d in items:
+            if not m or d <= 0.0:
+                return None
+
+        def _power_mean(pairs: List[Tuple[Dict[str, float], float]]) -> Optional[float]:
+            total = sum(d for _, d in pairs)
+            if total <= 0.0:
+                return None
+            energy = sum(d * math.pow(10.0, m["input_i"] / 10.0) for m, d in pairs)
+            if energy <= 0.0:
+                return None
+            return 10.0 * math.log10(energy / total)
+
+        gated = [(m, d) for m, d in items if m["input_i"] > -70.0]
+        if not gated:
+            return None
+        ungated_i = _power_mean(gated)
+        if ungated_i is None:
+            return None
+        rel = [(m, d) for m, d in gated if m["input_i"] >= ungated_i - 10.0] or gated
+        integrated = _power_mean(rel)
+        if integrated is None:
+            return None
+
+        louds = sorted(m["input_i"] for m, _ in rel)
+        lo = louds[int(round((len(louds) - 1) * 0.10))]
+        hi = louds[int(round((len(louds) - 1) * 0.95))]
+        lra = max(max(m["input_lra"] for m, _ in rel), hi - lo)
+        out = {
+            "input_i": round(integrated, 2),
+            "input_lra": round(lra, 2),
+            "input_tp": round(max(m["input_tp"] for m, _ in items), 2),
+            "input_thresh": round(integrated - 10.0, 2),
+        }
+        # 目标值在能量平均中相互抵消：offset = −10·log10(Σ d·10^(−offset_i/10) / Σ d)
+        with_offset = [(m, d) for m, d in rel if "target_offset" in m]
+        if with_offset:
+            total = sum(d for _, d in with_offset)
+            mean = sum(d * math.pow(10.0, -m["target_offset"] / 10.0) for m, d in with_offset) / total
+            out["target_offset"] = round(-10.0 * math.log10(mean), 2)
+        return out
+
+    async def measure_filtergraph(self, input_args: List[str], filter_complex: str, audio_label: str) -> Optional[Dict[str, float]]:
+        """
+        对滤镜图输出的音频做 loudnorm 测量（仅处理音频，不解码未引用的视频流）。
+        audio_label 为滤镜图中待测量音频的输出标签，如 "acat"。
+        """
+        graph = f"{filter_complex};[{audio_label}]loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7:print_format=json[lnm]"
+        return await self.measure(input_args, "-filter_complex", graph, ["-map", "[lnm]"])
+
+    async def measure(self, input_args: List[str], filter_flag: str, filter_value: str,
+                      map_args: Optional[List[str]] = None) -> Optional[Dict[str, float]]:
         cmd = [
             "ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error",
-            "-i", input_path,
-            "-af", f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7:print_format=json",
+            *input_args,
+            filter_flag, filter_value,
+            *(map_args or []),
             "-f", "null", "-",
         ]
         proc = await asyncio.create_subprocess_exec(
@@ -27,7 +104,10 @@ class AudioNormalizer:
         _, stderr = await proc.communicate()
         if proc.returncode != 0:
             return None
-        text = stderr.decode(errors="ignore")
+        return self._parse_loudnorm_stats(stderr.decode(errors="ignore"))
+
+    @staticmethod
+    def _parse_loudnorm_stats(text: str) -> Optional[Dict[str, float]]:
         # 提取包含 loudnorm 统计值的 JSON 块
         m = re.search(r"\{\s*\"input_i\"\s*:\s*.*?\}", text, flags=re.DOTALL)
         if not m:
@@ -51,46 +131,41 @@ class AudioNormalizer:
         except Exception:
             return None
 
+    def loudnorm_filter(self, measured: Optional[Dict[str, float]] = None) -> str:
+        """生成 loudnorm 滤镜参数：有完整测量值时使用线性两遍模式，否则退化为单遍动态模式"""
+        if measured is None or ("target_offset" not in measured):
+            return f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7"
+        return (
+            f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7:"
+            f"measured_I={measured['input_i']}:"
+            f"measured_LRA={measured['input_lra']}:"
+            f"measured_TP={measured['input_tp']}:"
+            f"measured_thresh={measured['input_thresh']}:"
+            f"offset={measured['target_offset']}:"
+            f"linear=true"
+        )
+
     async def normalize_video_loudness(self, input_path: str, output_path: str, sample_rate: int = 44100, channels: int = 2) -> bool:
         if not os.path.exists(input_path):
             logger.error(f"音频不存在: {input_path}")
             return False
         measured = await self._first_pass(input_path)
-        if measured is None or ("target_offset" not in measured):
-            cmd = [
-                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                "-i", input_path,
-                "-af", f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7",
-                "-c:v", "copy",
-                "-ar", str(sample_rate),
-                "-ac", str(channels),
-                "-c:a", "aac", "-b:a", "192k",
-                output_path,
-            ]
-        else:
+        if measured is not None and ("target_offset" in measured):
             logger.info(
                 "两遍 loudnorm 测量: I=%.2f, LRA=%.2f, TP=%.2f, thresh=%.2f, offset=%.2f" % (
                     measured['input_i'], measured['input_lra'], measured['input_tp'], measured['input_thresh'], measured['target_offset']
                 )
             )
-            cmd = [
-                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-                "-i", input_path,
-                "-af", (
-                    f"loudnorm=I={self.target_lufs}:TP={self.max_peak}:LRA=7:"
-                    f"measured_I={measured['input_i']}:"
-                    f"measured_LRA={measured['input_lra']}:"
-                    f"measured_TP={measured['input_tp']}:"
-                    f"measured_thresh={measured['input_thresh']}:"
-                    f"offset={measured['target_offset']}:"
-                    f"linear=true"
-                ),
-                "-c:v", "copy",
-                "-ar", str(sample_rate),
-                "-ac", str(channels),
-                "-c:a", "aac", "-b:a", "192k",
-                output_path,
-            ]
+        cmd = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-i", input_path,
+            "-af", self.loudnorm_filter(measured),
+            "-c:v", "copy",
+            "-ar", str(sample_rate),
+            "-ac", str(channels),
+            "-c:a", "aac", "-b:a", "192k",
+            output_path,
+        ]
         proc = await asyncio.create_subprocess_exec(
             *cmd,
             stdout=asyncio.subprocess.PIPE,
@@ -21,37 +21,11 @@ async def _ensure_parent_dir(path: Path) -> None:
 
 
 async def _ffprobe_duration(path: str) -> Optional[float]:
+    # 统一走媒体探测缓存，与视频处理共享同一份 ffprobe 结果
     try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "a:0",
-            "-show_entries", "stream=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        out, _ = await proc.communicate()
-        if proc.returncode == 0:
-            try:
-                return float(out.decode().strip())
-            except Exception:
-                pass
-        cmd2 = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc2 = await asyncio.create_subprocess_exec(*cmd2, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        out2, _ = await proc2.communicate()
-        if proc2.returncode == 0:
-            try:
-                return float(out2.decode().strip())
-            except Exception:
-                return None
-        return None
+        from modules.media_probe import media_probe
+        info = await media_probe.probe(path)
+        return info.duration("audio") if info is not None else None
     except Exception:
         return None
 
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编码器能力注册表
+
+启动时探测一次 ffmpeg 的编码器与硬件加速能力，并对每个硬件编码器做一次极短的试编码确认可用；
+随后在主机空闲时于合成画面（lavfi testsrc2）上对 libx264/libx265 各预设做微基准测试：
+按生产环境的并发编码数（VIDEO_FFMPEG_CONCURRENCY）同时编码，以单路实测吞吐选择预设，
+且不选比 DEFAULT_X264_PRESET 更慢的预设（ENCODER_ALLOW_SLOW_PRESETS=1 时放开）。
+结果按 (ffmpeg 路径, ffmpeg 版本, CPU 核心数) 持久化到 uploads/encoder_registry.json，
+版本不变时直接复用，运行期不再重复执行 ffmpeg -encoders / -hwaccels 或按失败逐个试错。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_VERSION = 2
+
+# 关注的视频编码器（按优先级：硬件编码器在前）
+H264_HW_ENCODERS = ["h264_nvenc", "h264_qsv", "h264_amf"]
+SOFTWARE_ENCODERS = ["libx264", "libx265"]
+BENCH_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast"]
+DEFAULT_X264_PRESET = "superfast"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return (os.getenv(name, default) or default).strip().lower() not in {"0", "false", "no", "off", ""}
+
+
+def ffmpeg_concurrency() -> int:
+    """生产环境同时运行的 ffmpeg 编码数：CPU 密集型，默认取一半核心（片段渲染与基准测试共用）"""
+    return max(1, _env_int("VIDEO_FFMPEG_CONCURRENCY", max(1, (os.cpu_count() or 2) // 2)))
+
+
+def _load_per_core() -> Optional[float]:
+    try:
+        return os.getloadavg()[0] / float(os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        # Windows 无负载均值
+        return None
+
+
+def allowed_presets() -> List[str]:
+    """可选预设：默认不比 DEFAULT_X264_PRESET 更慢"""
+    if _env_flag("ENCODER_ALLOW_SLOW_PRESETS"):
+        return list(BENCH_PRESETS)
+    return BENCH_PRESETS[: BENCH_PRESETS.index(DEFAULT_X264_PRESET) + 1]
+
+
+class EncoderRegistry:
+    """ffmpeg 编码器能力与基准结果（持久化）"""
+
+    def __init__(self, registry_path: Optional[Path] = None):
+        if registry_path is None:
+            # backend/modules/ -> 项目根目录为上上级
+            project_root = Path(__file__).resolve().parents[2]
+            registry_path = project_root / "uploads" / "encoder_registry.json"
+        self.registry_path = registry_path
+        self._data: Optional[Dict[str, Any]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._bench_task: Optional[asyncio.Task] = None
+        self._busy_checks: List[Callable[[], bool]] = []
+
+    @staticmethod
+    async def _run(*args: str, timeout: float = 30.0) -> tuple:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+            await proc.wait()
+            return -1, b"", b"timeout"
+        return proc.returncode, out, err
+
+    async def _fingerprint(self) -> Dict[str, Any]:
+        ffmpeg_path = shutil.which("ffmpeg") or "ffmpeg"
+        version = ""
+        try:
+            rc, out, _ = await self._run("ffmpeg", "-hide_banner", "-version", timeout=10.0)
+            if rc == 0:
+                version = (out.decode(errors="ignore").splitlines() or [""])[0].strip()
+        except Exception:
+            pass
+        return {
+            "registry_version": REGISTRY_VERSION,
+            "ffmpeg_path": ffmpeg_path,
+            "ffmpeg_version": version,
+            "cpu_count": os.cpu_count() or 1,
+        }
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            if self.registry_path.exists():
+                data = json.loads(self.registry_path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    return data
+        except Exception as e:
+            logger.warning(f"读取编码器注册表失败，将重新探测: {e}")
+        return None
+
+    def _save(self) -> None:
+        try:
+            self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.registry_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._data or {}, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.registry_path)
+        except Exception as e:
+            logger.warning(f"写入编码器注册表失败: {e}")
+
+    async def _try_encode(self, encoder: str, extra: Optional[List[str]] = None,
+                          size: str = "256x144", frames: int = 5) -> Optional[float]:
+        """在合成画面上试编码，成功返回实测 fps，失败返回 None"""
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30",
+            "-frames:v", str(frames),
+            "-c:v", encoder, *(extra or []),
+            "-pix_fmt", "yuv420p",
+            "-f", "null", "-",
+        ]
+        t0 = time.perf_counter()
+        try:
+            rc, _, _ = await self._run(*cmd, timeout=60.0)
+        except Exception:
+            return None
+        elapsed = time.perf_counter() - t0
+        if rc != 0:
+            return None
+        return frames / max(elapsed, 1e-6)
+
+    async def _probe(self, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+        listed: List[str] = []
+        hwaccels: List[str] = []
+        try:
+            rc, out, _ = await self._run("ffmpeg", "-hide_banner", "-encoders", timeout=15.0)
+            if rc == 0:
+                text = out.decode(errors="ignore")
+                listed = [n for n in H264_HW_ENCODERS + SOFTWARE_ENCODERS if n in text]
+        except Exception:
+            pass
+        try:
+            rc, out, _ = await self._run("ffmpeg", "-hide_banner", "-hwaccels", timeout=15.0)
+            if rc == 0:
+                lines = out.decode(errors="ignore").splitlines()
+                hwaccels = [ln.strip().lower() for ln in lines[1:] if ln.strip()]
+        except Exception:
+            pass
+
+        # 列出不代表可用（缺驱动/无显卡时打开编码器失败），逐个试编码确认
+        usable: List[str] = []
+        for name in listed:
+            if await self._try_encode(name) is not None:
+                usable.append(name)
+        if not usable:
+            usable = ["libx264"]
+        cuda = any(h in hwaccels for h in ("cuda", "nvdec", "cuvid"))
+        logger.info(f"编码器探测完成: 可用={usable}, hwaccels={hwaccels}")
+        return {
+            **fingerprint,
+            "listed_encoders": listed,
+            "usable_encoders": usable,
+            "hwaccels": hwaccels,
+            "cuda": cuda,
+            "benchmark": None,
+            "probed_at": time.time(),
+        }
+
+    async def ensure(self) -> Dict[str, Any]:
+        """确保注册表可用：ffmpeg 版本/路径/核心数未变时复用持久化结果，否则重新探测"""
+        if self._data is not None:
+            return self._data
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._data is not None:
+                return self._data
+            fp = await self._fingerprint()
+            saved = self._load()
+            if saved and all(saved.get(k) == v for k, v in fp.items()):
+                self._data = saved
+            else:
+                self._data = await self._probe(fp)
+                self._save()
+        self._schedule_benchmark()
+        return self._data
+
+    def add_busy_check(self, check: Callable[[], bool]) -> None:
+        """注册业务侧忙碌判断（如有渲染任务在运行），返回 True 时推迟基准测试"""
+        self._busy_checks.append(check)
+
+    def _host_busy(self, check_load: bool = True) -> bool:
+        """
+        业务侧忙碌判断；check_load 时另按系统负载判断（仅在基准开始前作为基线检查：
+        基准开始后其自身的并发编码会推高负载，此后只看业务侧判断）
+        """
+        for check in self._busy_checks:
+            try:
+                if check():
+                    return True
+            except Exception:
+                pass
+        if not check_load:
+            return False
+        load = _load_per_core()
+        return load is not None and load > _env_float("ENCODER_BENCH_MAX_LOAD", 0.3)
+
+    def _benchmark_stale(self) -> bool:
+        bench = (self._data or {}).get("benchmark")
+        return bench is None or bench.get("concurrency") != ffmpeg_concurrency()
+
+    def _schedule_benchmark(self) -> None:
+        if not self._benchmark_stale():
+            return
+        if not _env_flag("ENCODER_BENCHMARK", "1"):
+            return
+        if self._bench_task is not None and not self._bench_task.done():
+            return
+        try:
+            self._bench_task = asyncio.get_running_loop().create_task(self._benchmark_when_idle())
+        except Exception:
+            pass
+
+    async def _benchmark_when_idle(self) -> None:
+        """等待主机空闲后运行基准；测试中途变忙则放弃本轮结果，稍后重试"""
+        interval = max(5.0, _env_float("ENCODER_BENCH_IDLE_POLL", 60.0))
+        while self._benchmark_stale():
+            if not self._host_busy():
+                try:
+                    await self.run_benchmark()
+                except Exception as e:
+                    logger.warning(f"编码器基准失败: {e}")
+                    return
+                if not self._benchmark_stale():
+                    return
+            await asyncio.sleep(interval)
+
+    async def _bench_preset(self, encoder: str, preset: str, concurrency: int) -> Optional[float]:
+        """并发 concurrency 路同时编码，返回单路平均 fps（任一路失败返回 None）"""
+        frames = 60
+        t0 = time.perf_counter()
+        rates = await asyncio.gather(*[
+            self._try_encode(encoder, ["-preset", preset], size="1280x720", frames=frames)
+            for _ in range(concurrency)
+        ])
+        if any(r is None for r in rates):
+            return None
+        return frames / max(time.perf_counter() - t0, 1e-6)
+
+    async def run_benchmark(self) -> Dict[str, Any]:
+        """
+        微基准：720p 合成画面按生产并发数同时编码各 60 帧，记录每个预设的单路 fps。
+        选择规则：在满足目标吞吐（ENCODER_TARGET_FPS，默认 90，约 3 倍实时）的可选预设中取压缩效率最高（最慢）的；
+        都达不到则取 DEFAULT_X264_PRESET。开始前记录负载基线；测试期间出现渲染任务则中止且不保存结果。
+        """
+        data = self._data or await self.ensure()
+        load_baseline = _load_per_core()
+        concurrency = ffmpeg_concurrency()
+        presets = allowed_presets()
+        results: Dict[str, Dict[str, float]] = {}
+        for enc in SOFTWARE_ENCODERS:
+            if enc not in data.get("usable_encoders", []):
+                continue
+            results[enc] = {}
+            for preset in presets:
+                if self._host_busy(check_load=False):
+                    logger.info("有渲染任务运行，中止编码器基准，稍后重试")
+                    return data
+                fps = await self._bench_preset(enc, preset, concurrency)
+                if fps is not None:
+                    results[enc][preset] = round(fps, 1)
+        target = _env_float("ENCODER_TARGET_FPS", 90.0)
+        chosen: Dict[str, str] = {}
+        for enc, table in results.items():
+            if not table:
+                continue
+            ok = [p for p in presets if table.get(p, 0.0) >= target]
+            chosen[enc] = ok[-1] if ok else DEFAULT_X264_PRESET
+        data["benchmark"] = {
+            "fps": results,
+            "target_fps": target,
+            "concurrency": concurrency,
+            "load_baseline": round(load_baseline, 3) if load_baseline is not None else None,
+            "chosen_presets": chosen,
+            "benchmarked_at": time.time(),
+        }
+        self._data = data
+        self._save()
+        logger.info(f"编码器基准完成（并发 {concurrency}）: 预设选择={chosen}, 单路 fps={results}")
+        return data
+
+    # ----- 查询接口 -----
+
+    async def usable_encoders(self) -> List[str]:
+        data = await self.ensure()
+        return list(data.get("usable_encoders") or ["libx264"])
+
+    async def cuda_available(self) -> bool:
+        data = await self.ensure()
+        return bool(data.get("cuda"))
+
+    async def x264_preset(self, encoder: str = "libx264") -> str:
+        data = await self.ensure()
+        bench = data.get("benchmark") or {}
+        preset = (bench.get("chosen_presets") or {}).get(encoder) or DEFAULT_X264_PRESET
+        return preset if preset in allowed_presets() else DEFAULT_X264_PRESET
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self._data or {})
+
+
+# 全局实例
+encoder_registry = EncoderRegistry()
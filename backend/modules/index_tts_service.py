@@ -44,42 +44,11 @@ async def _ensure_parent_dir(path: Path) -> None:
 
 async def _ffprobe_duration(path: str) -> Optional[float]:
     """使用 ffprobe 获取音频时长"""
+    # 统一走媒体探测缓存，与视频处理共享同一份 ffprobe 结果
     try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "a:0",
-            "-show_entries", "stream=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc = await asyncio.create_subprocess_exec(
-            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        out, _ = await proc.communicate()
-        if proc.returncode == 0:
-            try:
-                return float(out.decode().strip())
-            except Exception:
-                pass
-        # 备用方案：通过 format 获取
-        cmd2 = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc2 = await asyncio.create_subprocess_exec(
-            *cmd2, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        out2, _ = await proc2.communicate()
-        if proc2.returncode == 0:
-            try:
-                return float(out2.decode().strip())
-            except Exception:
-                return None
-        return None
+        from modules.media_probe import media_probe
+        info = await media_probe.probe(path)
+        return info.duration("audio") if info is not None else None
     except Exception:
         return None
 
@@ -89,6 +58,8 @@ class IndexTtsService:
 
     _model: Optional[Any] = None
     _model_lock: threading.Lock = threading.Lock()
+    # 单个模型实例不支持并发推理（共享显存与内部状态），所有调用方串行
+    _infer_lock: threading.Lock = threading.Lock()
     _model_loading: bool = False
     _load_error: Optional[str] = None
 
@@ -293,7 +264,8 @@ class IndexTtsService:
 
             # 执行推理（在线程池中）
             def do_infer():
-                model.infer(**infer_kwargs)
+                with self._infer_lock:
+                    model.infer(**infer_kwargs)
 
             await loop.run_in_executor(None, do_infer)
 
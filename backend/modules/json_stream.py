@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式JSON增量解析模块
+在大模型流式输出过程中逐段喂入文本，顶层对象中目标数组（如 items / plot_points）的每个元素一闭合即解析产出；
+流被截断时可从已闭合的元素恢复出部分数组，而不是整块丢弃。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from modules.json_sanitizer import sanitize_json_text_to_dict, _remove_trailing_commas, _strip_code_fences
+
+
+def _loads_lenient(text: str) -> Any:
+    cleaned = _remove_trailing_commas(text).replace("“", '"').replace("”", '"')
+    return json.loads(cleaned)
+
+
+class IncrementalJsonArrayParser:
+    """
+    增量扫描 JSON 文本：跟踪字符串/转义状态与括号深度，
+    在顶层对象（深度 1）遇到 "<key>": [ 时进入目标数组，数组内每个对象元素闭合后立即解析。
+    也兼容模型直接输出顶层数组的情况。
+    """
+
+    def __init__(self, array_keys: Iterable[str] = ("items",)):
+        self.array_keys = tuple(array_keys)
+        self.text = ""
+        self.items: List[Dict[str, Any]] = []
+        self.array_key: Optional[str] = None
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._elem_start = -1
+        self._array_done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """喂入新文本，返回本次新闭合的数组元素"""
+        self.text += chunk or ""
+        out: List[Dict[str, Any]] = []
+        text = self.text
+        i = self._pos
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                i += 1
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                # 仅顶层对象中的键参与目标数组匹配
+                self._last_key = self._last_string if self._depth == 1 else None
+            elif ch in "{[":
+                self._depth += 1
+                if (
+                    ch == "["
+                    and self._array_depth is None
+                    and not self._array_done
+                    # 深度 2：顶层对象中的目标键；深度 1：顶层直接是数组
+                    and ((self._depth == 2 and self._last_key in self.array_keys) or self._depth == 1)
+                ):
+                    self._array_depth = self._depth
+                    self.array_key = self._last_key if self._depth == 2 else (self.array_keys[0] if self.array_keys else "items")
+                elif self._array_depth is not None and self._depth == self._array_depth + 1 and ch == "{":
+                    self._elem_start = i
+            elif ch in "}]":
+                if (
+                    self._array_depth is not None
+                    and ch == "}"
+                    and self._depth == self._array_depth + 1
+                    and self._elem_start >= 0
+                ):
+                    try:
+                        elem = _loads_lenient(text[self._elem_start:i + 1])
+                        if isinstance(elem, dict):
+                            self.items.append(elem)
+                            out.append(elem)
+                    except Exception:
+                        pass
+                    self._elem_start = -1
+                elif self._array_depth is not None and ch == "]" and self._depth == self._array_depth:
+                    self._array_depth = None
+                    self._array_done = True
+                self._depth = max(0, self._depth - 1)
+            i += 1
+        self._pos = i
+        return out
+
+    def result(self) -> Tuple[Dict[str, Any], bool]:
+        """
+        返回 (解析结果, 是否完整)。完整文本可解析时按常规清洗解析；
+        否则（流被截断/格式损坏）用已闭合的元素恢复出部分数组。
+        """
+        key = self.array_key or (self.array_keys[0] if self.array_keys else "items")
+        try:
+            data, _ = sanitize_json_text_to_dict(self.text)
+            return data, True
+        except Exception:
+            pass
+        try:
+            # 顶层数组等常规清洗无法处理的完整输出
+            data = _loads_lenient(_strip_code_fences(self.text))
+            if isinstance(data, list):
+                data = {key: data}
+            if isinstance(data, dict):
+                return data, True
+        except Exception:
+            pass
+        return {key: list(self.items)}, False
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体探测缓存模块
+
+对每个文件仅执行一次 ffprobe（同时读取 format/streams 与开头少量数据包），
+解析为 MediaInfo 记录，并按 (路径, 大小, 修改时间) 缓存在内存与磁盘（uploads/probe_cache）。
+VideoProcessor 与各 TTS 后端的时长/流信息查询均从此处读取，避免同一文件被反复 ffprobe。
+内存缓存按条目数 LRU 淘汰；磁盘缓存按最近访问时间（文件 mtime）与总大小/条目数上限淘汰，
+临时目录下的中间产物只做内存缓存。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本：字段变化时递增，使旧的磁盘缓存自动失效
+PROBE_CACHE_VERSION = 2
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _to_float(v: Any) -> Optional[float]:
+    try:
+        if v is None:
+            return None
+        return float(v)
+    except Exception:
+        return None
+
+
+def _to_int(v: Any) -> Optional[int]:
+    try:
+        if v is None:
+            return None
+        return int(v)
+    except Exception:
+        return None
+
+
+class MediaInfo(BaseModel):
+    """单个媒体文件的探测结果"""
+    path: str
+    size: int
+    mtime_ns: int
+    format_name: Optional[str] = None
+    format_duration: Optional[float] = None
+    # 首个视频流
+    video_codec: Optional[str] = None
+    # 编码档次与级别（ffprobe 的 profile 名称与 level 整数，如 "High" / 40）
+    video_profile: Optional[str] = None
+    video_level: Optional[int] = None
+    pix_fmt: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    r_frame_rate: Optional[str] = None
+    video_duration: Optional[float] = None
+    # 首个音频流
+    audio_codec: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    audio_duration: Optional[float] = None
+    # 首个视频关键帧是否位于 0 时刻
+    first_frame_is_keyframe: bool = False
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_codec is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    def duration(self, stream_type: str = "format") -> Optional[float]:
+        """
+        与旧版 _ffprobe_duration 语义一致：
+        - audio: 优先音频流时长，缺失时回退容器时长
+        - video: 仅视频流时长
+        - 其他: 容器时长
+        """
+        if stream_type == "audio":
+            return self.audio_duration if self.audio_duration is not None else self.format_duration
+        if stream_type == "video":
+            return self.video_duration
+        return self.format_duration
+
+    def video_stream_info(self) -> Optional[Dict[str, Any]]:
+        if not self.has_video:
+            return None
+        return {
+            "codec_name": self.video_codec,
+            "pix_fmt": self.pix_fmt,
+            "width": self.width,
+            "height": self.height,
+            "r_frame_rate": self.r_frame_rate,
+        }
+
+    def audio_stream_info(self) -> Optional[Dict[str, Any]]:
+        if not self.has_audio:
+            return None
+        return {
+            "codec_name": self.audio_codec,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+        }
+
+
+class MediaProbe:
+    """ffprobe 结果缓存（内存 + 磁盘），支持并发批量探测"""
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_concurrency: int = 8,
+                 max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        if cache_dir is None:
+            # backend/modules/ -> 项目根目录为上上级
+            project_root = Path(__file__).resolve().parents[2]
+            cache_dir = project_root / "uploads" / "probe_cache"
+        self.cache_dir = cache_dir
+        self.max_concurrency = max(1, int(max_concurrency))
+        if max_bytes is None:
+            max_bytes = int(_env_float("PROBE_CACHE_MAX_MB", 64) * 1024 * 1024)
+        if max_entries is None:
+            max_entries = _env_int("PROBE_CACHE_MAX_ENTRIES", 20000)
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        # 磁盘淘汰为目录扫描，按间隔执行
+        self.evict_interval = max(0.0, _env_float("PROBE_CACHE_EVICT_INTERVAL_S", 300.0))
+        self._last_evict = 0.0
+        self.memory_entries = max(1, _env_int("PROBE_MEMORY_ENTRIES", 2048))
+        # 关键帧索引为整片列表，内存中只保留较少条目
+        self.keyframe_memory_entries = max(1, _env_int("PROBE_KEYFRAME_MEMORY_ENTRIES", 64))
+        self._memory: "OrderedDict[Tuple[str, int, int], MediaInfo]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int, int], asyncio.Future] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._keyframes: "OrderedDict[Tuple[str, int, int], List[float]]" = OrderedDict()
+        # 键 -> [锁, 持有/等待者数]；计数归零即移除
+        self._keyframe_locks: Dict[Tuple[str, int, int], List[Any]] = {}
+
+    @staticmethod
+    def _file_key(path: str) -> Optional[Tuple[str, int, int]]:
+        try:
+            p = Path(path).resolve()
+            st = p.stat()
+            return str(p), int(st.st_size), int(st.st_mtime_ns)
+        except Exception:
+            return None
+
+    def fingerprint(self, path: str) -> Optional[str]:
+        """文件指纹（路径+大小+修改时间），文件不存在时返回 None"""
+        key = self._file_key(path)
+        if key is None:
+            return None
+        return f"{key[0]}|{key[1]}|{key[2]}"
+
+    @staticmethod
+    def _lru_get(cache: "OrderedDict", key: Tuple[str, int, int]) -> Any:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _lru_put(cache: "OrderedDict", key: Tuple[str, int, int], value: Any, limit: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _persistent(self, key: Tuple[str, int, int]) -> bool:
+        """临时目录（uploads 下的 tmp 目录、系统临时目录）中的渲染中间产物生命周期短，不写磁盘缓存"""
+        p = Path(key[0])
+        try:
+            return "tmp" not in p.relative_to(self.cache_dir.parent.resolve()).parts[:-1]
+        except ValueError:
+            pass
+        try:
+            p.relative_to(Path(tempfile.gettempdir()).resolve())
+            return False
+        except ValueError:
+            return True
+
+    @asynccontextmanager
+    async def _keyframe_lock(self, key: Tuple[str, int, int]) -> AsyncIterator[None]:
+        slot = self._keyframe_locks.get(key)
+        if slot is None:
+            slot = self._keyframe_locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0 and self._keyframe_locks.get(key) is slot:
+                del self._keyframe_locks[key]
+
+    def _disk_path(self, key: Tuple[str, int, int]) -> Path:
+        raw = f"{PROBE_CACHE_VERSION}|{key[0]}|{key[1]}|{key[2]}"
+        return self.cache_dir / f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()}.json"
+
+    def _read_disk(self, key: Tuple[str, int, int]) -> Optional[MediaInfo]:
+        fp = self._disk_path(key)
+        if not fp.exists():
+            return None
+        try:
+            info = MediaInfo(**json.loads(fp.read_text(encoding="utf-8")))
+            if (info.path, info.size, info.mtime_ns) == key:
+                self._touch(fp)
+                return info
+        except Exception as e:
+            logger.warning(f"读取探测缓存失败，将重新探测: {e}")
+        return None
+
+    def _write_disk(self, key: Tuple[str, int, int], info: MediaInfo) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fp = self._disk_path(key)
+            tmp = fp.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(info.model_dump(), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, fp)
+        except Exception as e:
+            logger.warning(f"写入探测缓存失败: {e}")
+
+    @staticmethod
+    def _touch(fp: Path) -> None:
+        # 以 mtime 记录最近访问时间，供 LRU 淘汰
+        try:
+            os.utime(fp, None)
+        except Exception:
+            pass
+
+    def _evict_due(self) -> bool:
+        now = time.monotonic()
+        if self._last_evict and now - self._last_evict < self.evict_interval:
+            return False
+        self._last_evict = now
+        return True
+
+    def evict(self) -> int:
+        """按最近访问时间淘汰磁盘缓存至总大小与条目数上限以内，返回删除的文件数"""
+        try:
+            files = []
+            for fp in self.cache_dir.glob("*.json"):
+                try:
+                    st = fp.stat()
+                    files.append((st.st_mtime, st.st_size, fp))
+                except OSError:
+                    continue
+        except Exception:
+            return 0
+        total = sum(f[1] for f in files)
+        count = len(files)
+        removed = 0
+        for _mtime, size, fp in sorted(files, key=lambda f: f[0]):
+            if total <= self.max_bytes and count <= self.max_entries:
+                break
+            try:
+                fp.unlink()
+            except OSError:
+                continue
+            total -= size
+            count -= 1
+            removed += 1
+        if removed:
+            logger.info(f"探测缓存淘汰 {removed} 个文件")
+        return removed
+
+    async def _after_disk_write(self) -> None:
+        if self._evict_due():
+            await asyncio.to_thread(self.evict)
+
+    @staticmethod
+    def _parse(key: Tuple[str, int, int], data: Dict[str, Any]) -> MediaInfo:
+        fmt = data.get("format") or {}
+        info = MediaInfo(
+            path=key[0],
+            size=key[1],
+            mtime_ns=key[2],
+            format_name=(fmt.get("format_name") or None),
+            format_duration=_to_float(fmt.get("duration")),
+        )
+        video_index: Optional[int] = None
+        for s in data.get("streams") or []:
+            ctype = s.get("codec_type")
+            if ctype == "video" and info.video_codec is None:
+                video_index = _to_int(s.get("index"))
+                info.video_codec = s.get("codec_name")
+                info.video_profile = s.get("profile") or None
+                info.video_level = _to_int(s.get("level"))
+                info.pix_fmt = s.get("pix_fmt")
+                info.width = _to_int(s.get("width"))
+                info.height = _to_int(s.get("height"))
+                info.r_frame_rate = s.get("r_frame_rate")
+                info.video_duration = _to_float(s.get("duration"))
+            elif ctype == "audio" and info.audio_codec is None:
+                info.audio_codec = s.get("codec_name")
+                info.sample_rate = _to_int(s.get("sample_rate"))
+                info.channels = _to_int(s.get("channels"))
+                info.audio_duration = _to_float(s.get("duration"))
+        if video_index is not None:
+            for pkt in data.get("packets") or []:
+                if _to_int(pkt.get("stream_index")) != video_index:
+                    continue
+                if "K" not in str(pkt.get("flags") or ""):
+                    continue
+                t = _to_float(pkt.get("pts_time"))
+                info.first_frame_is_keyframe = t is not None and abs(t) < 0.001
+                break
+        return info
+
+    async def _run_ffprobe(self, key: Tuple[str, int, int]) -> Optional[MediaInfo]:
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-print_format", "json",
+            "-show_format", "-show_streams",
+            # 仅读取开头 0.2 秒的数据包，用于判断首个关键帧位置
+            "-show_entries", "packet=stream_index,pts_time,flags",
+            "-read_intervals", "%+0.2",
+            key[0],
+        ]
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        async with self._sem:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+                out, _ = await proc.communicate()
+            except Exception as e:
+                logger.error(f"ffprobe 执行失败: {e}")
+                return None
+        if proc.returncode != 0:
+            return None
+        try:
+            data = json.loads(out.decode(errors="ignore") or "{}")
+        except Exception:
+            return None
+        return self._parse(key, data)
+
+    async def probe(self, path: str) -> Optional[MediaInfo]:
+        """探测单个文件；文件不存在或 ffprobe 失败时返回 None（失败结果不缓存）"""
+        key = self._file_key(path)
+        if key is None:
+            return None
+        cached = self._lru_get(self._memory, key)
+        if cached is not None:
+            return cached
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return await asyncio.shield(fut)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._inflight[key] = fut
+        try:
+            persistent = self._persistent(key)
+            info = self._read_disk(key) if persistent else None
+            if info is None:
+                info = await self._run_ffprobe(key)
+                if info is not None and persistent:
+                    self._write_disk(key, info)
+                    await self._after_disk_write()
+            if info is not None:
+                self._lru_put(self._memory, key, info, self.memory_entries)
+            fut.set_result(info)
+            return info
+        except asyncio.CancelledError:
+            if not fut.done():
+                fut.cancel()
+            raise
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+                # 避免无人等待时出现 "exception was never retrieved"
+                fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def probe_many(self, paths: List[str]) -> List[Optional[MediaInfo]]:
+        """并发探测多个文件，结果与输入顺序一致"""
+        return list(await asyncio.gather(*(self.probe(p) for p in paths)))
+
+    async def keyframes(self, path: str) -> Optional[List[float]]:
+        """
+        视频关键帧时间索引（秒，升序）。仅解复用读取数据包标志，不解码画面；
+        结果与探测信息一样按 (路径, 大小, 修改时间) 缓存在内存与磁盘。
+        """
+        key = self._file_key(path)
+        if key is None:
+            return None
+        cached = self._lru_get(self._keyframes, key)
+        if cached is not None:
+            return cached
+        async with self._keyframe_lock(key):
+            cached = self._lru_get(self._keyframes, key)
+            if cached is not None:
+                return cached
+            persistent = self._persistent(key)
+            fp = self._disk_path(key).with_suffix(".kf.json")
+            kfs: Optional[List[float]] = None
+            try:
+                if persistent and fp.exists():
+                    data = json.loads(fp.read_text(encoding="utf-8"))
+                    if isinstance(data, list):
+                        kfs = [float(x) for x in data]
+                        self._touch(fp)
+            except Exception:
+                kfs = None
+            if kfs is None:
+                kfs = await self._scan_keyframes(key[0])
+                if kfs is None:
+                    return None
+                if persistent:
+                    try:
+                        self.cache_dir.mkdir(parents=True, exist_ok=True)
+                        tmp = fp.with_suffix(f".{os.getpid()}.tmp")
+                        tmp.write_text(json.dumps(kfs), encoding="utf-8")
+                        os.replace(tmp, fp)
+                    except Exception as e:
+                        logger.warning(f"写入关键帧索引失败: {e}")
+                    await self._after_disk_write()
+            self._lru_put(self._keyframes, key, kfs, self.keyframe_memory_entries)
+            return kfs
+
+    async def _scan_keyframes(self, path: str) -> Optional[List[float]]:
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            path,
+        ]
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        async with self._sem:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+                out, _ = await proc.communicate()
+            except Exception as e:
+                logger.error(f"关键帧扫描失败: {e}")
+                return None
+        if proc.returncode != 0:
+            return None
+        kfs: List[float] = []
+        for line in out.decode(errors="ignore").splitlines():
+            parts = line.strip().split(",")
+            if len(parts) < 2 or "K" not in parts[1]:
+                continue
+            t = _to_float(parts[0])
+            if t is not None:
+                kfs.append(t)
+        kfs.sort()
+        return kfs
+
+    def invalidate(self, path: str) -> None:
+        """丢弃指定路径的内存缓存（磁盘缓存以大小+修改时间为键，文件变化后自然失效）"""
+        try:
+            resolved = str(Path(path).resolve())
+        except Exception:
+            return
+        for key in [k for k in self._memory if k[0] == resolved]:
+            self._memory.pop(key, None)
+        for key in [k for k in self._keyframes if k[0] == resolved]:
+            self._keyframes.pop(key, None)
+
+
+# 全局实例
+media_probe = MediaProbe()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+剧情点结构化索引
+
+剧情点以 PlotPoint 记录保存，按开始时间构建静态区间树（隐式平衡二叉树 + 子树最大结束时间），
+按时间窗口查询重叠剧情点为 O(log n + k)；仅在拼装提示词时才渲染为文本，
+不再对整段剧情分析文本逐行解析筛选。时间无法解析的剧情点不进区间树，但仍保留在渲染文本中。
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+_TS_PAIR_RE = re.compile(r"^\s*(\d{1,2}):(\d{2}):(\d{2})(?:[,.](\d{1,3}))?\s*[-–]\s*(\d{1,2}):(\d{2}):(\d{2})(?:[,.](\d{1,3}))?\s*$")
+_HEAD_RE = re.compile(r"^爆点(\d+)：(.*)$")
+
+
+def _parse_ts_pair(ts: str) -> Optional[Tuple[float, float]]:
+    m = _TS_PAIR_RE.match(str(ts or ""))
+    if not m:
+        return None
+    g = m.groups()
+
+    def _sec(h: str, mi: str, s: str, ms: Optional[str]) -> float:
+        return int(h) * 3600 + int(mi) * 60 + int(s) + (int(ms.ljust(3, "0")) / 1000.0 if ms else 0.0)
+
+    return _sec(g[0], g[1], g[2], g[3]), _sec(g[4], g[5], g[6], g[7])
+
+
+class PlotPoint(BaseModel):
+    """单个剧情爆点"""
+    timestamp: str
+    # 时间无法解析时为 None（不参与窗口查询，渲染时保留）
+    start: Optional[float] = None
+    end: Optional[float] = None
+    title: str
+    summary: str = ""
+    keywords: List[str] = []
+    confidence: float = 0.5
+    chunk_id: Optional[int] = None
+    # 在完整剧情分析中的序号（渲染为 "爆点N"）
+    rank: int = 0
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], rank: int = 0) -> Optional["PlotPoint"]:
+        if not d.get("title"):
+            return None
+        pair = _parse_ts_pair(str(d.get("timestamp") or ""))
+        conf = d.get("confidence")
+        return cls(
+            timestamp=str(d.get("timestamp") or ""),
+            start=pair[0] if pair else None,
+            end=pair[1] if pair else None,
+            title=str(d.get("title")),
+            summary=str(d.get("summary") or ""),
+            keywords=[str(k) for k in (d.get("keywords") or []) if k],
+            confidence=float(conf) if isinstance(conf, (int, float)) else 0.5,
+            chunk_id=d.get("chunk_id"),
+            rank=rank,
+        )
+
+    def render(self) -> str:
+        return (
+            "爆点{}：{}\n".format(self.rank, self.title)
+            + "时间：{}\n".format(self.timestamp)
+            + "摘要：{}\n".format(self.summary)
+            + "关键词：{}\n".format(",".join(self.keywords))
+        )
+
+
+class PlotPointIndex:
+    """剧情点区间索引（构建后只读）"""
+
+    def __init__(self, points: Iterable[PlotPoint]):
+        # points：全部剧情点（按序号，渲染顺序）；_timed：可解析时间的剧情点（按开始时间，区间树）
+        self.points: List[PlotPoint] = sorted(points, key=lambda p: p.rank)
+        self._timed: List[PlotPoint] = sorted(
+            (p for p in self.points if p.start is not None), key=lambda p: (p.start, p.end)
+        )
+        self._untimed: List[PlotPoint] = [p for p in self.points if p.start is None]
+        n = len(self._timed)
+        # _max_end[i]：以 i 为根（区间 [lo, hi) 取中点为根）的子树内最大结束时间
+        self._max_end: List[float] = [0.0] * n
+        if n:
+            self._build(0, n)
+
+    def _build(self, lo: int, hi: int) -> float:
+        mid = (lo + hi) // 2
+        m = self._timed[mid].end
+        if lo < mid:
+            m = max(m, self._build(lo, mid))
+        if mid + 1 < hi:
+            m = max(m, self._build(mid + 1, hi))
+        self._max_end[mid] = m
+        return m
+
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict[str, Any]]) -> "PlotPointIndex":
+        """由按时间排好序的剧情点字典构建（序号按输入顺序从 1 开始）"""
+        points: List[PlotPoint] = []
+        for d in items:
+            pt = PlotPoint.from_dict(d, rank=len(points) + 1)
+            if pt is not None:
+                points.append(pt)
+        return cls(points)
+
+    @classmethod
+    def from_text(cls, text: str) -> "PlotPointIndex":
+        """解析 render 生成的剧情分析文本（复用历史分析文件时只解析一次）"""
+        points: List[PlotPoint] = []
+        cur: Optional[Dict[str, Any]] = None
+        field = None
+
+        def _flush() -> None:
+            if cur is None:
+                return
+            pt = PlotPoint.from_dict(cur, rank=int(cur.get("rank") or len(points) + 1))
+            if pt is not None:
+                points.append(pt)
+
+        for line in (text or "").split("\n"):
+            head = _HEAD_RE.match(line)
+            if head:
+                _flush()
+                cur = {"rank": int(head.group(1)), "title": head.group(2).strip(), "summary": ""}
+                field = None
+            elif cur is None:
+                continue
+            elif line.startswith("时间："):
+                cur["timestamp"] = line[len("时间："):].strip()
+                field = None
+            elif line.startswith("摘要："):
+                cur["summary"] = line[len("摘要："):]
+                field = "summary"
+            elif line.startswith("关键词："):
+                cur["keywords"] = [k for k in line[len("关键词："):].split(",") if k]
+                field = None
+            elif field == "summary" and line.strip():
+                cur["summary"] += "\n" + line
+        _flush()
+        return cls(points)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def query(self, start_s: float, end_s: float) -> List[PlotPoint]:
+        """与 [start_s, end_s] 重叠的剧情点（按开始时间排序；不含时间无法解析的剧情点）"""
+        out: List[PlotPoint] = []
+        if self._timed:
+            self._query(0, len(self._timed), start_s, end_s, out)
+        return out
+
+    def _query(self, lo: int, hi: int, a: float, b: float, out: List[PlotPoint]) -> None:
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        # 子树内所有区间都在窗口开始之前结束：整棵子树剪枝
+        if self._max_end[mid] < a:
+            return
+        self._query(lo, mid, a, b, out)
+        pt = self._timed[mid]
+        if pt.start > b:
+            # 右子树开始时间更晚，同样不可能重叠
+            return
+        if pt.end >= a:
+            out.append(pt)
+        self._query(mid + 1, hi, a, b, out)
+
+    def render(self, points: Optional[List[PlotPoint]] = None) -> str:
+        pts = self.points if points is None else points
+        return "\n".join(p.render() for p in pts).strip()
+
+    def render_window(self, start_s: float, end_s: float, fallback: Optional[str] = None) -> str:
+        """渲染窗口内的剧情点（时间无法解析的剧情点无法判断是否相关，一并保留）；无匹配时为保留上下文返回全文前 500 字"""
+        pts = self.query(start_s, end_s)
+        if pts:
+            return self.render(sorted(pts + self._untimed, key=lambda p: p.rank))
+        full = fallback if fallback is not None else self.render()
+        if not full:
+            return ""
+        return full[:500] + "..."
@@ -36,6 +36,10 @@ class Project(BaseModel):
     subtitle_path: Optional[str] = None
     audio_path: Optional[str] = None
     plot_analysis_path: Optional[str] = None
+    # 语音识别后端（services.asr_registry 中的名称），为空时使用 ASR_BACKEND / 默认后端
+    asr_backend: Optional[str] = None
+    # 最近一次脚本生成的大模型调用追踪文件
+    llm_trace_path: Optional[str] = None
     output_video_path: Optional[str] = None
     script: Optional[Dict[str, Any]] = None
     prompt_selection: Dict[str, Any] = Field(default_factory=dict)
@@ -148,6 +152,8 @@ class ProjectsStore:
                 "subtitle_path",
                 "audio_path",
                 "plot_analysis_path",
+                "asr_backend",
+                "llm_trace_path",
                 "output_video_path",
                 "script",
             ]:
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+片段清单（增量重渲染）
+
+每个项目在 uploads/videos/tmp/{project_id}/segments 下维护 manifest.json，
+以 (原视频指纹, 起止时间, 解说文本, TTS 配置) 为键记录已渲染的片段文件及其响度测量值。
+重新生成视频时键未变化的片段直接复用，只渲染改动的片段。
+同一项目的并发渲染共享同一个清单实例（同键片段只渲染一次），清单每次渲染结束时落盘一次。
+同时提供临时目录回收策略，清理过期的按时间戳命名的旧临时目录与长期未使用的片段缓存。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 渲染参数版本：片段渲染方式（编码参数、滤镜等）变化时递增，使旧片段自动失效
+SEGMENT_RENDER_VERSION = 2
+
+# 旧版按时间戳命名的临时目录：{project_id}_{YYYYmmdd_HHMMSS}
+_LEGACY_TMP_RE = re.compile(r"^.+_\d{8}_\d{6}$")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _project_root() -> Path:
+    # backend/modules/ -> 项目根目录为上上级
+    return Path(__file__).resolve().parents[2]
+
+
+class SegmentManifest:
+    """单个项目的片段清单"""
+
+    # 片段目录 -> 正在使用的清单实例（无人持有时自动释放）
+    _instances: "weakref.WeakValueDictionary[str, SegmentManifest]" = weakref.WeakValueDictionary()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, segments_dir: Path):
+        self.segments_dir = segments_dir
+        self.manifest_path = segments_dir / "manifest.json"
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        # 键 -> [锁, 持有/等待者数]；计数归零即移除
+        self._key_locks: Dict[str, List[Any]] = {}
+        self._load()
+
+    @classmethod
+    def shared(cls, segments_dir: Path) -> "SegmentManifest":
+        """同一片段目录返回同一实例，避免并发渲染各自读写清单互相覆盖"""
+        with cls._instances_lock:
+            inst = cls._instances.get(str(segments_dir))
+            if inst is None:
+                inst = cls(segments_dir)
+                cls._instances[str(segments_dir)] = inst
+            return inst
+
+    @classmethod
+    def for_project(cls, project_id: str) -> "SegmentManifest":
+        d = _project_root() / "uploads" / "videos" / "tmp" / project_id / "segments"
+        d.mkdir(parents=True, exist_ok=True)
+        return cls.shared(d)
+
+    @staticmethod
+    def make_key(source_fingerprint: str, start: float, end: float, text: str,
+                 tts_params: Optional[Dict[str, Any]]) -> str:
+        payload = json.dumps({
+            "v": SEGMENT_RENDER_VERSION,
+            "source": source_fingerprint,
+            "start": round(float(start), 3),
+            "end": round(float(end), 3),
+            "text": text or "",
+            "tts": tts_params,
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        try:
+            if self.manifest_path.exists():
+                data = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+                if isinstance(data, dict) and isinstance(data.get("entries"), dict):
+                    self._entries = data["entries"]
+        except Exception as e:
+            logger.warning(f"读取片段清单失败，将重建: {e}")
+            self._entries = {}
+
+    def _save_locked(self) -> None:
+        try:
+            self.segments_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"version": SEGMENT_RENDER_VERSION, "entries": self._entries},
+                                      ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.manifest_path)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"写入片段清单失败: {e}")
+
+    def flush(self) -> None:
+        """将本次渲染的登记/使用时间变更写入清单"""
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    @asynccontextmanager
+    async def key_lock(self, key: str) -> AsyncIterator[None]:
+        """同键片段串行化（跨同一项目的并发渲染），后到者直接复用先渲染完成的片段"""
+        slot = self._key_locks.get(key)
+        if slot is None:
+            slot = self._key_locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0 and self._key_locks.get(key) is slot:
+                del self._key_locks[key]
+
+    def clip_path(self, key: str) -> Path:
+        return self.segments_dir / f"seg_{key[:24]}.mp4"
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """命中且文件完好时返回条目（含 path），并刷新使用时间"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            fp = self.segments_dir / str(entry.get("file") or "")
+            try:
+                ok = fp.is_file() and fp.stat().st_size == int(entry.get("size") or -1)
+            except Exception:
+                ok = False
+            if not ok:
+                self._entries.pop(key, None)
+                self._dirty = True
+                return None
+            entry["last_used"] = time.time()
+            self._dirty = True
+            return {**entry, "path": str(fp)}
+
+    def commit(self, key: str, rendered_path: Path, loudness: Optional[Dict[str, float]] = None,
+               meta: Optional[Dict[str, Any]] = None) -> Path:
+        """将渲染完成的片段移动到键对应的位置并登记"""
+        dst = self.clip_path(key)
+        os.replace(rendered_path, dst)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "file": dst.name,
+                "size": dst.stat().st_size,
+                "loudness": loudness,
+                "created": now,
+                "last_used": now,
+                **(meta or {}),
+            }
+            self._dirty = True
+        return dst
+
+    def update_loudness(self, key: str, loudness: Optional[Dict[str, float]]) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and loudness:
+                entry["loudness"] = loudness
+                self._dirty = True
+
+    def prune(self, max_age_seconds: float) -> int:
+        """删除超过 max_age_seconds 未被使用的片段及其登记，返回删除数量"""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if float(v.get("last_used") or 0.0) < cutoff]:
+                entry = self._entries.pop(key)
+                try:
+                    (self.segments_dir / str(entry.get("file") or "")).unlink(missing_ok=True)
+                except Exception:
+                    pass
+                removed += 1
+            known = {str(v.get("file")) for v in self._entries.values()}
+            # 未登记的残留文件（中断的渲染等）
+            for fp in self.segments_dir.glob("*.mp4"):
+                if fp.name not in known:
+                    try:
+                        if fp.stat().st_mtime < cutoff or fp.name.endswith(".part.mp4"):
+                            fp.unlink()
+                    except Exception:
+                        pass
+            if removed or self._dirty:
+                self._save_locked()
+        return removed
+
+
+def gc_stale_tmp_dirs(project_exists: Optional[Callable[[str], bool]] = None,
+                      active_project_ids: Optional[set] = None) -> Dict[str, int]:
+    """
+    回收临时目录：
+    - uploads/videos/tmp 与 uploads/audios/tmp 下旧版 {project_id}_{时间戳} 目录，超过 VIDEO_TMP_TTL_HOURS（默认 24）小时删除
+    - 已删除项目的片段缓存目录直接删除
+    - 其余项目的片段缓存中超过 VIDEO_SEGMENT_CACHE_TTL_DAYS（默认 7）天未使用的片段删除
+    active_project_ids 中的项目正在渲染，跳过。
+    """
+    stats = {"legacy_dirs": 0, "orphan_projects": 0, "segments": 0}
+    tmp_ttl = _env_float("VIDEO_TMP_TTL_HOURS", 24.0) * 3600.0
+    seg_ttl = _env_float("VIDEO_SEGMENT_CACHE_TTL_DAYS", 7.0) * 86400.0
+    now = time.time()
+    active = active_project_ids or set()
+    uploads = _project_root() / "uploads"
+    for base in (uploads / "videos" / "tmp", uploads / "audios" / "tmp"):
+        if not base.is_dir():
+            continue
+        for d in base.iterdir():
+            try:
+                if not d.is_dir():
+                    continue
+                if _LEGACY_TMP_RE.match(d.name):
+                    if now - d.stat().st_mtime > tmp_ttl and d.name.rsplit("_", 2)[0] not in active:
+                        shutil.rmtree(d, ignore_errors=True)
+                        stats["legacy_dirs"] += 1
+                    continue
+                seg_dir = d / "segments"
+                if not seg_dir.is_dir() or d.name in active:
+                    continue
+                if project_exists is not None and not project_exists(d.name):
+                    shutil.rmtree(d, ignore_errors=True)
+                    stats["orphan_projects"] += 1
+                    continue
+                stats["segments"] += SegmentManifest.shared(seg_dir).prune(seg_ttl)
+            except Exception as e:
+                logger.warning(f"回收临时目录失败 {d}: {e}")
+    if any(stats.values()):
+        logger.info(f"临时目录回收: {stats}")
+    return stats
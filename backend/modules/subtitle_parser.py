@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字幕流式解析
+
+单遍逐行扫描，同一份输入中可混合以下格式（按行首特征分派，不整体预判格式）：
+- SRT：序号 / "HH:MM:SS,mmm --> HH:MM:SS,mmm" / 文本
+- VTT：WEBVTT 头、可省略小时的 "MM:SS.mmm"、cue 标识与设置、NOTE/STYLE/REGION 块
+- ASS/SSA：Dialogue 行（去除 {\\...} 样式标签，\\N 换行）
+- 压缩行格式："[HH:MM:SS,mmm-HH:MM:SS,mmm] 文本"（compress_cues 的输出）
+输入可为字符串或按行迭代的文件对象；产出 Cue（__slots__，时间为毫秒整数）。
+"""
+
+import re
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 时间戳：小时可省略（VTT），毫秒位 1-3 位（ASS 为百分秒）
+_TS = r"(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+_TIMING_RE = re.compile(_TS + r"\s*-->\s*" + _TS)
+_BRACKET_RE = re.compile(r"\[(\d+):(\d{2}):(\d{2})[,.](\d{1,3})-(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\]\s*(.*)")
+_ASS_TS_RE = re.compile(r"(\d+):(\d{1,2}):(\d{1,2})[.,](\d{1,3})")
+_ASS_TAG_RE = re.compile(r"\{[^}]*\}")
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+_VTT_BLOCKS = ("NOTE", "STYLE", "REGION")
+
+
+class Cue:
+    """单条字幕（毫秒时间轴）"""
+
+    __slots__ = ("index", "start_ms", "end_ms", "text")
+
+    def __init__(self, index: int, start_ms: int, end_ms: int, text: str):
+        self.index = index
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+
+    @property
+    def start(self) -> float:
+        return self.start_ms / 1000.0
+
+    @property
+    def end(self) -> float:
+        return self.end_ms / 1000.0
+
+    def __repr__(self) -> str:
+        return f"Cue({self.index}, {self.start_ms}, {self.end_ms}, {self.text!r})"
+
+
+def _ms(h: Optional[str], m: str, s: str, frac: str) -> int:
+    # 毫秒位按小数处理："5" -> 500，"50" -> 500（ASS 百分秒），"050" -> 50
+    return ((int(h) if h else 0) * 3600 + int(m) * 60 + int(s)) * 1000 + int(frac if len(frac) == 3 else (frac + "00")[:3])
+
+
+def _srt_timing(line: str) -> Optional[Tuple[int, int]]:
+    """标准 "HH:MM:SS,mmm --> HH:MM:SS,mmm" 按固定位置切片解析（绝大多数时间行），不符合时返回 None"""
+    if len(line) < 29 or line[13:16] != "-->" or line[2] != ":" or line[19] != ":":
+        return None
+    try:
+        return (
+            int(line[0:2]) * 3600000 + int(line[3:5]) * 60000 + int(line[6:8]) * 1000 + int(line[9:12]),
+            int(line[17:19]) * 3600000 + int(line[20:22]) * 60000 + int(line[23:25]) * 1000 + int(line[26:29]),
+        )
+    except ValueError:
+        return None
+
+
+def _bracket_cue(line: str) -> Optional[Tuple[int, int, str]]:
+    """压缩行 "[HH:MM:SS,mmm-HH:MM:SS,mmm] 文本" 按固定位置切片解析，不符合时回退正则"""
+    if len(line) >= 27 and line[13] == "-" and line[26] == "]" and line[3] == ":" and line[17] == ":":
+        try:
+            return (
+                int(line[1:3]) * 3600000 + int(line[4:6]) * 60000 + int(line[7:9]) * 1000 + int(line[10:13]),
+                int(line[14:16]) * 3600000 + int(line[17:19]) * 60000 + int(line[20:22]) * 1000 + int(line[23:26]),
+                line[27:].strip(),
+            )
+        except ValueError:
+            pass
+    m = _BRACKET_RE.match(line)
+    if not m:
+        return None
+    g = m.groups()
+    return _ms(g[0], g[1], g[2], g[3]), _ms(g[4], g[5], g[6], g[7]), g[8].strip()
+
+
+def format_ts(ms: int) -> str:
+    """毫秒 -> HH:MM:SS,mmm"""
+    if ms < 0:
+        ms = 0
+    return "%02d:%02d:%02d,%03d" % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+
+def iter_cues(source: Union[str, Iterable[str]], joiner: str = "\n", strip_tags: bool = False) -> Iterator[Cue]:
+    """
+    单遍解析字幕，逐条产出 Cue。
+    joiner 为多行文本的连接符；strip_tags 时去除 <i>/<font> 等 HTML 标签。
+    没有序号的条目（压缩行、VTT、ASS）按出现顺序编号。
+    """
+    lines = iter(source.splitlines() if isinstance(source, str) else source)
+    head = next(lines, None)
+    if head is None:
+        return
+    lines = chain((head.lstrip("\ufeff"),), lines)
+    count = 0
+    start_ms = end_ms = -1
+    cue_id: Optional[int] = None
+    text: List[str] = []
+    pending: Optional[str] = None  # 时间行之前的一行（SRT 序号 / VTT cue 标识）
+    skip_block = False
+
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            # 空行结束当前条目（SRT/VTT 块分隔）
+            if start_ms >= 0:
+                count += 1
+                yield Cue(cue_id if cue_id is not None else count, start_ms, end_ms, joiner.join(text))
+                start_ms = -1
+                text = []
+            pending = None
+            skip_block = False
+            continue
+        if skip_block:
+            continue
+
+        c = line[0]
+        if c == "[":
+            bc = _bracket_cue(line)
+            if bc is not None:
+                if start_ms >= 0:
+                    count += 1
+                    yield Cue(cue_id if cue_id is not None else count, start_ms, end_ms, joiner.join(text))
+                    start_ms = -1
+                    text = []
+                count += 1
+                body = bc[2]
+                yield Cue(count, bc[0], bc[1], _HTML_TAG_RE.sub("", body) if strip_tags and "<" in body else body)
+                pending = None
+                continue
+        elif c == "D" and line.startswith("Dialogue:"):
+            parts = line[9:].split(",", 9)
+            if len(parts) == 10:
+                ms1 = _ASS_TS_RE.match(parts[1].strip())
+                ms2 = _ASS_TS_RE.match(parts[2].strip())
+                if ms1 and ms2:
+                    if start_ms >= 0:
+                        count += 1
+                        yield Cue(cue_id if cue_id is not None else count, start_ms, end_ms, joiner.join(text))
+                        start_ms = -1
+                        text = []
+                    body = _ASS_TAG_RE.sub("", parts[9])
+                    body = body.replace("\\N", joiner).replace("\\n", joiner).replace("\\h", " ").strip()
+                    count += 1
+                    yield Cue(count, _ms(*ms1.groups()), _ms(*ms2.groups()), body)
+                    continue
+
+        if "-->" in line:
+            timing = _srt_timing(line)
+            if timing is None:
+                m = _TIMING_RE.search(line)
+                if m:
+                    g = m.groups()
+                    timing = (_ms(g[0], g[1], g[2], g[3]), _ms(g[4], g[5], g[6], g[7]))
+            if timing is not None:
+                if start_ms >= 0:
+                    # 缺少空行分隔：上一条以本行前的序号为界结束
+                    if pending is not None and pending.isdigit() and text and text[-1] == pending:
+                        text.pop()
+                    count += 1
+                    yield Cue(cue_id if cue_id is not None else count, start_ms, end_ms, joiner.join(text))
+                    text = []
+                start_ms, end_ms = timing
+                cue_id = int(pending) if pending is not None and pending.isdigit() else None
+                pending = None
+                continue
+
+        if start_ms >= 0:
+            text.append(_HTML_TAG_RE.sub("", line) if strip_tags and "<" in line else line)
+            pending = line
+        elif line.split(None, 1)[0] in _VTT_BLOCKS:
+            skip_block = True
+        else:
+            pending = line
+
+    if start_ms >= 0:
+        count += 1
+        yield Cue(cue_id if cue_id is not None else count, start_ms, end_ms, joiner.join(text))
+
+
+def read_cues(path: Union[str, Path], joiner: str = "\n", strip_tags: bool = False) -> List[Cue]:
+    """按行流式读取字幕文件"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return list(iter_cues(f, joiner=joiner, strip_tags=strip_tags))
+
+
+def compress_cues(cues: Iterable[Cue], strip_tags: bool = False) -> str:
+    """压缩为每条一行的 "[开始-结束] 文本"（空文本条目丢弃）"""
+    out: List[str] = []
+    for cue in cues:
+        t = cue.text
+        if "  " in t or "\t" in t or "\n" in t:
+            t = _WS_RE.sub(" ", t)
+        if strip_tags and "<" in t:
+            t = _HTML_TAG_RE.sub("", t)
+        t = t.strip()
+        if t:
+            out.append(f"[{format_ts(cue.start_ms)}-{format_ts(cue.end_ms)}] {t}")
+    return "\n".join(out) + ("\n" if out else "")
+
+
+def _compress_srt(content: str) -> Optional[str]:
+    """
+    标准 SRT（序号 / 逗号分隔毫秒的时间行 / 文本 / 空行）直接按行压缩：时间戳沿用原文本，
+    不经 Cue 与时间格式化往返，标签与空白按条目合并后的文本一次清洗。
+    遇到其他格式特征（VTT 头与 cue 标识、ASS、压缩行、非标准时间行、缺少空行分隔）返回 None，由通用解析处理。
+    """
+    out: List[str] = []
+    prefix: Optional[str] = None
+    text: List[str] = []
+    # 末尾追加一个空行，使最后一条与其余条目同样在空行处输出
+    for raw in chain(content.lstrip("\ufeff").splitlines(), ("",)):
+        line = raw.strip()
+        if not line:
+            if prefix is not None:
+                t = " ".join(text)
+                if "<" in t:
+                    t = _HTML_TAG_RE.sub("", t)
+                if "  " in t or "\t" in t:
+                    t = _WS_RE.sub(" ", t)
+                t = t.strip()
+                if t:
+                    out.append(prefix + t)
+                prefix = None
+                text = []
+        elif prefix is not None:
+            if "-->" in line:
+                return None
+            text.append(line)
+        elif "-->" in line:
+            if line[8:9] != "," or line[25:26] != "," or _srt_timing(line) is None:
+                return None
+            prefix = f"[{line[0:12]}-{line[17:29]}] "
+        elif not line.isdigit():
+            return None
+    return "\n".join(out) + ("\n" if out else "")
+
+
+def compress_subtitles(content: str) -> str:
+    """任意支持格式的字幕文本 -> 压缩行格式（标准 SRT 走按行快速路径）"""
+    fast = _compress_srt(content)
+    if fast is not None:
+        return fast
+    return compress_cues(iter_cues(content, joiner=" "), strip_tags=True)
+
+
+def cues_to_segments(cues: Iterable[Cue]) -> List[Dict[str, Any]]:
+    """转换为脚本生成使用的片段字典（秒）；空文本以“字幕段N”占位"""
+    segments: List[Dict[str, Any]] = []
+    for idx, cue in enumerate(cues, start=1):
+        text = cue.text or f"字幕段{idx}"
+        segments.append({
+            "id": str(idx),
+            "start_time": cue.start_ms / 1000.0,
+            "end_time": cue.end_ms / 1000.0,
+            "text": text,
+            "subtitle": text,
+        })
+    return segments
+
+
+def load_segments(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """读取字幕文件为片段字典列表，读取失败返回空列表"""
+    try:
+        return cues_to_segments(read_cues(path, joiner=" "))
+    except Exception:
+        return []
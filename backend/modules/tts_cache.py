@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TTS 配音内容寻址缓存
+
+以 (提供商, 音色, 语速, 情感/扩展参数, 文本哈希) 为键缓存合成音频及其时长，
+腾讯云 / Edge / IndexTTS2 三种后端共享（统一在 tts_service.synthesize 入口处命中）。
+缓存位于 uploads/tts_cache，按最近访问时间（LRU）与总大小上限淘汰。
+命中只更新内存中的访问时间，索引按 TTS_CACHE_INDEX_FLUSH_S 间隔延迟落盘（写入/淘汰时及退出时一并落盘）。
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+class TtsCache:
+    """TTS 音频缓存（文件 + index.json 索引）"""
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None,
+                 max_entries: int = 20000):
+        if cache_dir is None:
+            # backend/modules/ -> 项目根目录为上上级
+            project_root = Path(__file__).resolve().parents[2]
+            cache_dir = project_root / "uploads" / "tts_cache"
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / "index.json"
+        if max_bytes is None:
+            max_bytes = int(_env_float("TTS_CACHE_MAX_MB", 2048) * 1024 * 1024)
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = (os.getenv("TTS_CACHE_ENABLED", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        # 键 -> [锁, 持有/等待者数]；计数归零即移除，避免按台词无限增长
+        self._key_locks: Dict[str, List[Any]] = {}
+        self.flush_interval = max(0.0, _env_float("TTS_CACHE_INDEX_FLUSH_S", 30.0))
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(provider: str, text: str, params: Dict[str, Any]) -> str:
+        """根据提供商、合成参数与文本生成内容寻址键"""
+        text_hash = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            {"provider": (provider or "").lower(), "params": params or {}, "text": text_hash},
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @asynccontextmanager
+    async def key_lock(self, key: str) -> AsyncIterator[None]:
+        """同键合成串行化，避免并发片段重复合成同一句台词"""
+        slot = self._key_locks.get(key)
+        if slot is None:
+            slot = self._key_locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0 and self._key_locks.get(key) is slot:
+                del self._key_locks[key]
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is not None:
+            return self._index
+        index: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.index_path.exists():
+                data = json.loads(self.index_path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    index = {k: v for k, v in data.items() if isinstance(v, dict)}
+        except Exception as e:
+            logger.warning(f"读取 TTS 缓存索引失败，将重建: {e}")
+        self._index = index
+        return index
+
+    def _save_index(self) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._index or {}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except Exception as e:
+            logger.warning(f"写入 TTS 缓存索引失败: {e}")
+
+    def flush(self) -> None:
+        """将延迟的访问时间更新写入索引"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """命中时返回条目（含缓存文件绝对路径 file_path），并刷新访问时间"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+            fp = self.cache_dir / str(entry.get("file") or "")
+            try:
+                ok = fp.is_file() and fp.stat().st_size == int(entry.get("size") or -1)
+            except Exception:
+                ok = False
+            if not ok:
+                index.pop(key, None)
+                self._save_index()
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            entry["hits"] = int(entry.get("hits") or 0) + 1
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.flush_interval:
+                self._save_index()
+            self.hits += 1
+            return {**entry, "file_path": str(fp)}
+
+    def put(self, key: str, src_path: str, duration: Optional[float], meta: Optional[Dict[str, Any]] = None) -> None:
+        """将合成结果复制入缓存并按容量淘汰"""
+        if not self.enabled:
+            return
+        try:
+            src = Path(src_path)
+            if not src.is_file():
+                return
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{key}{src.suffix.lower()}"
+            dst = self.cache_dir / name
+            tmp = dst.with_suffix(dst.suffix + ".tmp")
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+            now = time.time()
+            with self._lock:
+                index = self._load_index()
+                index[key] = {
+                    "file": name,
+                    "size": dst.stat().st_size,
+                    "duration": duration,
+                    "created": now,
+                    "last_access": now,
+                    "hits": 0,
+                    **(meta or {}),
+                }
+                self._evict_locked()
+                self._save_index()
+        except Exception as e:
+            logger.warning(f"写入 TTS 缓存失败: {e}")
+
+    def _evict_locked(self) -> None:
+        index = self._index or {}
+        total = sum(int(v.get("size") or 0) for v in index.values())
+        if total <= self.max_bytes and len(index) <= self.max_entries:
+            return
+        for key, entry in sorted(index.items(), key=lambda kv: float(kv[1].get("last_access") or 0.0)):
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            try:
+                (self.cache_dir / str(entry.get("file") or "")).unlink(missing_ok=True)
+            except Exception:
+                pass
+            total -= int(entry.get("size") or 0)
+            index.pop(key, None)
+
+    @staticmethod
+    def materialize(cached_file: str, out_path: Path) -> Path:
+        """
+        将缓存文件复制到目标位置；扩展名以缓存文件为准。
+        不使用硬链接：后续对输出文件的原地写入会污染缓存内容。
+        """
+        src = Path(cached_file)
+        dst = out_path if out_path.suffix.lower() == src.suffix.lower() else out_path.with_suffix(src.suffix)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(src, dst)
+        return dst
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._load_index()
+            return {
+                "enabled": self.enabled,
+                "entries": len(index),
+                "bytes": sum(int(v.get("size") or 0) for v in index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# 全局实例
+tts_cache = TtsCache()
+atexit.register(tts_cache.flush)
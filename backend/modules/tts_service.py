@@ -4,9 +4,10 @@ import asyncio
 import logging
 import os
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 from modules.config.tts_config import tts_engine_config_manager
+from modules.tts_cache import tts_cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,43 +17,69 @@ async def _ensure_dir(path: Path) -> None:
 
 
 async def _ffprobe_duration(path: str) -> Optional[float]:
+    # 统一走媒体探测缓存，与视频处理共享同一份 ffprobe 结果
     try:
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "a:0",
-            "-show_entries", "stream=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        out, _ = await proc.communicate()
-        if proc.returncode == 0:
-            try:
-                return float(out.decode().strip())
-            except Exception:
-                pass
-        cmd2 = [
-            "ffprobe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=nk=1:nw=1",
-            path,
-        ]
-        proc2 = await asyncio.create_subprocess_exec(*cmd2, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        out2, _ = await proc2.communicate()
-        if proc2.returncode == 0:
-            try:
-                return float(out2.decode().strip())
-            except Exception:
-                return None
-        return None
+        from modules.media_probe import media_probe
+        info = await media_probe.probe(path)
+        return info.duration("audio") if info is not None else None
     except Exception:
         return None
 
 
 class TencentTtsService:
-    async def synthesize(self, text: str, out_path: str, voice_id: Optional[str] = None) -> Dict[str, Any]:
+    def config_fingerprint(self, voice_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """当前激活 TTS 配置中影响合成结果的参数（不含凭据），用于缓存键"""
+        cfg = tts_engine_config_manager.get_active_config()
+        provider = (getattr(cfg, "provider", None) or "tencent_tts").lower()
+        params: Dict[str, Any] = {
+            "voice_id": voice_id or (cfg.active_voice_id if cfg else None),
+            "speed_ratio": getattr(cfg, "speed_ratio", None) if cfg else None,
+            # 情感参数（IndexTTS2）与 SampleRate/Codec/Volume 等（腾讯云）均在扩展参数中
+            "extra": (cfg.extra_params if cfg else {}) or {},
+            "region": (cfg.region if cfg else None) if provider == "tencent_tts" else None,
+        }
+        return provider, params
+
+    async def synthesize(self, text: str, out_path: str, voice_id: Optional[str] = None,
+                         use_cache: bool = True) -> Dict[str, Any]:
+        """
+        合成配音。相同 (提供商, 音色, 语速, 扩展参数, 文本) 的结果命中内容寻址缓存时直接复用，
+        仅对新增或改动的台词调用实际后端。
+        """
+        if not use_cache or not tts_cache.enabled:
+            return await self._synthesize_uncached(text, out_path, voice_id)
+
+        provider, params = self.config_fingerprint(voice_id)
+        params["format"] = Path(out_path).suffix.lower()
+        key = tts_cache.make_key(provider, text, params)
+        async with tts_cache.key_lock(key):
+            hit = tts_cache.get(key)
+            if hit is not None:
+                try:
+                    dst = tts_cache.materialize(hit["file_path"], Path(out_path))
+                    dur = hit.get("duration")
+                    if not isinstance(dur, (int, float)) or dur <= 0:
+                        dur = await _ffprobe_duration(str(dst))
+                    return {
+                        "success": True,
+                        "path": str(dst),
+                        "duration": dur,
+                        "codec": hit.get("codec") or dst.suffix.lstrip("."),
+                        "cached": True,
+                    }
+                except Exception as e:
+                    logger.warning(f"TTS 缓存命中但复制失败，改为重新合成: {e}")
+
+            res = await self._synthesize_uncached(text, out_path, voice_id)
+            if res.get("success"):
+                path = res.get("path") or out_path
+                dur = res.get("duration")
+                if not isinstance(dur, (int, float)) or dur <= 0:
+                    dur = await _ffprobe_duration(str(path))
+                tts_cache.put(key, str(path), dur, {"provider": provider, "codec": res.get("codec")})
+            return res
+
+    async def _synthesize_uncached(self, text: str, out_path: str, voice_id: Optional[str] = None) -> Dict[str, Any]:
         cfg = tts_engine_config_manager.get_active_config()
         provider = (getattr(cfg, "provider", None) or "tencent_tts").lower()
 
@@ -199,7 +226,9 @@ class TencentTtsService:
 
             req.from_json_string(json.dumps(params))
 
-            resp = client.TextToVoice(req)
+            # SDK 为同步 HTTP 调用，放入线程池执行，避免并发合成时阻塞事件循环
+            loop = asyncio.get_running_loop()
+            resp = await loop.run_in_executor(None, client.TextToVoice, req)
             audio_b64 = getattr(resp, "Audio", None)
             if not audio_b64:
                 return {"success": False, "error": "empty_audio", "request_id": getattr(resp, "RequestId", None)}
@@ -16,15 +16,53 @@ import json
 import cv2
 import numpy as np
 from .audio_normalizer import AudioNormalizer
+from .media_probe import media_probe
+from .encoder_registry import encoder_registry
 
 logger = logging.getLogger(__name__)
 
+# 识别用音频提取档位：(扩展名, 编码参数)。语音识别只需 16kHz 单声道，低码率即可保持识别率
+ASR_AUDIO_PROFILES: Dict[str, Tuple[str, List[str]]] = {
+    # 源音轨为 AAC 时直接流复制（不解码、不编码）；非 AAC 时回退为 speech_mp3
+    "aac_copy": (".m4a", ["-acodec", "copy"]),
+    "speech_mp3": (".mp3", ["-ac", "1", "-ar", "16000", "-acodec", "libmp3lame", "-b:a", "48k"]),
+    "speech_opus": (".ogg", ["-ac", "1", "-ar", "16000", "-acodec", "libopus", "-b:a", "24k", "-application", "voip"]),
+    # 原有高质量整轨编码
+    "mp3_hq": (".mp3", ["-acodec", "libmp3lame", "-q:a", "2"]),
+}
+
+# 成片音频统一采样率：片段渲染、拼接（流拷贝重编码音频/滤镜图）与响度标准化共用，避免拼接处重采样或采样率不一致
+AUDIO_SAMPLE_RATE = 44100
+
+# ffprobe 的 H.264 profile 名称 -> libx264 -profile:v 取值
+X264_PROFILES: Dict[str, str] = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+    "high 10": "high10",
+    "high 4:2:2": "high422",
+    "high 4:4:4 predictive": "high444",
+}
+
+
+def x264_profile_level_args(profile: Optional[str], level: Optional[int]) -> Optional[List[str]]:
+    """与源视频一致的 -profile:v / -level 参数；档次无法映射或级别未知时返回 None"""
+    x264_profile = X264_PROFILES.get((profile or "").strip().lower())
+    if not x264_profile or not level or level <= 0:
+        return None
+    return ["-profile:v", x264_profile, "-level", f"{level // 10}.{level % 10}"]
+
+
 class VideoProcessor:
     """视频处理器类"""
     
     def __init__(self):
         self.supported_formats = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv']
         self.audio_normalizer = AudioNormalizer()
+        # 识别音频预提取任务：(源视频绝对路径, 档位) -> Task[输出路径 | None]
+        # 预提取识别音频：归属（项目ID）-> (视频绝对路径, 档位, 输出路径前缀, 任务)
+        self._asr_audio_tasks: Dict[str, Tuple[str, str, str, "asyncio.Task"]] = {}
     
     async def cut_video_segment(self, input_path: str, output_path: str,
                               start_time: float, duration: float) -> bool:
@@ -67,8 +105,142 @@ class VideoProcessor:
             logger.error(f"剪切视频时出错: {e}")
             return False
 
-    async def concat_videos(self, inputs: List[str], output_path: str, on_progress=None) -> bool:
+    @staticmethod
+    def plan_smart_cut(keyframes: List[float], start: float, end: float,
+                       min_copy: float = 0.5) -> List[Tuple[str, float, float]]:
+        """
+        按关键帧索引规划智能剪切：[(方式, 起点, 终点)]，方式为 "encode" 或 "copy"。
+        区间内首个关键帧之前与最后一个关键帧之后的不完整 GOP 重编码，中间整 GOP 流拷贝；
+        区间内可拷贝部分过短时整体重编码。
+        """
+        eps = 0.001
+        inner = [k for k in keyframes if start - eps <= k <= end + eps]
+        if not inner:
+            return [("encode", start, end)]
+        k1 = inner[0]
+        k2 = inner[-1]
+        if k2 - k1 < min_copy:
+            return [("encode", start, end)]
+        plan: List[Tuple[str, float, float]] = []
+        if k1 - start > eps:
+            plan.append(("encode", start, k1))
+        plan.append(("copy", k1, k2))
+        if end - k2 > eps:
+            plan.append(("encode", k2, end))
+        return plan
+
+    async def smart_cut_segment(self, input_path: str, output_path: str,
+                                start_time: float, duration: float) -> bool:
         """
+        关键帧感知的精确剪切（用于播放原片片段）。
+        基于缓存的关键帧索引，仅重编码区间两端的不完整 GOP，中间部分流拷贝，
+        各部分以 MPEG-TS 中转后用 concat 分离器无损拼接；重编码部分按源视频的 profile/level 编码，
+        输出保持原视频编码参数，时长与脚本一致，后续 concat_videos 仍可走流拷贝路径。
+        源视频的 profile/level 无法匹配时整段重编码（不混拼参数不一致的码流）；
+        不满足条件（非 H.264、无 libx264、无关键帧索引）或失败时回退 cut_video_segment。
+        """
+        part_files: List[Path] = []
+        list_path = Path(output_path).with_suffix(".smart.txt")
+        try:
+            info = await media_probe.probe(input_path)
+            kfs = await media_probe.keyframes(input_path)
+            encoders = await self._detect_encoders()
+            if info is None or not kfs or info.video_codec != "h264" or "libx264" not in encoders:
+                return await self.cut_video_segment(input_path, output_path, start_time, duration)
+
+            end = start_time + duration
+            if info.format_duration:
+                end = min(end, info.format_duration)
+            profile_args = x264_profile_level_args(info.video_profile, info.video_level)
+            if profile_args is None:
+                logger.info(f"源视频 profile/level 无法匹配（{info.video_profile}/{info.video_level}），整段重编码")
+                plan = [("encode", start_time, end)]
+            else:
+                plan = self.plan_smart_cut(kfs, start_time, end)
+
+            audio_args: List[str] = []
+            if info.has_audio:
+                # 统一输出采样率/声道，使后续 concat_videos 可走流拷贝
+                audio_args = [
+                    "-c:a", "aac", "-b:a", "192k",
+                    "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2",
+                ]
+
+            async def _run_part(i: int, kind: str, s: float, e: float) -> bool:
+                ts_path = Path(output_path).with_suffix(f".smart_{i}.ts")
+                part_files.append(ts_path)
+                if kind == "copy":
+                    # 起点即关键帧：输入端 -ss 略微后移 1ms，保证定位到该关键帧而非前一个
+                    seek = ["-ss", f"{s + 0.001:.6f}", "-i", input_path, "-t", f"{e - s:.6f}"]
+                    vargs = ["-c:v", "copy", "-bsf:v", "h264_mp4toannexb"]
+                else:
+                    seek = ["-ss", f"{s:.6f}", "-i", input_path, "-t", f"{e - s:.6f}"]
+                    vargs = [
+                        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
+                        *(profile_args or []),
+                        "-pix_fmt", info.pix_fmt or "yuv420p",
+                    ]
+                cmd = [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error",
+                    *seek,
+                    "-map", "0:v:0", "-map", "0:a:0?",
+                    *vargs, *audio_args,
+                    "-f", "mpegts", "-y", str(ts_path),
+                ]
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+                _, err = await proc.communicate()
+                if proc.returncode != 0:
+                    logger.error(f"智能剪切分段失败({kind} {s:.3f}-{e:.3f}): {err.decode(errors='ignore')}")
+                    return False
+                return True
+
+            results = await asyncio.gather(*(
+                _run_part(i, kind, s, e) for i, (kind, s, e) in enumerate(plan)
+            ))
+            if not all(results):
+                return await self.cut_video_segment(input_path, output_path, start_time, duration)
+
+            ordered = [Path(output_path).with_suffix(f".smart_{i}.ts") for i in range(len(plan))]
+            list_path.write_text("\n".join(f"file '{p.as_posix()}'" for p in ordered), encoding="utf-8")
+            cmd = [
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-f", "concat", "-safe", "0",
+                "-i", str(list_path),
+                "-c", "copy",
+            ]
+            if info.has_audio:
+                cmd.extend(["-bsf:a", "aac_adtstoasc"])
+            cmd.extend(["-movflags", "+faststart", "-y", output_path])
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            _, err = await proc.communicate()
+            if proc.returncode != 0:
+                logger.error(f"智能剪切拼接失败: {err.decode(errors='ignore')}")
+                return await self.cut_video_segment(input_path, output_path, start_time, duration)
+            kinds = ",".join(k for k, _, _ in plan)
+            logger.info(f"智能剪切成功: {start_time}s-{end}s [{kinds}] -> {output_path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"智能剪切出错，回退关键帧剪切: {e}")
+            return await self.cut_video_segment(input_path, output_path, start_time, duration)
+        finally:
+            for f in part_files + [list_path]:
+                try:
+                    if f.exists():
+                        f.unlink()
+                except Exception:
+                    pass
+
+    async def concat_videos(self, inputs: List[str], output_path: str, on_progress=None,
+                            audio_filter: Optional[str] = None) -> bool:
+        """
+        拼接视频片段。
+        audio_filter 不为空时（如 loudnorm），在拼接的同一次输出中对音轨应用该滤镜：
+        流拷贝路径仅重编码音频（视频仍 copy），滤镜路径直接接在 concat 之后。
         """
         try:
             if not inputs:
@@ -83,21 +255,27 @@ class VideoProcessor:
             ainfo_list: List[Optional[Dict[str, Any]]] = []
             format_names: List[str] = []
             keyframe_starts: List[bool] = []
-            for p in inputs:
-                d = await self._ffprobe_video_duration(p)
+            # 每个输入仅 ffprobe 一次（并发执行，结果按路径+大小+修改时间缓存）
+            infos = await media_probe.probe_many(inputs)
+            for info in infos:
+                if info is None:
+                    durations.append(0.0)
+                    has_audio.append(False)
+                    vinfo_list.append({})
+                    ainfo_list.append(None)
+                    format_names.append("")
+                    keyframe_starts.append(False)
+                    continue
+                d = info.duration("video")
                 if d is None:
-                    d = await self._ffprobe_duration(p, "format")
+                    d = info.duration("format")
                 d = d or 0.0
                 durations.append(max(d, 0.0))
-                a_dur = await self._ffprobe_duration(p, "audio")
-                has_audio.append(a_dur is not None and a_dur > 0.0)
-                vi, ai = await self._probe_stream_info(p)
-                vinfo_list.append(vi or {})
-                ainfo_list.append(ai)
-                fmt = await self._ffprobe_format_name(p)
-                format_names.append(fmt or "")
-                kf = await self._first_frame_is_keyframe(p)
-                keyframe_starts.append(bool(kf))
+                has_audio.append(info.has_audio)
+                vinfo_list.append(info.video_stream_info() or {})
+                ainfo_list.append(info.audio_stream_info())
+                format_names.append(info.format_name or "")
+                keyframe_starts.append(info.first_frame_is_keyframe)
 
             def _fr_to_float(s: Optional[str]) -> Optional[float]:
                 if not s:
@@ -210,10 +388,8 @@ class VideoProcessor:
                         cmd = [
                             "ffmpeg", "-hide_banner", "-loglevel", "error",
                             "-i", concat_uri,
-                            "-c", "copy",
                         ]
-                        if acodec0 == "aac":
-                            cmd.extend(["-bsf:a", "aac_adtstoasc"])
+                        cmd.extend(self._concat_copy_codec_args(acodec0, audio_filter, from_ts=True))
                         cmd.extend(["-movflags", "+faststart", "-progress", "pipe:1", "-y", output_path])
                         process = await asyncio.create_subprocess_exec(
                             *cmd,
@@ -280,7 +456,7 @@ class VideoProcessor:
                     "ffmpeg", "-hide_banner", "-loglevel", "error",
                     "-f", "concat", "-safe", "0",
                     "-i", str(list_path),
-                    "-c", "copy",
+                    *self._concat_copy_codec_args(acodec0, audio_filter, from_ts=False),
                     "-movflags", "+faststart",
                     "-progress", "pipe:1",
                     "-y", output_path,
@@ -360,15 +536,21 @@ class VideoProcessor:
                         f"[{i}:v:0]scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p,setpts=PTS-STARTPTS[v{i}]"
                     )
                 if has_audio[i]:
-                    vf_parts.append(f"[{i}:a:0]aresample=48000,asetpts=PTS-STARTPTS[a{i}]")
+                    vf_parts.append(f"[{i}:a:0]aresample={AUDIO_SAMPLE_RATE},asetpts=PTS-STARTPTS[a{i}]")
                 else:
                     dur = durations[i]
                     vf_parts.append(
-                        f"anullsrc=r=48000:cl=stereo,atrim=0:{dur},asetpts=PTS-STARTPTS[a{i}]"
+                        f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=0:{dur},asetpts=PTS-STARTPTS[a{i}]"
                     )
 
             concat_inputs = "".join([f"[v{i}][a{i}]" for i in range(n)])
-            filter_complex = ";".join(vf_parts) + f";{concat_inputs}concat=n={n}:v=1:a=1[v][a]"
+            if audio_filter:
+                filter_complex = (
+                    ";".join(vf_parts)
+                    + f";{concat_inputs}concat=n={n}:v=1:a=1[v][acat];[acat]{audio_filter},aresample={AUDIO_SAMPLE_RATE}[a]"
+                )
+            else:
+                filter_complex = ";".join(vf_parts) + f";{concat_inputs}concat=n={n}:v=1:a=1[v][a]"
 
             encoder_sets = await self._get_encoder_priority_list()
             last_err = None
@@ -455,52 +637,51 @@ class VideoProcessor:
             logger.error(f"拼接视频时出错: {e}")
             return False
 
-    async def _probe_stream_info(self, path: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
-        try:
-            cmd = [
-                "ffprobe", "-v", "error",
-                "-print_format", "json",
-                "-show_streams",
-                path,
+    @staticmethod
+    def _concat_copy_codec_args(acodec: Optional[str], audio_filter: Optional[str], from_ts: bool) -> List[str]:
+        if audio_filter:
+            return [
+                "-c:v", "copy",
+                "-af", audio_filter,
+                "-c:a", "aac", "-b:a", "192k", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2",
             ]
-            proc = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode != 0:
-                return None, None
-            data = json.loads(out.decode(errors="ignore") or "{}")
-            streams = data.get("streams") or []
-            v = None
-            a = None
-            for s in streams:
-                if s.get("codec_type") == "video" and v is None:
-                    v = {
-                        "codec_name": s.get("codec_name"),
-                        "pix_fmt": s.get("pix_fmt"),
-                        "width": s.get("width"),
-                        "height": s.get("height"),
-                        "r_frame_rate": s.get("r_frame_rate"),
-                    }
-                elif s.get("codec_type") == "audio" and a is None:
-                    sr = s.get("sample_rate")
-                    try:
-                        sr_int = int(sr) if sr is not None else None
-                    except Exception:
-                        sr_int = None
-                    a = {
-                        "codec_name": s.get("codec_name"),
-                        "sample_rate": sr_int,
-                        "channels": s.get("channels"),
-                    }
-            return v, a
-        except Exception:
+        args = ["-c", "copy"]
+        if from_ts and acodec == "aac":
+            args.extend(["-bsf:a", "aac_adtstoasc"])
+        return args
+
+    async def measure_concat_loudness(self, inputs: List[str]) -> Optional[Dict[str, float]]:
+        """
+        仅解码音轨，对多个片段按顺序拼接后的整体音频做 loudnorm 测量（无音轨片段以静音补位）。
+        用于逐片段测量值不可用时的旁路测量。
+        """
+        try:
+            infos = await media_probe.probe_many(inputs)
+            input_args: List[str] = []
+            parts: List[str] = []
+            for i, (p, info) in enumerate(zip(inputs, infos)):
+                input_args.extend(["-i", str(p)])
+                if info is not None and info.has_audio:
+                    parts.append(f"[{i}:a:0]aresample={AUDIO_SAMPLE_RATE},asetpts=PTS-STARTPTS[a{i}]")
+                else:
+                    dur = (info.duration("format") if info is not None else None) or 0.0
+                    parts.append(f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=0:{dur},asetpts=PTS-STARTPTS[a{i}]")
+            concat_inputs = "".join(f"[a{i}]" for i in range(len(inputs)))
+            graph = ";".join(parts) + f";{concat_inputs}concat=n={len(inputs)}:v=0:a=1[acat]"
+            return await self.audio_normalizer.measure_filtergraph(input_args, graph, "acat")
+        except Exception as e:
+            logger.error(f"拼接响度测量出错: {e}")
+            return None
+
+    async def _probe_stream_info(self, path: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        info = await media_probe.probe(path)
+        if info is None:
             return None, None
+        return info.video_stream_info(), info.audio_stream_info()
 
     async def _pick_fast_encoder(self) -> Tuple[str, List[str]]:
-        await self._detect_cuda()
         encoders = await self._detect_encoders()
-        if getattr(self, "_cuda_available", False) and ("h264_nvenc" in encoders):
+        if "h264_nvenc" in encoders:
             logger.info("编码器选择: h264_nvenc (GPU)")
             return "h264_nvenc", ["-c:v", "h264_nvenc", "-preset", "p1"]
         if "h264_qsv" in encoders:
@@ -509,11 +690,11 @@ class VideoProcessor:
         if "h264_amf" in encoders:
             logger.info("编码器选择: h264_amf (GPU)")
             return "h264_amf", ["-c:v", "h264_amf"]
-        logger.info("编码器选择: libx264 (CPU)")
-        return "libx264", ["-c:v", "libx264", "-preset", "superfast", "-crf", "23"]
+        preset = await encoder_registry.x264_preset("libx264")
+        logger.info(f"编码器选择: libx264 (CPU, preset={preset})")
+        return "libx264", ["-c:v", "libx264", "-preset", preset, "-crf", "23"]
 
     async def _get_encoder_priority_list(self) -> List[List[str]]:
-        await self._detect_cuda()
         names = await self._detect_encoders()
         seq: List[List[str]] = []
         if "h264_nvenc" in names:
@@ -522,201 +703,40 @@ class VideoProcessor:
             seq.append(["-c:v", "h264_qsv"])
         if "h264_amf" in names:
             seq.append(["-c:v", "h264_amf"])
-        seq.append(["-c:v", "libx264", "-preset", "superfast", "-crf", "23"])
+        preset = await encoder_registry.x264_preset("libx264")
+        seq.append(["-c:v", "libx264", "-preset", preset, "-crf", "23"])
         return seq
 
     async def _detect_encoders(self) -> List[str]:
-        if getattr(self, "_encoders_cache", None) is not None:
-            return getattr(self, "_encoders_cache")
+        """已验证可用的编码器（来自持久化的编码器注册表，硬件编码器均经过试编码确认）"""
         try:
-            proc = await asyncio.create_subprocess_exec(
-                "ffmpeg", "-hide_banner", "-encoders",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            text = out.decode(errors="ignore")
-            names = []
-            for name in ["h264_nvenc", "h264_qsv", "h264_amf", "libx264"]:
-                if name in text:
-                    names.append(name)
-            setattr(self, "_encoders_cache", names)
-            return names
+            return await encoder_registry.usable_encoders()
         except Exception:
-            setattr(self, "_encoders_cache", ["libx264"])
             return ["libx264"]
 
-    async def _ffmpeg_supports_cuda_hwaccel(self) -> bool:
-        try:
-            proc = await asyncio.create_subprocess_exec(
-                "ffmpeg", "-hide_banner", "-hwaccels",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode == 0:
-                text = out.decode(errors="ignore").lower()
-                return ("cuda" in text) or ("nvdec" in text) or ("cuvid" in text)
-            return False
-        except Exception:
-            return False
-
-    async def _detect_cuda(self) -> bool:
-        if getattr(self, "_cuda_checked", False):
-            return bool(getattr(self, "_cuda_available", False))
-        has_hwaccel = await self._ffmpeg_supports_cuda_hwaccel()
-        use = has_hwaccel
-        setattr(self, "_cuda_checked", True)
-        setattr(self, "_cuda_available", use)
-        if use:
-            if not getattr(self, "_cuda_log_done", False):
-                logger.info("检测到CUDA/NVENC，已启用GPU加速")
-                setattr(self, "_cuda_log_done", True)
-        else:
-            if not getattr(self, "_cuda_log_done", False):
-                logger.info("未检测到CUDA/NVENC，使用CPU编码")
-                setattr(self, "_cuda_log_done", True)
-        return use
-
     async def _ffprobe_format_name(self, path: str) -> Optional[str]:
-        try:
-            cmd = [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=format_name",
-                "-of", "default=nk=1:nw=1",
-                path,
-            ]
-            proc = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode == 0:
-                s = out.decode(errors="ignore").strip()
-                return s or None
-            return None
-        except Exception:
-            return None
+        info = await media_probe.probe(path)
+        return info.format_name if info is not None else None
 
     async def _first_frame_is_keyframe(self, path: str) -> bool:
-        try:
-            cmd = [
-                "ffprobe", "-v", "error",
-                "-select_streams", "v:0",
-                "-skip_frame", "nokey",
-                "-show_entries", "frame=pkt_pts_time",
-                "-of", "csv=p=0",
-                "-read_intervals", "%+0.2",
-                path,
-            ]
-            proc = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode != 0:
-                return False
-            text = out.decode(errors="ignore").strip()
-            if not text:
-                return False
-            try:
-                first_kf_time = float(text.splitlines()[0].strip())
-                return abs(first_kf_time) < 0.001
-            except Exception:
-                return False
-        except Exception:
-            return False
+        info = await media_probe.probe(path)
+        return bool(info is not None and info.first_frame_is_keyframe)
 
     async def _ffprobe_video_duration(self, path: str) -> Optional[float]:
         """读取视频流的时长，优先于容器总时长，避免音频缺失或容器元数据不准导致总时长偏差"""
-        try:
-            cmd = [
-                "ffprobe", "-v", "error",
-                "-select_streams", "v:0",
-                "-show_entries", "stream=duration",
-                "-of", "default=nk=1:nw=1",
-                path,
-            ]
-            proc = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode == 0:
-                try:
-                    return float(out.decode().strip())
-                except Exception:
-                    return None
-            return None
-        except Exception:
-            return None
+        info = await media_probe.probe(path)
+        return info.duration("video") if info is not None else None
 
     async def _ffprobe_has_audio(self, path: str) -> bool:
         """探测是否存在音频流"""
-        try:
-            cmd = [
-                "ffprobe", "-v", "error",
-                "-select_streams", "a:0",
-                "-show_entries", "stream=codec_type",
-                "-of", "default=nk=1:nw=1",
-                path,
-            ]
-            proc = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            out, _ = await proc.communicate()
-            if proc.returncode == 0:
-                s = out.decode().strip().lower()
-                return s == "audio"
-            return False
-        except Exception:
-            return False
+        info = await media_probe.probe(path)
+        return bool(info is not None and info.has_audio)
 
     async def _ffprobe_duration(self, path: str, stream_type: str = "format") -> Optional[float]:
-        try:
-            if stream_type == "audio":
-                cmd_a = [
-                    "ffprobe", "-v", "error",
-                    "-select_streams", "a:0",
-                    "-show_entries", "stream=duration",
-                    "-of", "default=nk=1:nw=1",
-                    path,
-                ]
-                proc_a = await asyncio.create_subprocess_exec(*cmd_a, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-                out_a, _ = await proc_a.communicate()
-                if proc_a.returncode == 0:
-                    try:
-                        return float(out_a.decode().strip())
-                    except Exception:
-                        pass
-                cmd_f = [
-                    "ffprobe", "-v", "error",
-                    "-show_entries", "format=duration",
-                    "-of", "default=nk=1:nw=1",
-                    path,
-                ]
-                proc_f = await asyncio.create_subprocess_exec(*cmd_f, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-                out_f, _ = await proc_f.communicate()
-                if proc_f.returncode == 0:
-                    try:
-                        return float(out_f.decode().strip())
-                    except Exception:
-                        return None
-                return None
-            else:
-                cmd = [
-                    "ffprobe", "-v", "error",
-                    "-show_entries", "format=duration",
-                    "-of", "default=nk=1:nw=1",
-                    path,
-                ]
-                proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-                out, _ = await proc.communicate()
-                if proc.returncode == 0:
-                    try:
-                        return float(out.decode().strip())
-                    except Exception:
-                        return None
-                return None
-        except Exception:
+        info = await media_probe.probe(path)
+        if info is None:
             return None
+        return info.duration("audio" if stream_type == "audio" else "format")
 
     async def replace_audio_with_narration(self, video_path: str, narration_path: str, output_path: str) -> bool:
         try:
@@ -769,7 +789,8 @@ class VideoProcessor:
             else:
                 err = stderr.decode(errors="ignore")
                 if ("Cannot load nvcuda.dll" in err) or ("Error while opening encoder" in err) or ("Could not open encoder" in err):
-                    vcodec_args_fb = ["-c:v", "libx264", "-preset", "superfast", "-crf", "23", "-pix_fmt", "yuv420p", "-movflags", "+faststart"]
+                    x264_preset = await encoder_registry.x264_preset("libx264")
+                    vcodec_args_fb = ["-c:v", "libx264", "-preset", x264_preset, "-crf", "23", "-pix_fmt", "yuv420p", "-movflags", "+faststart"]
                     cmd_fb = [
                         "ffmpeg", "-hide_banner", "-loglevel", "error",
                         "-i", video_path,
@@ -800,24 +821,289 @@ class VideoProcessor:
             return False
         
 
-    async def extract_audio_mp3(self, input_video: str, output_mp3: str) -> bool:
+    @staticmethod
+    def compute_narrated_range(start: float, duration: float, narration_duration: float,
+                               input_duration: float) -> Tuple[float, float]:
+        """
+        计算配音片段在原视频中的取材区间 (start, duration)。
+        配音长于片段时优先向后延长；后方素材不足则整体前移，保证画面覆盖配音时长。
+        """
+        if narration_duration <= duration or input_duration <= 0.0:
+            return start, duration
+        ext = narration_duration - duration
+        fwd = max(0.0, input_duration - (start + duration))
+        if fwd >= ext:
+            return start, duration + ext
+        shortage = ext - fwd
+        new_start = max(0.0, start - shortage)
+        return new_start, input_duration - new_start
+
+    async def render_narrated_segment(self, input_path: str, start_time: float, duration: float,
+                                      narration_path: str, output_path: str,
+                                      input_duration: Optional[float] = None) -> bool:
+        """
+        单次 ffmpeg 完成配音片段渲染：定位取材区间、按配音时长裁剪/定格补齐画面并混入配音，
+        不再生成中间剪切文件（等价于 cut_video_segment + 重剪 + replace_audio_with_narration）。
+        """
+        try:
+            adur = await self._ffprobe_duration(narration_path, "audio") or 0.0
+            if adur <= 0.0:
+                logger.error("无法获取音频时长")
+                return False
+            if input_duration is None:
+                input_duration = await self._ffprobe_duration(input_path, "format") or 0.0
+            cut_start, cut_dur = self.compute_narrated_range(start_time, duration, adur, input_duration)
+            if cut_dur <= 0.0:
+                logger.error("无效的取材区间")
+                return False
+
+            adur_str = f"{adur:.3f}"
+            # 先以配音时长为上限定格补帧，再裁剪到配音时长：素材不足时补齐，素材过长时截断
+            filter_complex = (
+                f"[0:v]tpad=stop_mode=clone:stop_duration={adur_str},"
+                f"trim=start=0:end={adur_str},setpts=PTS-STARTPTS[v];"
+                f"[1:a]asetpts=PTS-STARTPTS[a]"
+            )
+            _, vcodec_args_pick = await self._pick_fast_encoder()
+            vcodec_args_fb = ["-c:v", "libx264", "-preset", await encoder_registry.x264_preset("libx264"), "-crf", "23"]
+
+            def _build(vargs: List[str]) -> List[str]:
+                return [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error",
+                    # 输入端 -ss：快速定位到最近关键帧后精确解码到起点
+                    "-ss", f"{cut_start:.3f}",
+                    "-t", f"{cut_dur:.3f}",
+                    "-i", input_path,
+                    "-i", narration_path,
+                    "-filter_complex", filter_complex,
+                    "-map", "[v]", "-map", "[a]",
+                    *vargs, "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                    "-c:a", "aac", "-b:a", "192k", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2",
+                    "-y", output_path,
+                ]
+
+            logger.info(f"单次渲染配音片段: {cut_start:.3f}s+{cut_dur:.3f}s (配音 {adur_str}s) -> {output_path}")
+            process = await asyncio.create_subprocess_exec(
+                *_build(vcodec_args_pick),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+            if process.returncode == 0:
+                return True
+            err = stderr.decode(errors="ignore")
+            if vcodec_args_pick != vcodec_args_fb and (
+                ("Cannot load nvcuda.dll" in err) or ("Error while opening encoder" in err) or ("Could not open encoder" in err)
+            ):
+                p2 = await asyncio.create_subprocess_exec(
+                    *_build(vcodec_args_fb),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, e2 = await p2.communicate()
+                if p2.returncode == 0:
+                    return True
+                logger.error(f"配音片段渲染失败: {err}\n{e2.decode(errors='ignore')}")
+                return False
+            logger.error(f"配音片段渲染失败: {err}")
+            return False
+
+        except Exception as e:
+            logger.error(f"配音片段渲染出错: {e}")
+            return False
+
+    async def _pump_ffmpeg_progress(self, process, total_duration: float, on_progress, label: str) -> None:
+        """读取 ffmpeg -progress pipe:1 输出并回调百分比（0-99，完成后由调用方回调 100）"""
+        if not on_progress:
+            return
+        try:
+            last_bucket = -1
+            seen_end = False
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                s = line.decode(errors="ignore").strip()
+                if s.startswith("out_time_ms="):
+                    try:
+                        ms = float(s.split("=", 1)[1])
+                        if total_duration > 0:
+                            pct = min(max((ms / (total_duration * 1000.0)) * 100.0, 0.0), 100.0)
+                            if not seen_end and pct >= 100.0:
+                                pct = 99.0
+                            await on_progress(pct)
+                            bucket = int(pct // 5)
+                            if bucket > last_bucket:
+                                logger.info(f"{label}进度: {pct:.1f}%")
+                                last_bucket = bucket
+                    except Exception:
+                        pass
+                elif s.startswith("progress=") and s.endswith("end"):
+                    seen_end = True
+        except Exception:
+            pass
+
+    async def build_script_filtergraph(self, input_path: str, segments: List[Dict[str, Any]],
+                                       input_duration: Optional[float] = None,
+                                       include_video: bool = True
+                                       ) -> Tuple[List[str], str, float]:
+        """
+        根据脚本片段构建一次性渲染所需的输入参数与滤镜图。
+
+        segments: [{"start": float, "duration": float, "narration": Optional[str]}]
+        每个片段以输入端 -ss/-t 单独打开原视频（只解码所需区间），配音片段额外引入配音输入；
+        画面 trim/tpad 对齐到片段时长，音频统一格式后 apad/atrim 到同一时长，最后 concat。
+        返回 (输入参数, 滤镜图, 输出总时长)；滤镜图输出标签为 [vcat] 与 [acat]，
+        include_video=False 时仅构建音频部分（只输出 [acat]，用于响度测量）。
+        """
+        if input_duration is None:
+            input_duration = await self._ffprobe_duration(input_path, "format") or 0.0
+        src_has_audio = await self._ffprobe_has_audio(input_path)
+        aformat = f"aformat=sample_fmts=fltp:sample_rates={AUDIO_SAMPLE_RATE}:channel_layouts=stereo"
+
+        input_args: List[str] = []
+        parts: List[str] = []
+        total = 0.0
+        in_idx = 0
+        for i, seg in enumerate(segments):
+            start = float(seg.get("start", 0.0))
+            duration = float(seg.get("duration", 0.0))
+            narration = seg.get("narration")
+            if narration:
+                adur = await self._ffprobe_duration(str(narration), "audio") or 0.0
+                if adur <= 0.0:
+                    raise RuntimeError(f"无法获取配音时长: {narration}")
+                cut_start, cut_dur = self.compute_narrated_range(start, duration, adur, input_duration)
+                out_dur = adur
+            else:
+                cut_start = start
+                cut_dur = duration
+                if input_duration > 0.0:
+                    cut_dur = min(duration, max(0.0, input_duration - start))
+                out_dur = cut_dur
+            if out_dur <= 0.0:
+                raise RuntimeError(f"无效片段时长: idx={i + 1}")
+            d = f"{out_dur:.3f}"
+
+            input_args.extend(["-ss", f"{cut_start:.3f}", "-t", f"{cut_dur:.3f}", "-i", input_path])
+            v_idx = in_idx
+            in_idx += 1
+            if include_video:
+                parts.append(
+                    f"[{v_idx}:v:0]tpad=stop_mode=clone:stop_duration={d},trim=start=0:end={d},"
+                    f"setpts=PTS-STARTPTS,format=yuv420p[v{i}]"
+                )
+            if narration:
+                input_args.extend(["-i", str(narration)])
+                parts.append(f"[{in_idx}:a:0]{aformat},apad,atrim=start=0:end={d},asetpts=PTS-STARTPTS[a{i}]")
+                in_idx += 1
+            elif src_has_audio:
+                parts.append(f"[{v_idx}:a:0]{aformat},apad,atrim=start=0:end={d},asetpts=PTS-STARTPTS[a{i}]")
+            else:
+                parts.append(f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=start=0:end={d},{aformat},asetpts=PTS-STARTPTS[a{i}]")
+            total += out_dur
+
+        n = len(segments)
+        if include_video:
+            concat_inputs = "".join(f"[v{i}][a{i}]" for i in range(n))
+            parts.append(f"{concat_inputs}concat=n={n}:v=1:a=1[vcat][acat]")
+        else:
+            concat_inputs = "".join(f"[a{i}]" for i in range(n))
+            parts.append(f"{concat_inputs}concat=n={n}:v=0:a=1[acat]")
+        return input_args, ";".join(parts), total
+
+    async def render_script_filtergraph(self, input_path: str, segments: List[Dict[str, Any]],
+                                        output_path: str, on_progress=None,
+                                        input_duration: Optional[float] = None) -> bool:
+        """
+        一次性渲染：单个 filter_complex 完成 剪切 -> 配音对齐 -> 拼接 -> 响度标准化，
+        画面只解码/编码一次，不产生任何临时片段文件。
+        响度先对同一滤镜图的音频部分做一次测量（不解码视频），再以线性 loudnorm 融入最终编码。
+        """
+        try:
+            if not segments:
+                logger.error("一次性渲染失败: 片段列表为空")
+                return False
+            input_args, graph, total_duration = await self.build_script_filtergraph(
+                input_path, segments, input_duration
+            )
+            a_args, a_graph, _ = await self.build_script_filtergraph(
+                input_path, segments, input_duration, include_video=False
+            )
+            measured = await self.audio_normalizer.measure_filtergraph(a_args, a_graph, "acat")
+            if measured is None:
+                logger.warning("一次性渲染响度测量失败，改用单遍 loudnorm")
+            filter_complex = f"{graph};[acat]{self.audio_normalizer.loudnorm_filter(measured)},aresample={AUDIO_SAMPLE_RATE}[aout]"
+
+            encoder_sets = await self._get_encoder_priority_list()
+            last_err = None
+            for vcodec_args in encoder_sets:
+                cmd = [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error",
+                    *input_args,
+                    "-filter_complex", filter_complex,
+                    "-map", "[vcat]", "-map", "[aout]",
+                    *vcodec_args,
+                    "-pix_fmt", "yuv420p",
+                    "-c:a", "aac", "-b:a", "192k", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2",
+                    "-movflags", "+faststart",
+                    "-max_muxing_queue_size", "1024",
+                    "-progress", "pipe:1",
+                    "-y", output_path,
+                ]
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                await self._pump_ffmpeg_progress(process, total_duration, on_progress, "一次性渲染")
+                _, stderr = await process.communicate()
+                if process.returncode == 0:
+                    if on_progress:
+                        try:
+                            await on_progress(100.0)
+                        except Exception:
+                            pass
+                    logger.info(f"一次性渲染成功: {output_path}")
+                    return True
+                last_err = stderr.decode(errors="ignore")
+                logger.error(f"一次性渲染失败({vcodec_args[1]}): {last_err}")
+                try:
+                    if Path(output_path).exists():
+                        Path(output_path).unlink()
+                except Exception:
+                    pass
+            return False
+
+        except Exception as e:
+            logger.error(f"一次性渲染出错: {e}")
+            return False
+
+    async def _run_audio_extract(self, input_video: str, output_path: str, codec_args: List[str]) -> bool:
         try:
             cmd = [
                 "ffmpeg",
                 "-hide_banner",
                 "-loglevel", "error",
                 "-i", input_video,
-                "-vn",
-                "-acodec", "libmp3lame",
-                "-q:a", "2",
-                "-y", output_mp3,
+                "-vn", "-sn", "-dn",
+                *codec_args,
+                "-y", output_path,
             ]
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
-            stdout, stderr = await process.communicate()
+            try:
+                stdout, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # 预提取被替换/取消时结束 ffmpeg，避免后台继续写文件
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+                raise
             if process.returncode == 0:
                 return True
             else:
@@ -828,5 +1114,99 @@ class VideoProcessor:
             logger.error(f"提取音频出错: {e}")
             return False
 
+    async def extract_audio_mp3(self, input_video: str, output_mp3: str) -> bool:
+        return await self._run_audio_extract(input_video, output_mp3, ASR_AUDIO_PROFILES["mp3_hq"][1])
+
+    async def extract_audio_for_asr(self, input_video: str, output_stem: str, profile: str = "speech_mp3") -> Optional[str]:
+        """
+        按识别后端要求提取音频，返回实际输出路径（扩展名由档位决定），失败返回 None。
+        output_stem 为不含扩展名的输出路径。
+        """
+        if profile not in ASR_AUDIO_PROFILES:
+            logger.warning(f"未知的音频提取档位 {profile}，使用 speech_mp3")
+            profile = "speech_mp3"
+        if profile == "aac_copy":
+            info = await media_probe.probe(input_video)
+            if not info or (info.audio_codec or "").lower() != "aac":
+                profile = "speech_mp3"
+        ext, codec_args = ASR_AUDIO_PROFILES[profile]
+        out_path = f"{output_stem}{ext}"
+        ok = await self._run_audio_extract(input_video, out_path, codec_args)
+        if not ok and profile == "aac_copy":
+            # 流复制失败（如封装不兼容）时转码兜底
+            ext, codec_args = ASR_AUDIO_PROFILES["speech_mp3"]
+            out_path = f"{output_stem}{ext}"
+            ok = await self._run_audio_extract(input_video, out_path, codec_args)
+        if not ok or not os.path.exists(out_path):
+            return None
+        logger.info(f"识别音频提取完成（{profile}）: {out_path}, {os.path.getsize(out_path) / 1024 / 1024:.1f}MB")
+        return out_path
+
+    def prefetch_asr_audio(self, input_video: str, output_stem: str, profile: str = "speech_mp3",
+                           owner: Optional[str] = None) -> None:
+        """
+        后台预提取识别音频（上传/合并完成后调用），与后续处理并行；
+        脚本生成时经 take_prefetched_asr_audio 取用，尚未完成则等待同一任务而不重复提取。
+        owner（项目ID）已有针对其他视频或档位的预提取时，取消旧任务并删除其输出文件。
+        """
+        video = str(Path(input_video).resolve())
+        owner = owner or video
+        prev = self._asr_audio_tasks.get(owner)
+        if prev is not None:
+            task = prev[3]
+            if prev[:2] == (video, profile) and (not task.done() or (not task.cancelled() and task.result())):
+                return
+            self._discard_asr_prefetch(prev)
+        task = asyncio.ensure_future(self.extract_audio_for_asr(input_video, output_stem, profile))
+        self._asr_audio_tasks[owner] = (video, profile, output_stem, task)
+
+    def has_prefetched_asr_audio(self, owner: str) -> bool:
+        return owner in self._asr_audio_tasks
+
+    def drop_prefetched_asr_audio(self, owner: str) -> None:
+        """放弃预提取（如项目已上传字幕或被删除），删除未被使用的输出文件"""
+        prev = self._asr_audio_tasks.pop(owner, None)
+        if prev is not None:
+            self._discard_asr_prefetch(prev)
+
+    @staticmethod
+    def _discard_asr_prefetch(entry: Tuple[str, str, str, "asyncio.Task"]) -> None:
+        _video, _profile, stem, task = entry
+
+        def _cleanup(_t: "asyncio.Task") -> None:
+            # 取消时可能留下部分写入的文件：按所有档位扩展名清理
+            for ext in {e for e, _ in ASR_AUDIO_PROFILES.values()}:
+                try:
+                    Path(f"{stem}{ext}").unlink(missing_ok=True)
+                except Exception:
+                    pass
+
+        task.add_done_callback(_cleanup)
+        task.cancel()
+
+    async def take_prefetched_asr_audio(self, input_video: str, profile: str = "speech_mp3",
+                                        owner: Optional[str] = None) -> Optional[str]:
+        """取用预提取结果（不存在、视频/档位不符或失败时返回 None，由调用方自行提取）"""
+        video = str(Path(input_video).resolve())
+        owner = owner or video
+        entry = self._asr_audio_tasks.pop(owner, None)
+        if entry is None:
+            return None
+        if entry[:2] != (video, profile):
+            self._discard_asr_prefetch(entry)
+            return None
+        task = entry[3]
+        try:
+            # shield：调用方被取消时预提取继续，结果可供下次取用
+            out = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and owner not in self._asr_audio_tasks:
+                self._asr_audio_tasks[owner] = entry
+            raise
+        except Exception as e:
+            logger.warning(f"预提取识别音频失败: {e}")
+            return None
+        return out if out and os.path.exists(out) else None
+
 # 全局视频处理器实例
 video_processor = VideoProcessor()
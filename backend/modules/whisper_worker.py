@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 Whisper 识别子进程入口
+
+在进程池的工作进程中运行（模块保持轻量，子进程导入时不牵连业务服务）：
+- 每个工作进程只加载一次 faster-whisper 模型并常驻
+- 逐段解码，每得到一句即通过队列推送给主进程（流式部分结果）
+- 主进程置位取消事件后在下一句处停止
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+_MODEL = None
+_MODEL_KEY = None
+
+
+def _load_model(model_name: str, device: str, compute_type: str, cpu_threads: int):
+    global _MODEL, _MODEL_KEY
+    key = (model_name, device, compute_type, cpu_threads)
+    if _MODEL is None or _MODEL_KEY != key:
+        # 可选依赖：pip install faster-whisper
+        from faster_whisper import WhisperModel
+
+        _MODEL = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        _MODEL_KEY = key
+    return _MODEL
+
+
+def transcribe(audio_path: str, opts: Dict[str, Any], queue: Optional[Any] = None,
+               cancel: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    识别整段音频，返回 {"utterances", "duration", "elapsed", "rtf", "language", "cancelled"}。
+    queue 依次收到 ("info", {"duration", "language"}, 0.0) 与若干 ("utterance", 句子字典, 已处理到的秒数)。
+    """
+    t_load = time.monotonic()
+    model = _load_model(
+        opts.get("model") or "small",
+        opts.get("device") or "cpu",
+        opts.get("compute_type") or "int8",
+        int(opts.get("cpu_threads") or 0),
+    )
+    load_s = time.monotonic() - t_load
+    t0 = time.monotonic()
+    segments, info = model.transcribe(
+        audio_path,
+        language=opts.get("language") or None,
+        beam_size=int(opts.get("beam_size") or 1),
+        vad_filter=bool(opts.get("vad_filter", True)),
+        word_timestamps=bool(opts.get("word_timestamps", False)),
+    )
+    duration = float(getattr(info, "duration", 0.0) or 0.0)
+    if queue is not None:
+        queue.put(("info", {"duration": duration, "language": getattr(info, "language", None)}, 0.0))
+    utterances = []
+    cancelled = False
+    # segments 为惰性生成器：迭代时才逐段解码
+    for seg in segments:
+        u: Dict[str, Any] = {
+            "transcript": (seg.text or "").strip(),
+            "start_time": int(round(seg.start * 1000)),
+            "end_time": int(round(seg.end * 1000)),
+        }
+        if getattr(seg, "words", None):
+            u["words"] = [
+                {"label": w.word, "start_time": int(round(w.start * 1000)), "end_time": int(round(w.end * 1000))}
+                for w in seg.words
+            ]
+        utterances.append(u)
+        if queue is not None:
+            queue.put(("utterance", u, float(seg.end)))
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            break
+    elapsed = time.monotonic() - t0
+    return {
+        "utterances": utterances,
+        "duration": duration,
+        "elapsed": round(elapsed, 3),
+        "model_load": round(load_s, 3),
+        "rtf": round(elapsed / duration, 4) if duration > 0 else None,
+        "language": getattr(info, "language", None),
+        "cancelled": cancelled,
+    }
@@ -12,12 +12,16 @@ from datetime import datetime
 from typing import Dict, List, Optional, Any
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import json
 from modules.config.content_model_config import content_model_config_manager
 from modules.config.tts_config import tts_engine_config_manager
 from modules.ws_manager import manager
 from services.asr_bcut import BcutASR
+from services.asr_registry import get_available_asr_backends
+from services.ai_service import ai_service, ai_config_manager
+from modules.ai.tracing import llm_tracer
 
 logger = logging.getLogger(__name__)
 
@@ -274,6 +278,9 @@ async def ai_health_check():
                 "service_status": ai_status.dict(),
                 "provider_info": provider_info,
                 "total_configs": len(configs),
+                "client_pool": ai_service.pool_stats(),
+                "response_cache": ai_service.cache_stats(),
+                "concurrency": ai_service.concurrency_stats(),
                 "config_details": {}
             }
             
@@ -281,7 +288,7 @@ async def ai_health_check():
             for config_id, config in configs.items():
                 detailed_info["config_details"][config_id] = {
                     "provider": config.provider,
-                    "model": config.model,
+                    "model": config.model_name,
                     "enabled": config.enabled,
                     "base_url": config.base_url
                 }
@@ -301,6 +308,50 @@ async def ai_health_check():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/llm-traces", summary="大模型调用追踪列表")
+async def list_llm_traces(project_id: Optional[str] = None, limit: int = 20):
+    """最近的脚本生成运行：按阶段/模型聚合的调用次数、token、延迟与排队等待"""
+    try:
+        return {
+            "success": True,
+            "data": {
+                "runs": llm_tracer.list_runs(project_id=project_id, limit=max(1, min(200, limit))),
+                "adhoc": llm_tracer.adhoc_summary(),
+            },
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"获取大模型调用追踪失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/llm-traces/{run_id}", summary="导出单次运行的大模型调用追踪")
+async def get_llm_trace(run_id: str, download: bool = False):
+    """单次运行的汇总与逐次调用明细；download=true 时作为 JSON 文件下载"""
+    data = llm_tracer.get_run(run_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"追踪记录不存在: {run_id}")
+    if download:
+        return JSONResponse(
+            content=data,
+            headers={"Content-Disposition": f'attachment; filename="llm_trace_{run_id}.json"'},
+        )
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@router.get("/asr-backends", summary="语音识别后端列表")
+async def list_asr_backends():
+    """已注册的语音识别后端及本地可用性（项目可通过 asr_backend 选择）"""
+    return {
+        "success": True,
+        "data": get_available_asr_backends(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @router.get("/config", summary="配置服务健康检查")
 async def config_health_check():
     """配置服务专项健康检查"""
@@ -316,7 +367,7 @@ async def config_health_check():
             for config_id, config in configs.items():
                 config_summary[config_id] = {
                     "provider": config.provider,
-                    "model": config.model,
+                    "model": config.model_name,
                     "enabled": config.enabled,
                     "is_active": config_id == active_config_id
                 }
@@ -21,7 +21,6 @@ from pathlib import Path
 from typing import Dict, Any, Optional, List
 import asyncio
 import logging
-import re
 import cv2
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Request
 from fastapi.responses import JSONResponse, FileResponse
@@ -30,11 +29,13 @@ import json
 import uuid
 
 from modules.projects_store import projects_store, Project
+from modules.subtitle_parser import compress_subtitles, load_segments
 from modules.video_processor import video_processor
 from services.script_generation_service import ScriptGenerationService
 from services.video_generation_service import video_generation_service
 from services.generate_script_service import generate_script_service
 from services.asr_bcut import BcutASR
+from services.asr_registry import ASR_BACKENDS, get_asr_backend, resolve_asr_backend
 from services.asr_utils import utterances_to_srt
 from modules.config.content_model_config import content_model_config_manager
 from modules.config.tts_config import tts_engine_config_manager
@@ -310,6 +311,7 @@ class UpdateProjectRequest(BaseModel):
     subtitle_path: Optional[str] = None
     audio_path: Optional[str] = None
     plot_analysis_path: Optional[str] = None
+    asr_backend: Optional[str] = None
     script: Optional[Dict[str, Any]] = None
 
 
@@ -335,97 +337,44 @@ class GenerateScriptRequest(BaseModel):
     video_path: str
     subtitle_path: Optional[str] = None
     narration_type: str
+    # False 时跳过大模型响应缓存，强制重新生成（缓存默认只为失败后重试复用未变化的阶段）
+    use_cache: bool = True
 
 
 def parse_srt(srt_path: Path) -> List[Dict[str, Any]]:
-    """简易SRT解析，返回包含 start/end/text 的列表"""
-    def _parse_ts(ts: str) -> float:
-        # format: HH:MM:SS,mmm
-        h, m, rest = ts.split(":")
-        s, ms = rest.split(",")
-        return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000.0
-
-    segments: List[Dict[str, Any]] = []
-    try:
-        content = srt_path.read_text(encoding="utf-8", errors="ignore")
-        norm = content.replace("\r\n", "\n").replace("\r", "\n").strip()
-        lines = [ln.strip() for ln in norm.splitlines() if ln.strip()]
-        # 优先检测压缩后的行格式：[HH:MM:SS,mmm-HH:MM:SS,mmm] text
-        bracket_pattern = re.compile(r"^\[(\d{2}:\d{2}:\d{2},\d{3})-(\d{2}:\d{2}:\d{2},\d{3})\]\s*(.+)$")
-        bracket_matches = [bracket_pattern.match(ln) for ln in lines]
-        if any(bracket_matches):
-            idx = 1
-            for m in bracket_matches:
-                if not m:
-                    continue
-                start_str, end_str, text = m.groups()
-                start_t = _parse_ts(start_str)
-                end_t = _parse_ts(end_str)
-                segments.append({
-                    "id": str(idx),
-                    "start_time": float(start_t),
-                    "end_time": float(end_t),
-                    "text": text,
-                    "subtitle": text,
-                })
-                idx += 1
-        else:
-            # 兼容标准SRT解析
-            blocks = [b.strip() for b in norm.split("\n\n") if b.strip()]
-            for idx, block in enumerate(blocks, start=1):
-                ls = [l for l in block.splitlines() if l.strip()]
-                if len(ls) < 2:
-                    continue
-                timing_line = ls[1] if "-->" in ls[1] else ls[0]
-                if "-->" not in timing_line:
-                    continue
-                start_str, end_str = [t.strip() for t in timing_line.split("-->")]
-                start_t = _parse_ts(start_str)
-                end_t = _parse_ts(end_str)
-                text_lines = ls[2:] if timing_line == ls[1] else ls[1:]
-                text = " ".join([ln.strip() for ln in text_lines if ln.strip()])
-                if not text:
-                    text = f"字幕段{idx}"
-                segments.append({
-                    "id": str(idx),
-                    "start_time": float(start_t),
-                    "end_time": float(end_t),
-                    "text": text,
-                    "subtitle": text,
-                })
-    except Exception:
-        # 解析失败返回空
-        pass
-    return segments
+    """解析字幕文件（SRT/VTT/ASS/压缩行格式），返回包含 start/end/text 的列表"""
+    return load_segments(srt_path)
+
 
 def compress_srt(content: str) -> str:
-    text = content.replace("\r\n", "\n").replace("\r", "\n").lstrip("\ufeff")
-    blocks = [b for b in text.split("\n\n") if b.strip()]
-    out_lines: List[str] = []
-    for b in blocks:
-        lines = [ln.strip() for ln in b.splitlines() if ln.strip()]
-        if not lines:
-            continue
-        timing_i = None
-        for i, ln in enumerate(lines[:3]):
-            if "-->" in ln:
-                timing_i = i
-                break
-        if timing_i is None:
-            continue
-        parts = lines[timing_i].split("-->")
-        if len(parts) < 2:
-            continue
-        start = parts[0].strip()
-        end = parts[1].strip()
-        text_lines = lines[timing_i + 1:]
-        t = " ".join(text_lines)
-        t = re.sub(r"\s+", " ", t).strip()
-        t = re.sub(r"<[^>]+>", "", t)
-        if not t:
-            continue
-        out_lines.append(f"[{start}-{end}] {t}")
-    return ("\n".join(out_lines) + ("\n" if out_lines else ""))
+    return compress_subtitles(content)
+
+
+def prefetch_asr_audio(p: Optional[Project], video_abs: Optional[Path] = None) -> None:
+    """
+    视频就绪（上传/合并完成）后在后台按项目识别后端的格式预提取识别音频，与后续处理并行，脚本生成时直接取用；
+    同一项目此前针对其他视频/后端的预提取被取消并删除输出文件。视频不是当前生效视频时跳过；
+    video_abs 为空（生效视频或识别后端变化）时仅替换尚未取用的预提取。已有字幕、无视频或 ASR_AUDIO_PREFETCH=0 时放弃预提取。
+    """
+    if not p:
+        return
+    disabled = (os.getenv("ASR_AUDIO_PREFETCH", "1") or "1").strip().lower() in {"0", "false", "no", "off"}
+    if p.subtitle_path or not p.video_path or disabled:
+        video_processor.drop_prefetched_asr_audio(p.id)
+        return
+    try:
+        if video_abs is None:
+            if not video_processor.has_prefetched_asr_audio(p.id):
+                return
+            video_abs = project_root_dir() / p.video_path.lstrip("/")
+        elif p.video_path != to_web_path(video_abs):
+            return
+        profile = get_asr_backend(resolve_asr_backend(p)).AUDIO_PROFILE
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        stem = uploads_dir() / "audios" / f"{p.id}_audio_{ts}_{uuid.uuid4().hex[:8]}"
+        video_processor.prefetch_asr_audio(str(video_abs), str(stem), profile, owner=p.id)
+    except Exception as e:
+        logging.warning(f"预提取识别音频失败: {e}")
 
 
 def read_video_duration(video_path: Path) -> float:
@@ -489,6 +438,7 @@ async def generate_script(req: GenerateScriptRequest):
             video_path=req.video_path,
             subtitle_path=req.subtitle_path,
             narration_type=req.narration_type,
+            use_cache=req.use_cache,
         )
     except HTTPException:
         raise
@@ -510,9 +460,18 @@ async def generate_script(req: GenerateScriptRequest):
 
 @router.post("/{project_id}")
 async def update_project(project_id: str, req: UpdateProjectRequest):
-    p = projects_store.update_project(project_id, req.model_dump(exclude_unset=True))
+    updates = req.model_dump(exclude_unset=True)
+    if updates.get("asr_backend") is not None:
+        backend = str(updates["asr_backend"]).strip().lower()
+        if backend not in ASR_BACKENDS:
+            raise HTTPException(status_code=400, detail=f"不支持的语音识别后端: {updates['asr_backend']}")
+        updates["asr_backend"] = backend
+    p = projects_store.update_project(project_id, updates)
     if not p:
         raise HTTPException(status_code=404, detail="项目不存在")
+    if "asr_backend" in updates:
+        # 识别后端决定音频格式：按新后端重新预提取
+        prefetch_asr_audio(p)
     return {
         "message": "项目更新成功",
         "data": {
@@ -530,6 +489,7 @@ async def delete_project(project_id: str):
     ok = projects_store.delete_project(project_id)
     if not ok:
         raise HTTPException(status_code=404, detail="项目不存在")
+    video_processor.drop_prefetched_asr_audio(project_id)
     return {
         "message": "项目删除成功",
         "success": True,
@@ -577,7 +537,8 @@ async def upload_video(project_id: str, file: UploadFile = File(...), project_id
     # 记录到项目的视频列表，并按规则更新生效路径
     web_path = to_web_path(out_path)
     # 记录路径与原始文件名
-    projects_store.append_video_path(project_id, web_path, file.filename)
+    p = projects_store.append_video_path(project_id, web_path, file.filename)
+    prefetch_asr_audio(p, out_path)
 
     return {
         "message": "视频上传成功",
@@ -625,6 +586,8 @@ async def upload_subtitle(project_id: str, file: UploadFile = File(...)):
 
     web_path = to_web_path(out_path)
     projects_store.update_project(project_id, {"subtitle_path": web_path})
+    # 已有字幕不再需要识别音频
+    video_processor.drop_prefetched_asr_audio(project_id)
 
     return {
         "message": "字幕上传成功",
@@ -707,6 +670,8 @@ async def delete_video_file(project_id: str, request: Request, req: Optional[Del
         p2 = projects_store.clear_video_path(project_id)
     if not p2:
         raise HTTPException(status_code=500, detail="服务器错误")
+    # 生效视频可能已变化：按新的生效视频预提取（无视频时放弃）
+    prefetch_asr_audio(p2)
 
     return {
         "message": "视频删除成功",
@@ -803,7 +768,7 @@ async def merge_videos(project_id: str):
             MERGE_TASKS[task_id].status = "completed"
             MERGE_TASKS[task_id].message = "合并完成"
             # 设置合并后路径并同步当前文件名（使用输出文件名）
-            projects_store.set_merged_video_path(project_id, web_path, out_name)
+            prefetch_asr_audio(projects_store.set_merged_video_path(project_id, web_path, out_name), out_path)
             try:
                 await manager.broadcast(json.dumps({
                     "type": "completed",
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字幕解析基准：生成 10k 条字幕（SRT / VTT / ASS / 压缩行格式），
+对比 modules.subtitle_parser 与原先按块多次切分 + 逐行正则的解析方式。
+
+用法（在 backend 目录下）：python scripts/bench_subtitle_parser.py [条数] [重复次数]
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.subtitle_parser import compress_cues, compress_subtitles, format_ts, iter_cues  # noqa: E402
+
+
+def make_srt(n: int) -> str:
+    out = []
+    for i in range(n):
+        a, b = i * 2000, i * 2000 + 1800
+        out.append(f"{i + 1}\n{format_ts(a)} --> {format_ts(b)}\n第{i}句台词，<i>带一点标签</i>\n第二行\n")
+    return "\n".join(out)
+
+
+def make_vtt(n: int) -> str:
+    out = ["WEBVTT\n"]
+    for i in range(n):
+        a, b = i * 2000, i * 2000 + 1800
+        out.append(f"{format_ts(a).replace(',', '.')} --> {format_ts(b).replace(',', '.')} align:start\n第{i}句台词\n")
+    return "\n".join(out)
+
+
+def make_ass(n: int) -> str:
+    def ts(ms: int) -> str:
+        s, ms = divmod(ms, 1000)
+        m, s = divmod(s, 60)
+        h, m = divmod(m, 60)
+        return f"{h}:{m:02d}:{s:02d}.{ms // 10:02d}"
+    head = "[Script Info]\nScriptType: v4.00+\n\n[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    lines = [
+        f"Dialogue: 0,{ts(i * 2000)},{ts(i * 2000 + 1800)},Default,,0,0,0,,{{\\an8}}第{i}句台词\\N第二行"
+        for i in range(n)
+    ]
+    return head + "\n".join(lines) + "\n"
+
+
+def legacy_parse(content: str) -> int:
+    """原 _parse_srt 的解析方式（压缩行格式优先，否则按空行分块）"""
+    def _parse_ts(ts: str) -> float:
+        h, m, rest = ts.split(":")
+        s, ms = rest.split(",")
+        return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000.0
+
+    norm = content.replace("\r\n", "\n").replace("\r", "\n").strip()
+    lines = [ln.strip() for ln in norm.splitlines() if ln.strip()]
+    bracket_pattern = re.compile(r"^\[(\d{2}:\d{2}:\d{2},\d{3})-(\d{2}:\d{2}:\d{2},\d{3})\]\s*(.+)$")
+    bracket_matches = [bracket_pattern.match(ln) for ln in lines]
+    n = 0
+    if any(bracket_matches):
+        for m in bracket_matches:
+            if m:
+                _parse_ts(m.group(1)), _parse_ts(m.group(2))
+                n += 1
+        return n
+    for block in [b.strip() for b in norm.split("\n\n") if b.strip()]:
+        ls = [l for l in block.splitlines() if l.strip()]
+        if len(ls) < 2:
+            continue
+        timing_line = ls[1] if "-->" in ls[1] else ls[0]
+        if "-->" not in timing_line:
+            continue
+        a, b = [t.strip() for t in timing_line.split("-->")]
+        _parse_ts(a), _parse_ts(b)
+        " ".join(ln.strip() for ln in (ls[2:] if timing_line == ls[1] else ls[1:]))
+        n += 1
+    return n
+
+
+def legacy_compress(content: str) -> int:
+    """原 _compress_srt：按空行分块后逐行正则清洗"""
+    text = content.replace("\r\n", "\n").replace("\r", "\n").lstrip("\ufeff")
+    out = []
+    for b in [b for b in text.split("\n\n") if b.strip()]:
+        lines = [ln.strip() for ln in b.splitlines() if ln.strip()]
+        timing_i = next((i for i, ln in enumerate(lines[:3]) if "-->" in ln), None)
+        if timing_i is None:
+            continue
+        start, end = [p.strip() for p in lines[timing_i].split("-->")[:2]]
+        t = re.sub(r"<[^>]+>", "", re.sub(r"\s+", " ", " ".join(lines[timing_i + 1:])).strip())
+        if t:
+            out.append(f"[{start}-{end}] {t}")
+    return len(out)
+
+
+def bench(label: str, fn, repeat: int) -> float:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<28} {best * 1000:8.1f} ms  ({result} 条)")
+    return best
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    srt = make_srt(n)
+    samples = {
+        "SRT": srt,
+        "VTT": make_vtt(n),
+        "ASS": make_ass(n),
+        "压缩行": compress_subtitles(srt),
+    }
+    print(f"{n} 条字幕，每项取 {repeat} 次最好成绩")
+    for name, content in samples.items():
+        print(f"[{name}] {len(content.encode('utf-8')) / 1024:.0f} KB")
+        bench("subtitle_parser.iter_cues", lambda: sum(1 for _ in iter_cues(content)), repeat)
+        if name in ("SRT", "压缩行"):
+            bench("legacy _parse_srt", lambda: legacy_parse(content), repeat)
+    print("[SRT -> 压缩行]")
+    bench("compress_subtitles", lambda: compress_subtitles(srt).count("\n"), repeat)
+    bench("compress_cues(iter_cues)", lambda: compress_cues(iter_cues(srt, joiner=" "), strip_tags=True).count("\n"), repeat)
+    bench("legacy _compress_srt", lambda: legacy_compress(srt), repeat)
+
+
+if __name__ == "__main__":
+    main()
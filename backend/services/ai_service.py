@@ -5,14 +5,31 @@ AI统一调用服务
 封装模型提供商选择、消息发送（普通/流式）、以及健康/配置信息查询。
 
 注意：本服务只负责AI调用，不处理具体业务逻辑。
+
+提供商实例（及其 httpx 长连接客户端）按激活配置的指纹池化复用：
+配置不变时所有分块请求共享同一连接池，配置变化时重建，旧实例在其进行中的请求结束后关闭。
 """
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Any, Dict, List, Optional, AsyncGenerator
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, AsyncGenerator, AsyncIterator
 
-from modules.ai import AIModelConfig, ChatMessage, ChatResponse, get_provider_class
+from modules.ai import AIModelConfig, AIProviderBase, ChatMessage, ChatResponse, get_provider_class
+from modules.ai.base import ResiliencePolicy
+from modules.ai.concurrency import adaptive_limiter, AdaptiveLimiter
+from modules.ai.response_cache import llm_response_cache
+from modules.ai.tokenizer import (
+    DEFAULT_OUTPUT_RESERVE, estimate_messages_tokens, estimate_tokens, get_token_estimator, input_token_budget,
+)
+from modules.ai.tracing import LLMSpan, add_queue_wait, llm_tracer, note_attempt
+from modules.json_stream import IncrementalJsonArrayParser
 from modules.config.content_model_config import content_model_config_manager, ContentModelConfig
 
 logger = logging.getLogger(__name__)
@@ -24,11 +41,59 @@ class AIService:
     def __init__(self) -> None:
         self._active_provider_name: Optional[str] = None
         self._active_model_name: Optional[str] = None
+        # 提供商池：配置指纹 -> 提供商实例；_inflight 记录各指纹进行中的请求数
+        self._providers: Dict[str, AIProviderBase] = {}
+        self._inflight: Dict[str, int] = {}
+        self._retired: Dict[str, AIProviderBase] = {}
+        self._pool_lock: Optional[asyncio.Lock] = None
+        self._pool_stats: Dict[str, int] = {"created": 0, "reused": 0, "rebuilt": 0, "closed": 0, "failovers": 0}
 
     def _get_active_model_config(self) -> Optional[ContentModelConfig]:
         cfg = content_model_config_manager.get_active_config()
         return cfg
 
+    def _candidate_configs(self) -> List[ContentModelConfig]:
+        """
+        请求候选配置：当前激活配置在前，其后为 AI_FAILOVER_CONFIGS（逗号分隔的配置ID）中列出的备用配置。
+        配置管理器同一时间只允许启用一个配置，备用链需显式声明；未填写真实密钥的占位配置跳过。
+        """
+        out: List[ContentModelConfig] = []
+        active = self._get_active_model_config()
+        if active:
+            out.append(active)
+        for cfg_id in (os.getenv("AI_FAILOVER_CONFIGS", "") or "").split(","):
+            cfg_id = cfg_id.strip()
+            if not cfg_id:
+                continue
+            cfg = content_model_config_manager.get_config(cfg_id)
+            if not cfg or (cfg.api_key or "").startswith("your_"):
+                continue
+            if any(self._config_fingerprint(c) == self._config_fingerprint(cfg) for c in out):
+                continue
+            out.append(cfg)
+        return out
+
+    def token_budget(self, template_messages: List[Any]) -> Tuple[int, Callable[[str], int]]:
+        """
+        按当前激活配置（及故障转移配置中最小者）计算正文可用 token 预算，并返回对应的本地 token 估算器。
+        template_messages 为去掉可变正文后的提示词消息，用于扣除模板开销。
+        """
+        candidates = self._candidate_configs()
+        if not candidates:
+            return input_token_budget(None, None, estimate_messages_tokens(template_messages)), get_token_estimator(None)
+        budget = min(
+            input_token_budget(c.model_name, c.max_tokens, estimate_messages_tokens(template_messages, c.provider))
+            for c in candidates
+        )
+        return budget, get_token_estimator(candidates[0].provider)
+
+    def output_token_budget(self) -> int:
+        """单次请求可输出的 token 上限（当前配置及故障转移配置中最小者；未设置 max_tokens 时取默认输出预留）"""
+        candidates = self._candidate_configs()
+        if not candidates:
+            return DEFAULT_OUTPUT_RESERVE
+        return min(int(c.max_tokens or DEFAULT_OUTPUT_RESERVE) for c in candidates)
+
     def _to_ai_model_config(self, cfg: ContentModelConfig) -> AIModelConfig:
         return AIModelConfig(
             provider=cfg.provider,
@@ -41,6 +106,115 @@ class AIService:
             extra_params=cfg.extra_params or {},
         )
 
+    @staticmethod
+    def _config_fingerprint(cfg: ContentModelConfig) -> str:
+        payload = json.dumps(
+            {
+                "provider": cfg.provider,
+                "api_key": cfg.api_key,
+                "base_url": cfg.base_url,
+                "model_name": cfg.model_name,
+                "max_tokens": cfg.max_tokens,
+                "temperature": cfg.temperature,
+                "timeout": cfg.timeout,
+                "extra_params": cfg.extra_params or {},
+            },
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _close_provider(self, fp: str, provider: AIProviderBase) -> None:
+        try:
+            await provider.close()
+            self._pool_stats["closed"] += 1
+        except Exception as e:
+            logger.warning(f"关闭AI客户端失败 {fp[:12]}: {e}")
+
+    @asynccontextmanager
+    async def _lease_provider(self, cfg: ContentModelConfig) -> AsyncIterator[AIProviderBase]:
+        """从池中取出（必要时创建）与配置对应的提供商；配置变化时淘汰旧实例"""
+        fp = self._config_fingerprint(cfg)
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        to_close: List[tuple] = []
+        async with self._pool_lock:
+            provider = self._providers.get(fp)
+            if provider is None:
+                provider_cls = get_provider_class(cfg.provider)
+                if not provider_cls:
+                    raise RuntimeError(f"不支持的AI提供商: {cfg.provider}")
+                provider = provider_cls(self._to_ai_model_config(cfg))
+                provider.limiter = self._limiter(cfg)
+                keep = {self._config_fingerprint(c) for c in self._candidate_configs()}
+                stale = [old_fp for old_fp in self._providers if old_fp not in keep]
+                if stale:
+                    self._pool_stats["rebuilt"] += 1
+                    logger.info("AI模型配置已变化，重建客户端连接池")
+                # 仅保留当前配置（及故障转移配置）的实例；旧实例无进行中请求时立即关闭，否则待请求结束后关闭
+                for old_fp in stale:
+                    old = self._providers.pop(old_fp)
+                    if self._inflight.get(old_fp, 0) > 0:
+                        self._retired[old_fp] = old
+                    else:
+                        to_close.append((old_fp, old))
+                self._providers[fp] = provider
+                self._pool_stats["created"] += 1
+            else:
+                self._pool_stats["reused"] += 1
+            self._inflight[fp] = self._inflight.get(fp, 0) + 1
+        for old_fp, old in to_close:
+            await self._close_provider(old_fp, old)
+        try:
+            yield provider
+        finally:
+            retired = None
+            async with self._pool_lock:
+                left = self._inflight.get(fp, 1) - 1
+                if left > 0:
+                    self._inflight[fp] = left
+                else:
+                    self._inflight.pop(fp, None)
+                    retired = self._retired.pop(fp, None)
+            if retired is not None:
+                await self._close_provider(fp, retired)
+
+    async def aclose(self) -> None:
+        """关闭池中全部客户端（应用关闭时调用）"""
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            items = list(self._providers.items()) + list(self._retired.items())
+            self._providers.clear()
+            self._retired.clear()
+            self._inflight.clear()
+        for fp, provider in items:
+            await self._close_provider(fp, provider)
+
+    def _limiter(self, cfg: ContentModelConfig) -> AdaptiveLimiter:
+        """当前配置的自适应并发控制器（所有分块请求经此限流，替代业务侧固定信号量）"""
+        return adaptive_limiter.get(self._config_fingerprint(cfg), cfg.provider, f"{cfg.provider}/{cfg.model_name}")
+
+    def concurrency_stats(self) -> Dict[str, Any]:
+        """各提供商配置的并发控制状态"""
+        return adaptive_limiter.snapshot()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """响应缓存命中统计"""
+        return llm_response_cache.stats()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """客户端池与连接复用统计"""
+        return {
+            **self._pool_stats,
+            "active_clients": len(self._providers),
+            "retired_clients": len(self._retired),
+            "inflight": sum(self._inflight.values()),
+            "clients": {
+                fp[:12]: {"provider": p.config.provider, **p.connection_stats()}
+                for fp, p in list(self._providers.items()) + list(self._retired.items())
+            },
+        }
+
     def get_provider_info(self) -> Dict[str, Any]:
         """返回当前激活的提供商与模型信息"""
         cfg = self._get_active_model_config()
@@ -49,45 +223,222 @@ class AIService:
             "active_model": cfg.model_name if cfg else None,
         }
 
-    async def send_chat(self, messages: List[ChatMessage], response_format: Optional[Dict[str, Any]] = None) -> ChatResponse:
-        """使用当前激活配置发送普通聊天请求"""
-        cfg = self._get_active_model_config()
-        if not cfg:
+    @staticmethod
+    def _passes(validate: Optional[Callable[[ChatResponse], Any]], resp: ChatResponse) -> bool:
+        """调用方校验（如 JSON 解析）：抛出异常或返回 False 视为未通过"""
+        if validate is None:
+            return True
+        try:
+            return validate(resp) is not False
+        except Exception as e:
+            logger.debug(f"响应未通过校验: {e}")
+            return False
+
+    async def send_chat(self, messages: List[ChatMessage], response_format: Optional[Dict[str, Any]] = None,
+                        use_cache: bool = True,
+                        validate: Optional[Callable[[ChatResponse], Any]] = None) -> ChatResponse:
+        """
+        使用当前激活配置发送普通聊天请求。
+        相同 (提供商, 模型, 温度, response_format, 消息) 的请求命中磁盘响应缓存；use_cache=False 时强制请求模型（结果仍写回缓存）。
+        validate 为调用方的解析校验：只有通过校验的响应才写入缓存，命中的缓存未通过校验时移除并重新请求。
+        提供商内部按策略重试/对冲仍失败时，依次故障转移到 AI_FAILOVER_CONFIGS 中的备用配置。
+        """
+        candidates = self._candidate_configs()
+        if not candidates:
             raise RuntimeError("没有激活的文案生成模型配置，请先在设置中启用一个配置")
+        if not use_cache:
+            llm_response_cache.record_bypass()
 
-        provider_cls = get_provider_class(cfg.provider)
-        if not provider_cls:
-            raise RuntimeError(f"不支持的AI提供商: {cfg.provider}")
+        last_error: Optional[BaseException] = None
+        with llm_tracer.span() as sp:
+            for i, cfg in enumerate(candidates):
+                sp.provider, sp.model = cfg.provider, cfg.model_name
+                cache_key = self._cache_key(cfg, messages, response_format)
+                if use_cache:
+                    cached = llm_response_cache.get(cache_key)
+                    if cached is not None and not self._passes(validate, cached):
+                        logger.warning(f"缓存的大模型响应未通过校验，移除并重新请求: {cache_key[:12]}")
+                        llm_response_cache.discard(cache_key)
+                        cached = None
+                    if cached is not None:
+                        logger.info(f"大模型响应缓存命中: {cache_key[:12]}")
+                        sp.cache_hit = True
+                        sp.set_usage(cached.usage)
+                        return cached
+                try:
+                    async with self._lease_provider(cfg) as provider:
+                        # 允许按请求覆盖结构化输出等参数
+                        extra_params = {}
+                        if response_format:
+                            extra_params["response_format"] = response_format
+                        resp = await provider.chat_completion(messages, extra_params=extra_params if extra_params else None)
+                except Exception as e:
+                    last_error = e
+                    if i + 1 < len(candidates):
+                        self._pool_stats["failovers"] += 1
+                        sp.failovers += 1
+                        nxt = candidates[i + 1]
+                        logger.warning(f"{cfg.provider}/{cfg.model_name} 请求失败，故障转移到 {nxt.provider}/{nxt.model_name}: {e}")
+                    continue
+                sp.set_usage(resp.usage)
+                if self._passes(validate, resp):
+                    llm_response_cache.put(cache_key, resp, meta={"provider": cfg.provider, "model": cfg.model_name})
+                else:
+                    logger.warning(f"{cfg.provider}/{cfg.model_name} 响应未通过校验，不写入缓存")
+                return resp
+            raise last_error
 
-        ai_cfg = self._to_ai_model_config(cfg)
-        provider = provider_cls(ai_cfg)
-        try:
-            # 允许按请求覆盖结构化输出等参数
-            extra_params = {}
-            if response_format:
-                extra_params["response_format"] = response_format
-            resp = await provider.chat_completion(messages, extra_params=extra_params if extra_params else None)
-            return resp
-        finally:
-            await provider.close()
+    @staticmethod
+    def _cache_key(cfg: ContentModelConfig, messages: List[ChatMessage],
+                   response_format: Optional[Dict[str, Any]]) -> str:
+        return llm_response_cache.make_key(
+            cfg.provider, cfg.model_name, cfg.temperature, response_format, messages,
+            extra={"base_url": cfg.base_url, "max_tokens": cfg.max_tokens, "extra_params": cfg.extra_params or {}},
+        )
 
-    async def send_chat_stream(self, messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
+    async def send_chat_stream(self, messages: List[ChatMessage],
+                               response_format: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
         """使用当前激活配置发送流式聊天请求"""
         cfg = self._get_active_model_config()
         if not cfg:
             raise RuntimeError("没有激活的文案生成模型配置，请先在设置中启用一个配置")
 
-        provider_cls = get_provider_class(cfg.provider)
-        if not provider_cls:
-            raise RuntimeError(f"不支持的AI提供商: {cfg.provider}")
-
-        ai_cfg = self._to_ai_model_config(cfg)
-        provider = provider_cls(ai_cfg)
-        try:
-            async for chunk in provider.stream_chat_completion(messages):
+        extra_params = {"response_format": response_format} if response_format else None
+        t_wait = time.monotonic()
+        async with self._limiter(cfg).slot(), self._lease_provider(cfg) as provider:
+            add_queue_wait(time.monotonic() - t_wait)
+            async for chunk in provider.stream_chat_completion(messages, extra_params=extra_params):
                 yield chunk
-        finally:
-            await provider.close()
+
+    async def send_chat_json_stream(
+        self,
+        messages: List[ChatMessage],
+        array_keys: tuple = ("items",),
+        on_item: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        流式请求结构化JSON：目标数组（array_keys）中的每个元素一闭合即回调 on_item（可为协程），返回解析后的 dict。
+        流式输出只作为首次尝试：中途中断、超过单次截止时间或结束时数组不完整，均视为一次失败的尝试，
+        改经 send_chat 走完整的重试/对冲/故障转移策略（重放结果时只回调尚未回调过的元素）；
+        策略用尽仍失败时，才退回已收到的部分元素并将本次调用记为 degraded。
+        AI_STREAM_JSON=0 时直接走非流式路径。
+        """
+        emitted = {"n": 0}
+
+        async def _emit(item: Dict[str, Any]) -> None:
+            emitted["n"] += 1
+            if on_item is None:
+                return
+            try:
+                res = on_item(item)
+                if asyncio.iscoroutine(res):
+                    await res
+            except Exception as e:
+                logger.debug(f"流式条目回调失败: {e}")
+
+        async def _replay(content: str) -> IncrementalJsonArrayParser:
+            parser = IncrementalJsonArrayParser(array_keys)
+            skip = emitted["n"]
+            for idx, item in enumerate(parser.feed(content)):
+                if idx >= skip:
+                    await _emit(item)
+            return parser
+
+        def _complete(resp: ChatResponse) -> bool:
+            parser = IncrementalJsonArrayParser(array_keys)
+            parser.feed(resp.content)
+            return parser.result()[1]
+
+        cfg = self._get_active_model_config()
+        streaming = (os.getenv("AI_STREAM_JSON", "1") or "1").strip().lower() not in {"0", "false", "no", "off"}
+        if not cfg or not streaming:
+            resp = await self.send_chat(messages, response_format=response_format, use_cache=use_cache,
+                                        validate=_complete)
+            return (await _replay(resp.content)).result()[0]
+
+        cache_key = self._cache_key(cfg, messages, response_format)
+        with llm_tracer.span(streamed=True) as sp:
+            sp.provider, sp.model = cfg.provider, cfg.model_name
+            if use_cache:
+                cached = llm_response_cache.get(cache_key)
+                if cached is not None and not _complete(cached):
+                    logger.warning(f"缓存的大模型响应解析不完整，移除并重新请求: {cache_key[:12]}")
+                    llm_response_cache.discard(cache_key)
+                    cached = None
+                if cached is not None:
+                    logger.info(f"大模型响应缓存命中: {cache_key[:12]}")
+                    sp.cache_hit = True
+                    return (await _replay(cached.content)).result()[0]
+            else:
+                llm_response_cache.record_bypass()
+
+            parser = IncrementalJsonArrayParser(array_keys)
+            policy = ResiliencePolicy.from_env()
+            deadline = policy.attempt_timeout or float(cfg.timeout or 600)
+
+            async def _consume() -> None:
+                async for chunk in self.send_chat_stream(messages, response_format=response_format):
+                    llm_tracer.mark("first_token_ms")
+                    for item in parser.feed(chunk):
+                        await _emit(item)
+
+            note_attempt()
+            stream_error: Optional[BaseException] = None
+            try:
+                await asyncio.wait_for(_consume(), timeout=deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stream_error = e
+
+            if stream_error is None:
+                data, complete = parser.result()
+                if complete:
+                    # 流式响应不含 usage，按本地估算器计数
+                    self._estimate_usage(sp, cfg, messages, parser.text)
+                    llm_response_cache.put(
+                        cache_key,
+                        ChatResponse(content=parser.text, model=cfg.model_name, finish_reason="stop"),
+                        meta={"provider": cfg.provider, "model": cfg.model_name},
+                    )
+                    return data
+                logger.warning(f"流式输出不完整（已收到 {len(parser.items)} 个条目），改走非流式重试")
+            else:
+                logger.warning(f"流式输出中断（已收到 {len(parser.items)} 个条目），改走非流式重试: {stream_error}")
+
+            # 非流式重试：提供商内部重试/对冲/单次截止时间 + 备用配置故障转移（计入同一条调用记录）
+            try:
+                resp = await self.send_chat(messages, response_format=response_format, use_cache=use_cache,
+                                            validate=_complete)
+                retry_parser = await _replay(resp.content)
+            except Exception as e:
+                if not parser.items:
+                    raise
+                retry_parser = None
+                stream_error = e
+            if retry_parser is not None:
+                data, complete = retry_parser.result()
+                if complete or len(retry_parser.items) >= len(parser.items):
+                    if not complete:
+                        sp.status = "degraded"
+                        sp.error = "incomplete_json"
+                        logger.warning(f"重试后输出仍不完整，使用已恢复的 {len(retry_parser.items)} 个条目")
+                    return data
+            # 重试用尽：退回流式阶段已收到的部分条目
+            sp.status = "degraded"
+            sp.error = (f"partial_stream: {stream_error}" if stream_error else "partial_stream")[:300]
+            self._estimate_usage(sp, cfg, messages, parser.text)
+            logger.warning(f"重试用尽，降级使用流式阶段已收到的 {len(parser.items)} 个条目")
+            data, complete = parser.result()
+            return data
+
+    @staticmethod
+    def _estimate_usage(sp: LLMSpan, cfg: ContentModelConfig, messages: List[ChatMessage], completion: str) -> None:
+        sp.prompt_tokens = estimate_messages_tokens(messages, cfg.provider)
+        sp.completion_tokens = estimate_tokens(completion, cfg.provider)
+        sp.usage_estimated = True
 
     async def test_all_connections(self) -> Dict[str, Dict[str, Any]]:
         """测试所有配置的连接状态"""
@@ -1,75 +1,137 @@
-import json
+import asyncio
+import mmap
 import zlib
 import logging
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union, Optional
+from typing import Iterator, Union, Optional
+
+from modules.asr_cache import asr_result_cache
+
+# 流式计算 CRC32 的读块大小
+HASH_BLOCK_SIZE = 1024 * 1024
 
 
 class BaseASR:
     """
     轻量级 ASR 基类，提供：
-    - 音频读取（路径或二进制）
-    - CRC32 计算（十六进制）
-    - 简单文件级缓存（JSON）
+    - 音频读取（路径或二进制）：文件输入不整体读入内存，上传时经 open_audio 按区间取视图
+    - CRC32 计算（十六进制）：仅在未传 fingerprint 时按需流式计算，构造实例不读取文件内容
+    - 识别结果持久缓存（modules.asr_cache，默认开启）：键为 后端/识别模型 + 音频内容指纹，
+      调用方可传入 fingerprint（源视频指纹或解码 PCM 指纹），未传时退化为文件 CRC32
 
     子类需实现：
     - _run(callback) -> dict  返回规范化的原始结果字典（包含 'utterances' 列表）
-    - _get_key() -> str       返回用于缓存键的唯一字符串
+    子类可选：
+    - MODEL_ID                识别模型标识，参与缓存键
+    - CHUNKED                 长音频是否经 ChunkedASR 切段并行提交（远端服务适用；本地引擎自行流式处理）
+    - AUDIO_PROFILE           提取识别音频的档位（modules.video_processor.ASR_AUDIO_PROFILES）
+    - _get_key() -> str       返回用于缓存键的唯一字符串（需加入更多维度时覆盖）
+    子类可选实现：
+    - _run_async(callback) -> dict  原生异步识别；未实现时在线程池中执行 _run
     """
 
-    def __init__(self, audio_path: Union[str, bytes], use_cache: bool = False):
+    MODEL_ID: str = ""
+    CHUNKED: bool = False
+    AUDIO_PROFILE: str = "speech_mp3"
+
+    def __init__(self, audio_path: Union[str, bytes], use_cache: bool = True, fingerprint: Optional[str] = None):
         self.use_cache = use_cache
+        self.fingerprint = fingerprint
         self.audio_path: Union[str, bytes] = audio_path
-        self.file_binary: bytes = b""
-        self.crc32_hex: str = ""
+        self.file_path: Optional[Path] = None
+        self.file_size: int = 0
+        self._file_binary: Optional[bytes] = None
+        self._crc32_hex: Optional[str] = None
 
-        # 读取音频数据
         if isinstance(audio_path, bytes):
-            self.file_binary = audio_path
+            self._file_binary = audio_path
+            self.file_size = len(audio_path)
         elif isinstance(audio_path, str):
             p = Path(audio_path)
             if not p.exists():
                 raise FileNotFoundError(f"音频文件不存在: {audio_path}")
-            self.file_binary = p.read_bytes()
+            self.file_path = p
+            self.file_size = p.stat().st_size
         else:
             raise TypeError("audio_path 需为 str 文件路径或 bytes 数据")
 
-        # 计算 CRC32（十六进制小写）
-        self.crc32_hex = format(zlib.crc32(self.file_binary) & 0xFFFFFFFF, '08x')
+    @property
+    def crc32_hex(self) -> str:
+        """音频 CRC32（十六进制小写），首次访问时计算；大文件会读完整个文件，异步代码中应在线程中访问"""
+        if self._crc32_hex is None:
+            if self._file_binary is not None or self.file_path is None:
+                crc = zlib.crc32(self._file_binary or b"")
+            else:
+                # 复用同一块缓冲区逐块累计 CRC32，内存占用与文件大小无关
+                crc = 0
+                buf = bytearray(HASH_BLOCK_SIZE)
+                view = memoryview(buf)
+                with open(self.file_path, "rb") as f:
+                    while True:
+                        n = f.readinto(buf)
+                        if not n:
+                            break
+                        crc = zlib.crc32(view[:n], crc)
+                view.release()
+            self._crc32_hex = format(crc & 0xFFFFFFFF, '08x')
+        return self._crc32_hex
+
+    def content_fingerprint(self) -> str:
+        """缓存键使用的音频指纹：调用方传入的 fingerprint，未传时退化为文件 CRC32"""
+        return self.fingerprint or f"crc32:{self.crc32_hex}"
 
-    # 缓存目录使用项目根下的 uploads/asr_cache
     @property
-    def _cache_dir(self) -> Path:
-        # backend/services/ -> 项目根目录为上上级
-        project_root = Path(__file__).resolve().parents[2]
-        cache_dir = project_root / "uploads" / "asr_cache"
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        return cache_dir
-
-    def _cache_path(self) -> Path:
-        key = self._get_key()
-        return self._cache_dir / f"{key}.json"
+    def file_binary(self) -> bytes:
+        """完整音频数据（兼容旧接口，文件输入时按需整体读取；上传请使用 open_audio 按区间切片）"""
+        if self._file_binary is None:
+            self._file_binary = self.file_path.read_bytes() if self.file_path else b""
+        return self._file_binary
+
+    @contextmanager
+    def open_audio(self) -> Iterator[memoryview]:
+        """
+        以只读 memoryview 提供整段音频：文件输入经 mmap 映射，由操作系统按页读入且不占用进程堆内存；
+        bytes 输入直接取视图。分片在其上切片即可，不复制整段数据。
+        """
+        if self._file_binary is not None or self.file_path is None or self.file_size == 0:
+            view = memoryview(self._file_binary or b"")
+            try:
+                yield view
+            finally:
+                view.release()
+            return
+        with open(self.file_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mm)
+            try:
+                yield view
+            finally:
+                # 先释放本视图对映射的导出，否则 mm.close() 必然失败
+                view.release()
+                try:
+                    mm.close()
+                except BufferError:
+                    # 调用方仍持有切片（切片各自导出映射）：映射在最后一个切片被回收后随 mm 对象释放
+                    logging.debug("音频映射仍被切片引用，延迟到切片回收后释放")
+
+    @classmethod
+    def cache_key_for(cls, fingerprint: str) -> str:
+        """给定音频内容指纹的缓存键（未构造实例前即可查询，如按源视频指纹跳过音频提取）"""
+        return asr_result_cache.make_key(f"{cls.__name__}:{cls.MODEL_ID}", fingerprint)
 
     def _get_key(self) -> str:
         # 子类可覆盖以加入更多维度（例如字级时间戳）
-        return f"{self.__class__.__name__}-{self.crc32_hex}"
+        return self.cache_key_for(self.content_fingerprint())
 
     def run(self, callback: Optional[callable] = None) -> dict:
         """
         返回规范化的原始数据 dict，至少包含 'utterances': list
         若启用缓存且命中，则直接返回缓存；否则执行 _run 并写入缓存。
         """
-        cache_path = self._cache_path()
-
-        if self.use_cache and cache_path.exists():
-            try:
-                data = json.loads(cache_path.read_text(encoding='utf-8'))
-                # 简单校验结构
-                if isinstance(data, dict) and isinstance(data.get('utterances'), list):
-                    logging.info(f"ASR 命中缓存: {cache_path}")
-                    return data
-            except Exception as e:
-                logging.warning(f"读取 ASR 缓存失败，将重新识别: {e}")
+        data = self._read_cache()
+        if data is not None:
+            return data
 
         # 执行识别
         data = self._run(callback=callback)
@@ -77,9 +139,39 @@ class BaseASR:
             raise ValueError("ASR 返回数据结构异常，期望 dict")
 
         # 写缓存（尽力而为）
-        try:
-            cache_path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
-        except Exception as e:
-            logging.warning(f"写入 ASR 缓存失败: {e}")
+        self._write_cache(data)
+        return data
+
+    def _read_cache(self) -> Optional[dict]:
+        if not self.use_cache:
+            return None
+        key = self._get_key()
+        data = asr_result_cache.get(key)
+        if data is not None:
+            logging.info(f"ASR 命中缓存: {key[:12]}")
+        return data
+
+    def _write_cache(self, data: dict) -> None:
+        if not self.use_cache:
+            return
+        asr_result_cache.put(self._get_key(), data, meta={
+            "backend": self.__class__.__name__,
+            "model_id": self.MODEL_ID,
+            "fingerprint": self.content_fingerprint()[:80],
+        })
 
-        return data
\ No newline at end of file
+    async def _run_async(self, callback: Optional[callable] = None) -> dict:
+        return await asyncio.to_thread(self._run, callback)
+
+    async def run_async(self, callback: Optional[callable] = None) -> dict:
+        """
+        run 的异步版本：不阻塞事件循环，可被取消。缓存语义与 run 一致（缓存读写在线程中执行）。
+        """
+        data = await asyncio.to_thread(self._read_cache)
+        if data is not None:
+            return data
+        data = await self._run_async(callback=callback)
+        if not isinstance(data, dict):
+            raise ValueError("ASR 返回数据结构异常，期望 dict")
+        await asyncio.to_thread(self._write_cache, data)
+        return data
@@ -1,8 +1,11 @@
+import asyncio
 import json
 import logging
+import os
 import time
 from typing import Optional, List
 
+import httpx
 import requests
 
 from .asr_data import ASRDataSeg
@@ -11,7 +14,8 @@ from .asr_base import BaseASR
 
 __version__ = "0.0.3"
 
-API_BASE_URL = "https://member.bilibili.com/x/bcut/rubick-interface"
+# 可通过环境变量指向本地桩服务（联调/测试）
+API_BASE_URL = (os.getenv("BCUT_API_BASE") or "https://member.bilibili.com/x/bcut/rubick-interface").rstrip("/")
 
 # 申请上传
 API_REQ_UPLOAD = API_BASE_URL + "/resource/create"
@@ -25,6 +29,20 @@ API_CREATE_TASK = API_BASE_URL + "/task"
 # 查询结果
 API_QUERY_RESULT = API_BASE_URL + "/task/result"
 
+# 异步路径参数：分片并发上传数、轮询退避（初始/上限秒）、总超时秒
+UPLOAD_CONCURRENCY = 4
+POLL_INTERVAL_INITIAL = 0.5
+POLL_INTERVAL_MAX = 5.0
+POLL_TIMEOUT = 500.0
+# 异步分片上传时每次写出的块大小（单个分片不整体复制到内存）
+UPLOAD_STREAM_BLOCK = 256 * 1024
+
+
+async def _aiter_view(view: memoryview, block_size: int = UPLOAD_STREAM_BLOCK):
+    """按块产出 memoryview 内容；配合显式 Content-Length，httpx 以定长请求体发送"""
+    for i in range(0, len(view), block_size):
+        yield bytes(view[i:i + block_size])
+
 
 class BcutASR(BaseASR):
     """必剪 语音识别接口"""
@@ -33,8 +51,16 @@ class BcutASR(BaseASR):
         'Content-Type': 'application/json'
     }
 
-    def __init__(self, audio_path: [str, bytes], use_cache: bool = False):
-        super().__init__(audio_path, use_cache=use_cache)
+    # 识别模型（上传/建任务时的 model_id），参与结果缓存键
+    MODEL_ID = "8"
+    CHUNKED = True
+    # 上传声明为 mp3，只接受 MP3；16kHz 单声道低码率即可
+    AUDIO_PROFILE = "speech_mp3"
+
+    def __init__(self, audio_path: [str, bytes], use_cache: bool = True, api_base: Optional[str] = None,
+                 fingerprint: Optional[str] = None):
+        super().__init__(audio_path, use_cache=use_cache, fingerprint=fingerprint)
+        self.api_base = (api_base or API_BASE_URL).rstrip("/")
         self.session = requests.Session()
         self.task_id: Optional[str] = None
         self.__etags: List[str] = []
@@ -61,12 +87,12 @@ class BcutASR(BaseASR):
 
     def upload(self) -> None:
         """申请上传"""
-        if not self.file_binary:
+        if not self.file_size:
             raise ValueError("none set data")
         payload = json.dumps({
             "type": 2,
             "name": "audio.mp3",
-            "size": len(self.file_binary),
+            "size": self.file_size,
             "ResourceFileType": "mp3",
             "model_id": "8",
         })
@@ -94,21 +120,22 @@ class BcutASR(BaseASR):
         self.__commit_upload()
 
     def __upload_part(self) -> None:
-        """上传音频数据"""
-        for clip in range(self.__clips or 0):
-            start_range = clip * (self.__per_size or 0)
-            end_range = (clip + 1) * (self.__per_size or 0)
-            logging.info(f"开始上传分片{clip}: {start_range}-{end_range}")
-            resp = requests.put(
-                self.__upload_urls[clip],
-                data=self.file_binary[start_range:end_range],
-                headers=self.headers
-            )
-            resp.raise_for_status()
-            etag = resp.headers.get("Etag")
-            if etag:
-                self.__etags.append(etag)
-            logging.info(f"分片{clip}上传成功: {etag}")
+        """上传音频数据（分片为映射视图的切片，urllib3 直接按缓冲区发送，不复制）"""
+        with self.open_audio() as audio:
+            for clip in range(self.__clips or 0):
+                start_range = clip * (self.__per_size or 0)
+                end_range = (clip + 1) * (self.__per_size or 0)
+                logging.info(f"开始上传分片{clip}: {start_range}-{end_range}")
+                resp = requests.put(
+                    self.__upload_urls[clip],
+                    data=audio[start_range:end_range],
+                    headers=self.headers
+                )
+                resp.raise_for_status()
+                etag = resp.headers.get("Etag")
+                if etag:
+                    self.__etags.append(etag)
+                logging.info(f"分片{clip}上传成功: {etag}")
 
     def __commit_upload(self) -> None:
         """提交上传数据"""
@@ -182,5 +209,128 @@ class BcutASR(BaseASR):
         logging.info(f"转换成功")
         return json.loads(task_resp["result"])
 
+    # ----- 异步路径（httpx.AsyncClient，连接复用；不阻塞事件循环，可取消） -----
+
+    @staticmethod
+    async def test_connection_async(timeout: int = 6, api_base: Optional[str] = None) -> dict:
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.get(api_base or API_BASE_URL)
+            ok = int(resp.status_code) < 500
+            if ok:
+                return {"success": True, "status_code": int(resp.status_code)}
+            return {"success": False, "status_code": int(resp.status_code)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    async def _upload_async(self, client: httpx.AsyncClient) -> None:
+        """申请上传 -> 分片并发上传 -> 提交"""
+        if not self.file_size:
+            raise ValueError("none set data")
+        resp = await client.post(
+            self.api_base + "/resource/create",
+            content=json.dumps({
+                "type": 2,
+                "name": "audio.mp3",
+                "size": self.file_size,
+                "ResourceFileType": "mp3",
+                "model_id": "8",
+            }),
+        )
+        resp.raise_for_status()
+        resp_data = resp.json()["data"]
+        in_boss_key = resp_data["in_boss_key"]
+        upload_urls: List[str] = resp_data["upload_urls"]
+        per_size = int(resp_data["per_size"])
+        logging.info(
+            f"申请上传成功, 总计大小{resp_data['size'] // 1024}KB, {len(upload_urls)}分片, 分片大小{per_size // 1024}KB: {in_boss_key}"
+        )
+
+        sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        etags: List[Optional[str]] = [None] * len(upload_urls)
+
+        async def _put(audio: memoryview, clip: int) -> None:
+            part = audio[clip * per_size:(clip + 1) * per_size]
+            async with sem:
+                # 分片按块流式写出：同时在途的内存约为 并发数 × 块大小
+                r = await client.put(
+                    upload_urls[clip],
+                    content=_aiter_view(part),
+                    headers={"Content-Length": str(len(part))},
+                )
+            r.raise_for_status()
+            etags[clip] = r.headers.get("Etag")
+            logging.info(f"分片{clip}上传成功: {etags[clip]}")
+
+        with self.open_audio() as audio:
+            await asyncio.gather(*(_put(audio, i) for i in range(len(upload_urls))))
+
+        resp = await client.post(
+            self.api_base + "/resource/create/complete",
+            content=json.dumps({
+                "InBossKey": in_boss_key,
+                "ResourceId": resp_data["resource_id"],
+                "Etags": ",".join(e for e in etags if e),
+                "UploadId": resp_data["upload_id"],
+                "model_id": "8",
+            }),
+        )
+        resp.raise_for_status()
+        self.__download_url = resp.json()["data"]["download_url"]
+        logging.info("提交成功")
+
+    async def _create_task_async(self, client: httpx.AsyncClient) -> str:
+        resp = await client.post(
+            self.api_base + "/task", json={"resource": self.__download_url, "model_id": "8"}
+        )
+        resp.raise_for_status()
+        self.task_id = resp.json()["data"]["task_id"]
+        logging.info(f"任务已创建: {self.task_id}")
+        return self.task_id
+
+    async def _result_async(self, client: httpx.AsyncClient) -> dict:
+        resp = await client.get(
+            self.api_base + "/task/result", params={"model_id": 7, "task_id": self.task_id}
+        )
+        resp.raise_for_status()
+        return resp.json()["data"]
+
+    async def _run_async(self, callback: Optional[callable] = None) -> dict:
+        def _notify(progress: int, message: str) -> None:
+            if callback:
+                try:
+                    callback(progress, message)
+                except Exception:
+                    pass
+
+        limits = httpx.Limits(max_connections=UPLOAD_CONCURRENCY + 2, max_keepalive_connections=UPLOAD_CONCURRENCY + 2)
+        async with httpx.AsyncClient(headers=self.headers, timeout=httpx.Timeout(60.0, connect=10.0), limits=limits) as client:
+            _notify(20, "正在上传音频到服务...")
+            await self._upload_async(client)
+
+            _notify(40, "上传完成，创建识别任务...")
+            await self._create_task_async(client)
+
+            _notify(55, "任务已创建，开始轮询结果...")
+            # 轮询检查任务状态（指数退避）
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + POLL_TIMEOUT
+            delay = POLL_INTERVAL_INITIAL
+            while True:
+                task_resp = await self._result_async(client)
+                state = task_resp.get("state")
+                if state == 4:
+                    break
+                if state == 3:
+                    raise RuntimeError(f"识别任务失败: {task_resp.get('remark') or task_resp}")
+                if loop.time() + delay > deadline:
+                    raise TimeoutError(f"识别任务超时（{POLL_TIMEOUT:.0f}s）: {self.task_id}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, POLL_INTERVAL_MAX)
+
+        _notify(95, "转换完成，解析结果...")
+        logging.info("转换成功")
+        return json.loads(task_resp["result"])
+
     def _make_segments(self, resp_data: dict) -> List[ASRDataSeg]:
         return [ASRDataSeg(u.get('text') or u.get('transcript') or '', u['start_time'], u['end_time']) for u in resp_data['utterances']]
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+长音频分段并行识别
+
+- ffmpeg silencedetect 检测静音区间，在目标时长（ASR_CHUNK_SECONDS，默认 300 秒）附近的静音中点处切分；
+  窗口内找不到静音时硬切，并在切点两侧各留 ASR_CHUNK_OVERLAP 秒重叠
+- 源音频已是后端音频档位（如 speech_mp3）时分段直接流复制，否则按该档位编码，并发提交给识别后端（ASR_CHUNK_CONCURRENCY，默认 4）
+- 结果按分段起点平移时间轴；每段只保留中点落在其“归属区间”内的句子，重叠区不重复
+- 整段结果写入缓存后移除各分段的缓存条目
+总识别耗时随并发上限而非音频长度增长。音频较短时直接整段识别。
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from modules.asr_cache import asr_result_cache
+from modules.media_probe import MediaInfo, media_probe
+from modules.video_processor import ASR_AUDIO_PROFILES
+from .asr_base import BaseASR
+from .asr_bcut import BcutASR
+
+logger = logging.getLogger(__name__)
+
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+# 音频档位对应的 ffprobe 编码名（判断源音频是否已符合档位）
+_PROFILE_CODECS = {"aac_copy": "aac", "speech_mp3": "mp3", "speech_opus": "opus", "mp3_hq": "mp3"}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+async def detect_silences(audio_path: str, noise_db: float = -35.0, min_silence: float = 0.4) -> List[Tuple[float, float]]:
+    """ffmpeg silencedetect 检测静音区间（秒），失败时返回空列表"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", audio_path,
+        "-vn", "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+        "-f", "null", "-",
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+    except Exception as e:
+        logger.warning(f"静音检测失败: {e}")
+        return []
+    if process.returncode != 0:
+        logger.warning(f"静音检测失败: {stderr.decode(errors='ignore')[-300:]}")
+        return []
+    out: List[Tuple[float, float]] = []
+    start: Optional[float] = None
+    for line in stderr.decode(errors="ignore").splitlines():
+        m = _SILENCE_START_RE.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = _SILENCE_END_RE.search(line)
+        if m and start is not None:
+            out.append((start, float(m.group(1))))
+            start = None
+    return out
+
+
+def plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    target: float = 300.0,
+    search_window: float = 60.0,
+    overlap: float = 1.5,
+) -> List[Dict[str, float]]:
+    """
+    规划分段，返回 [{"start","end","own_start","own_end"}]（秒）：
+    start/end 为实际截取范围（硬切处含重叠），own_start/own_end 为该段结果的归属区间。
+    """
+    mids = sorted((s + e) / 2.0 for s, e in silences if e > s)
+    cuts: List[Tuple[float, bool]] = []  # (切点, 是否硬切)
+    pos = 0.0
+    while duration - pos > target * 1.25:
+        ideal = pos + target
+        cands = [m for m in mids if abs(m - ideal) <= search_window and m - pos >= target * 0.5]
+        if cands:
+            cut = min(cands, key=lambda m: abs(m - ideal))
+            cuts.append((cut, False))
+        else:
+            cut = ideal
+            cuts.append((cut, True))
+        pos = cut
+
+    bounds = [(0.0, False)] + cuts + [(duration, False)]
+    chunks: List[Dict[str, float]] = []
+    for (a, hard_a), (b, hard_b) in zip(bounds, bounds[1:]):
+        chunks.append({
+            "start": max(0.0, a - overlap) if hard_a else a,
+            "end": min(duration, b + overlap) if hard_b else b,
+            "own_start": a,
+            "own_end": b,
+        })
+    return chunks
+
+
+def _shift_times(u: Dict[str, Any], offset_ms: int) -> Dict[str, Any]:
+    out = dict(u)
+    for k in ("start_time", "end_time"):
+        if isinstance(out.get(k), (int, float)):
+            out[k] = int(out[k]) + offset_ms
+    if isinstance(out.get("words"), list):
+        out["words"] = [_shift_times(w, offset_ms) if isinstance(w, dict) else w for w in out["words"]]
+    return out
+
+
+def stitch_utterances(parts: List[Tuple[Dict[str, float], List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    按分段起点平移时间轴并拼接；每段只保留中点落在归属区间内的句子，
+    再去掉与前一句文本相同且时间重叠的重复句（重叠区两段都识别出同一句时）。
+    """
+    merged: List[Dict[str, Any]] = []
+    for i, (chunk, utterances) in enumerate(parts):
+        offset_ms = int(round(chunk["start"] * 1000))
+        own_start = int(round(chunk["own_start"] * 1000))
+        own_end = int(round(chunk["own_end"] * 1000))
+        last = i == len(parts) - 1
+        for u in utterances or []:
+            if not isinstance(u, dict):
+                continue
+            su = _shift_times(u, offset_ms)
+            mid = (int(su.get("start_time") or 0) + int(su.get("end_time") or 0)) // 2
+            if mid < own_start or (mid >= own_end and not last):
+                continue
+            merged.append(su)
+    merged.sort(key=lambda u: (int(u.get("start_time") or 0), int(u.get("end_time") or 0)))
+    out: List[Dict[str, Any]] = []
+    for u in merged:
+        text = (u.get("text") or u.get("transcript") or "").strip()
+        if out:
+            prev = out[-1]
+            prev_text = (prev.get("text") or prev.get("transcript") or "").strip()
+            if text and text == prev_text and int(u.get("start_time") or 0) < int(prev.get("end_time") or 0):
+                continue
+        out.append(u)
+    return out
+
+
+def chunk_codec_args(profile: str, info: Optional[MediaInfo], source_suffix: str) -> Tuple[str, List[str]]:
+    """
+    分段输出的 (扩展名, 编码参数)：源音频编码/声道/采样率已符合后端档位时流复制（不重复有损编码），
+    否则按档位参数编码（码率与整轨提取一致，不高于源音频）。
+    """
+    suffix, args = ASR_AUDIO_PROFILES.get(profile) or ASR_AUDIO_PROFILES["speech_mp3"]
+    codec = info.audio_codec if info else None
+    if codec and codec == _PROFILE_CODECS.get(profile):
+        if profile in ("aac_copy", "mp3_hq") or (info.channels == 1 and (info.sample_rate or 0) <= 16000):
+            return source_suffix or suffix, ["-acodec", "copy"]
+    return suffix, list(args)
+
+
+async def _cut_chunk(audio_path: str, start: float, end: float, out_path: Path, codec_args: List[str]) -> None:
+    """截取分段；流复制时切点对齐到音频帧（误差为单帧时长，远小于句子时长）"""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-t", f"{max(0.05, end - start):.3f}",
+        "-i", audio_path,
+        "-vn", *codec_args,
+        "-y", str(out_path),
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0 or not out_path.exists():
+        raise RuntimeError(f"音频分段失败: {stderr.decode(errors='ignore')[-300:]}")
+
+
+class ChunkedASR(BaseASR):
+    """
+    分段并行识别编排器。识别结果与后端整段识别等价，缓存键沿用后端的键（同一指纹命中同一结果）；
+    各分段以 "<指纹>#<起止毫秒>" 单独缓存，部分分段失败后重试时只重跑失败的分段；整段结果写入缓存后移除分段条目。
+    """
+
+    def __init__(self, audio_path: str, use_cache: bool = True, fingerprint: Optional[str] = None,
+                 backend: Type[BaseASR] = BcutASR, backend_kwargs: Optional[Dict[str, Any]] = None):
+        super().__init__(audio_path, use_cache=use_cache, fingerprint=fingerprint)
+        self.backend = backend
+        self.backend_kwargs = backend_kwargs or {}
+        self.MODEL_ID = backend.MODEL_ID
+        self.chunk_seconds = max(30.0, _env_float("ASR_CHUNK_SECONDS", 300.0))
+        self.overlap = max(0.0, _env_float("ASR_CHUNK_OVERLAP", 1.5))
+        self.concurrency = max(1, _env_int("ASR_CHUNK_CONCURRENCY", 4))
+        self.retries = max(0, _env_int("ASR_CHUNK_RETRIES", 1))
+        self._chunk_keys: List[str] = []
+
+    def _get_key(self) -> str:
+        return self.backend.cache_key_for(self.content_fingerprint())
+
+    def _write_cache(self, data: dict) -> None:
+        super()._write_cache(data)
+        if self.use_cache and self._chunk_keys:
+            asr_result_cache.discard(self._chunk_keys)
+            self._chunk_keys = []
+
+    def _run(self, callback: Optional[Callable] = None) -> dict:
+        return asyncio.run(self._run_async(callback))
+
+    async def _run_async(self, callback: Optional[Callable] = None) -> dict:
+        def _notify(progress: int, message: str) -> None:
+            if callback:
+                try:
+                    callback(progress, message)
+                except Exception:
+                    pass
+
+        audio_path = str(self.file_path) if self.file_path else None
+        info = await media_probe.probe(audio_path) if audio_path else None
+        duration = float((info.duration("audio") if info else None) or 0.0)
+        if not audio_path or duration <= self.chunk_seconds * 1.25:
+            # 短音频：整段交给后端（结果由本实例统一写缓存）
+            asr = self.backend(self.audio_path, use_cache=False, **self.backend_kwargs)
+            return await asr._run_async(callback)
+
+        silences = await detect_silences(audio_path)
+        chunks = plan_chunks(duration, silences, target=self.chunk_seconds, overlap=self.overlap)
+        hard = sum(1 for a, b in zip(chunks, chunks[1:]) if a["end"] > b["start"])
+        logger.info(
+            f"分段识别: 时长 {duration:.0f}s, {len(silences)} 处静音, {len(chunks)} 段（{hard} 处硬切）, 并发 {self.concurrency}"
+        )
+        _notify(20, f"音频已切分为 {len(chunks)} 段，开始并行识别...")
+
+        # 未传指纹时退化为整段 CRC32，在线程中计算以免阻塞事件循环
+        base_fp = self.fingerprint or await asyncio.to_thread(self.content_fingerprint)
+        profile = getattr(self.backend, "AUDIO_PROFILE", "speech_mp3")
+        part_suffix, codec_args = chunk_codec_args(profile, info, Path(audio_path).suffix.lower())
+        logger.info(f"分段音频: {'流复制' if codec_args == ['-acodec', 'copy'] else '按 ' + profile + ' 编码'}")
+        self._chunk_keys = [
+            self.backend.cache_key_for(f"{base_fp}#{int(c['start'] * 1000)}-{int(c['end'] * 1000)}") for c in chunks
+        ]
+        work_dir = Path(tempfile.mkdtemp(prefix="asr_chunks_"))
+        sem = asyncio.Semaphore(self.concurrency)
+        done = {"n": 0}
+
+        async def _one(i: int, chunk: Dict[str, float]) -> List[Dict[str, Any]]:
+            async with sem:
+                fp = f"{base_fp}#{int(chunk['start'] * 1000)}-{int(chunk['end'] * 1000)}"
+                part_path = work_dir / f"part_{i:04d}{part_suffix}"
+                last_error: Optional[BaseException] = None
+                for attempt in range(self.retries + 1):
+                    try:
+                        if not part_path.exists():
+                            await _cut_chunk(audio_path, chunk["start"], chunk["end"], part_path, codec_args)
+                        asr = self.backend(str(part_path), use_cache=self.use_cache, fingerprint=fp, **self.backend_kwargs)
+                        data = await asr.run_async()
+                        break
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"分段 {i} 识别失败（第 {attempt + 1} 次）: {e}")
+                else:
+                    raise RuntimeError(f"分段 {i} 识别失败: {last_error}")
+                done["n"] += 1
+                _notify(20 + int(75 * done["n"] / len(chunks)), f"已完成 {done['n']}/{len(chunks)} 段识别")
+                return list(data.get("utterances") or [])
+
+        tasks = [asyncio.ensure_future(_one(i, c)) for i, c in enumerate(chunks)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一分段最终失败即整体失败：先取消其余分段，再清理临时目录
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        utterances = stitch_utterances(list(zip(chunks, results)))
+        _notify(95, "分段识别完成，合并结果...")
+        return {"utterances": utterances, "chunks": len(chunks)}
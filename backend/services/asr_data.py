@@ -3,6 +3,8 @@ import re
 from typing import List, Tuple
 from pathlib import Path
 
+from modules.subtitle_parser import iter_cues
+
 
 class ASRDataSeg:
     def __init__(self, text, start_time, end_time):
@@ -310,37 +312,11 @@ def from_srt(srt_str: str) -> 'ASRData':
     :param srt_str: 包含SRT格式字幕的字符串。
     :return: 解析后的ASRData实例。
     """
-    segments = []
-    srt_time_pattern = re.compile(
-        r'(\d{2}):(\d{2}):(\d{1,2})[.,](\d{3})\s-->\s(\d{2}):(\d{2}):(\d{1,2})[.,](\d{3})'
-    )
-
-    for block in re.split(r'\n\s*\n', srt_str.strip()):
-        lines = block.splitlines()
-        if len(lines) < 3:
-            continue
-
-        match = srt_time_pattern.match(lines[1])
-        if not match:
-            continue
-
-        time_parts = list(map(int, match.groups()))
-        start_time = sum([
-            time_parts[0] * 3600000,
-            time_parts[1] * 60000,
-            time_parts[2] * 1000,
-            time_parts[3]
-        ])
-        end_time = sum([
-            time_parts[4] * 3600000,
-            time_parts[5] * 60000,
-            time_parts[6] * 1000,
-            time_parts[7]
-        ])
-
-        text = '\n'.join(lines[2:]).strip()
-        segments.append(ASRDataSeg(text, start_time, end_time))
-
+    segments = [
+        ASRDataSeg(cue.text.strip(), cue.start_ms, cue.end_ms)
+        for cue in iter_cues(srt_str)
+        if cue.text.strip()
+    ]
     return ASRData(segments)
 
 
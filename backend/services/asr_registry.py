@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音识别后端注册表
+
+- bcut：必剪在线识别（默认）
+- whisper：faster-whisper 本地离线识别（可选依赖）
+选择优先级：项目设置 asr_backend > 环境变量 ASR_BACKEND > bcut
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Type
+
+from .asr_base import BaseASR
+from .asr_bcut import BcutASR
+from .asr_whisper import LocalWhisperASR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ASR_BACKEND = "bcut"
+
+ASR_BACKENDS: Dict[str, Type[BaseASR]] = {
+    "bcut": BcutASR,
+    "whisper": LocalWhisperASR,
+}
+
+
+def get_asr_backend(name: Optional[str]) -> Type[BaseASR]:
+    """按名称获取后端类，未知名称抛出 ValueError"""
+    key = (name or DEFAULT_ASR_BACKEND).strip().lower()
+    cls = ASR_BACKENDS.get(key)
+    if cls is None:
+        raise ValueError(f"未知的语音识别后端: {name}（可选：{', '.join(ASR_BACKENDS)}）")
+    return cls
+
+
+def get_available_asr_backends() -> List[Dict[str, Any]]:
+    """列出已注册后端及其本地可用性（不发起网络检测）"""
+    out: List[Dict[str, Any]] = []
+    for name, cls in ASR_BACKENDS.items():
+        is_available = getattr(cls, "is_available", None)
+        out.append({
+            "name": name,
+            "class": cls.__name__,
+            "model_id": cls.MODEL_ID,
+            "available": bool(is_available()) if callable(is_available) else True,
+            "default": name == DEFAULT_ASR_BACKEND,
+        })
+    return out
+
+
+def resolve_asr_backend(project: Any = None) -> str:
+    """确定项目使用的后端名称；配置无效时回退默认后端"""
+    for cand in (getattr(project, "asr_backend", None), os.getenv("ASR_BACKEND")):
+        key = (cand or "").strip().lower()
+        if not key:
+            continue
+        if key in ASR_BACKENDS:
+            return key
+        logger.warning(f"未知的语音识别后端配置 {cand!r}，回退为 {DEFAULT_ASR_BACKEND}")
+    return DEFAULT_ASR_BACKEND
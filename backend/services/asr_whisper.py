@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地离线语音识别（faster-whisper，可选依赖）
+
+在独立进程池中运行 CPU 推理（ASR_WHISPER_WORKERS，默认 1 个进程，模型常驻），不占用事件循环与主进程 GIL；
+识别过程中逐句回传部分结果（on_utterance）并按已处理时长上报进度，完成后记录实时率（RTF = 耗时 / 音频时长）。
+吞吐由本机算力与进程数决定，不受远端排队影响。
+
+环境变量：
+- ASR_WHISPER_MODEL：模型名或本地路径（默认 small）
+- ASR_WHISPER_DEVICE / ASR_WHISPER_COMPUTE_TYPE：默认 cpu / int8
+- ASR_WHISPER_LANGUAGE：默认 zh，留空为自动检测
+- ASR_WHISPER_BEAM_SIZE / ASR_WHISPER_CPU_THREADS
+"""
+
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue as queue_mod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from modules import whisper_worker
+from .asr_base import BaseASR
+from .asr_data import ASRDataSeg
+
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL = os.getenv("ASR_WHISPER_MODEL", "small") or "small"
+WHISPER_COMPUTE_TYPE = os.getenv("ASR_WHISPER_COMPUTE_TYPE", "int8") or "int8"
+WHISPER_LANGUAGE = os.getenv("ASR_WHISPER_LANGUAGE", "zh")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_mp_manager = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn：子进程不继承事件循环/线程状态，各平台行为一致
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, _env_int("ASR_WHISPER_WORKERS", 1)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    """进程池损坏（工作进程崩溃/被杀）后丢弃，下次识别时重建"""
+    global _executor
+    if _executor is broken:
+        _executor = None
+    try:
+        broken.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def _get_mp_manager():
+    global _mp_manager
+    if _mp_manager is None:
+        _mp_manager = multiprocessing.get_context("spawn").Manager()
+    return _mp_manager
+
+
+def shutdown_whisper_pool() -> None:
+    """关闭进程池（应用退出时调用）"""
+    global _executor, _mp_manager
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _mp_manager is not None:
+        try:
+            _mp_manager.shutdown()
+        except Exception:
+            pass
+        _mp_manager = None
+
+
+class LocalWhisperASR(BaseASR):
+    """faster-whisper 本地识别"""
+
+    # 模型、量化方式、语言与束宽不同则识别结果不同，参与缓存键
+    MODEL_ID = (
+        f"faster-whisper/{WHISPER_MODEL}/{WHISPER_COMPUTE_TYPE}"
+        f"/{WHISPER_LANGUAGE or 'auto'}/beam{max(1, _env_int('ASR_WHISPER_BEAM_SIZE', 1))}"
+    )
+    # 本地解码任意格式并自行重采样：源音轨为 AAC 时直接流复制，省去转码
+    AUDIO_PROFILE = "aac_copy"
+
+    def __init__(self, audio_path: str, use_cache: bool = True, fingerprint: Optional[str] = None,
+                 on_utterance: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        super().__init__(audio_path, use_cache=use_cache, fingerprint=fingerprint)
+        if not isinstance(audio_path, str):
+            raise TypeError("本地识别仅支持音频文件路径")
+        self.on_utterance = on_utterance
+        self.stats: Dict[str, Any] = {}
+
+    @staticmethod
+    def is_available() -> bool:
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    @staticmethod
+    def test_connection(timeout: int = 6) -> dict:
+        if LocalWhisperASR.is_available():
+            return {"success": True, "model": WHISPER_MODEL}
+        return {"success": False, "error": "未安装 faster-whisper（pip install faster-whisper）"}
+
+    @staticmethod
+    async def test_connection_async(timeout: int = 6) -> dict:
+        return LocalWhisperASR.test_connection(timeout)
+
+    @staticmethod
+    def _options() -> Dict[str, Any]:
+        return {
+            "model": WHISPER_MODEL,
+            "device": os.getenv("ASR_WHISPER_DEVICE", "cpu") or "cpu",
+            "compute_type": WHISPER_COMPUTE_TYPE,
+            "language": WHISPER_LANGUAGE,
+            "beam_size": max(1, _env_int("ASR_WHISPER_BEAM_SIZE", 1)),
+            "cpu_threads": _env_int("ASR_WHISPER_CPU_THREADS", 0),
+            "vad_filter": True,
+        }
+
+    def _run(self, callback: Optional[Callable] = None) -> dict:
+        return asyncio.run(self._run_async(callback))
+
+    async def _run_async(self, callback: Optional[Callable] = None) -> dict:
+        def _notify(progress: int, message: str) -> None:
+            if callback:
+                try:
+                    callback(progress, message)
+                except Exception:
+                    pass
+
+        if not self.is_available():
+            raise RuntimeError("未安装 faster-whisper，无法使用本地识别")
+        loop = asyncio.get_running_loop()
+        mgr = _get_mp_manager()
+        q = mgr.Queue()
+        cancel = mgr.Event()
+        _notify(5, f"本地识别（{WHISPER_MODEL}）加载模型...")
+        executor = _get_executor()
+        try:
+            fut = loop.run_in_executor(
+                executor, whisper_worker.transcribe, str(self.file_path), self._options(), q, cancel
+            )
+        except BrokenProcessPool:
+            # 上一次识别时工作进程已崩溃：重建进程池后提交
+            _reset_executor(executor)
+            executor = _get_executor()
+            fut = loop.run_in_executor(
+                executor, whisper_worker.transcribe, str(self.file_path), self._options(), q, cancel
+            )
+        total_s: Optional[float] = None
+        count = 0
+        try:
+            while True:
+                finished = fut.done()
+                try:
+                    kind, u, pos_s = await asyncio.to_thread(q.get, True, 0.5)
+                except queue_mod.Empty:
+                    if finished:
+                        break
+                    continue
+                if kind == "info":
+                    total_s = float(u.get("duration") or 0.0) or None
+                    _notify(10, "本地识别中...")
+                    continue
+                if kind != "utterance":
+                    continue
+                count += 1
+                if self.on_utterance is not None:
+                    try:
+                        res = self.on_utterance(u)
+                        if asyncio.iscoroutine(res):
+                            await res
+                    except Exception as e:
+                        logger.debug(f"部分结果回调失败: {e}")
+                if total_s:
+                    _notify(10 + int(85 * min(1.0, pos_s / total_s)), f"本地识别中：已识别 {count} 句")
+            result = await fut
+        except BrokenProcessPool:
+            _reset_executor(executor)
+            raise RuntimeError("本地识别进程异常退出（可能内存不足），已重置进程池，请重试")
+        except BaseException:
+            # 取消/失败：通知子进程在下一句处停止，避免进程池被无主任务长期占用
+            try:
+                cancel.set()
+            except Exception:
+                pass
+            raise
+
+        self.stats = {k: result.get(k) for k in ("duration", "elapsed", "model_load", "rtf", "language")}
+        logger.info(
+            f"本地识别完成: {len(result['utterances'])} 句, 音频 {result.get('duration') or 0:.0f}s, "
+            f"耗时 {result.get('elapsed') or 0:.1f}s, RTF {result.get('rtf')}"
+        )
+        _notify(95, f"本地识别完成（RTF {result.get('rtf')}）")
+        return {"utterances": result["utterances"], "rtf": result.get("rtf"), "engine": self.MODEL_ID}
+
+    def _make_segments(self, resp_data: dict):
+        return [ASRDataSeg(u.get('transcript') or '', u['start_time'], u['end_time']) for u in resp_data['utterances']]
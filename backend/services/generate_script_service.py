@@ -3,7 +3,6 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-import re
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -12,11 +11,14 @@ import cv2
 from fastapi import HTTPException
 
 from modules.projects_store import projects_store, Project
-from modules.video_processor import video_processor
+from modules.video_processor import ASR_AUDIO_PROFILES, video_processor
+from modules.ai.tracing import llm_tracer
+from modules.subtitle_parser import Cue, compress_cues, load_segments
+from modules.asr_cache import asr_result_cache, pcm_fingerprint, source_fingerprint
 from modules.ws_manager import manager
 from services.script_generation_service import ScriptGenerationService
-from services.asr_bcut import BcutASR
-from services.asr_utils import utterances_to_srt
+from services.asr_chunked import ChunkedASR
+from services.asr_registry import get_asr_backend, resolve_asr_backend
 from modules.config.content_model_config import content_model_config_manager
 from modules.config.tts_config import tts_engine_config_manager
 from modules.config.video_model_config import video_model_config_manager
@@ -58,91 +60,21 @@ def _resolve_path(path_str: str) -> Path:
     return Path(s)
 
 
-def _compress_srt(content: str) -> str:
-    text = content.replace("\r\n", "\n").replace("\r", "\n").lstrip("\ufeff")
-    blocks = [b for b in text.split("\n\n") if b.strip()]
-    out_lines: List[str] = []
-    for b in blocks:
-        lines = [ln.strip() for ln in b.splitlines() if ln.strip()]
-        if not lines:
-            continue
-        timing_i = None
-        for i, ln in enumerate(lines[:3]):
-            if "-->" in ln:
-                timing_i = i
-                break
-        if timing_i is None:
-            continue
-        parts = lines[timing_i].split("-->")
-        if len(parts) < 2:
-            continue
-        start = parts[0].strip()
-        end = parts[1].strip()
-        text_lines = lines[timing_i + 1:]
-        t = " ".join(text_lines)
-        t = re.sub(r"\s+", " ", t).strip()
-        t = re.sub(r"<[^>]+>", "", t)
-        if not t:
-            continue
-        out_lines.append(f"[{start}-{end}] {t}")
-    return ("\n".join(out_lines) + ("\n" if out_lines else ""))
+def _replace_project_audio(project_id: str, old_web_path: Optional[str], audio_abs: Path) -> None:
+    """记录项目的识别音频；此前提取到 uploads/audios 的旧音频不再被引用，一并删除"""
+    projects_store.update_project(project_id, {"audio_path": _to_web_path(audio_abs)})
+    if not old_web_path:
+        return
+    try:
+        old_abs = _resolve_path(old_web_path).resolve()
+        if old_abs != audio_abs.resolve() and old_abs.parent == (_uploads_dir() / "audios").resolve():
+            old_abs.unlink(missing_ok=True)
+    except Exception as e:
+        logger.debug(f"删除旧识别音频失败: {e}")
 
 
 def _parse_srt(srt_path: Path) -> List[Dict[str, Any]]:
-    def _parse_ts(ts: str) -> float:
-        h, m, rest = ts.split(":")
-        s, ms = rest.split(",")
-        return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000.0
-
-    segments: List[Dict[str, Any]] = []
-    try:
-        content = srt_path.read_text(encoding="utf-8", errors="ignore")
-        norm = content.replace("\r\n", "\n").replace("\r", "\n").strip()
-        lines = [ln.strip() for ln in norm.splitlines() if ln.strip()]
-        bracket_pattern = re.compile(r"^\[(\d{2}:\d{2}:\d{2},\d{3})-(\d{2}:\d{2}:\d{2},\d{3})\]\s*(.+)$")
-        bracket_matches = [bracket_pattern.match(ln) for ln in lines]
-        if any(bracket_matches):
-            idx = 1
-            for m in bracket_matches:
-                if not m:
-                    continue
-                start_str, end_str, text = m.groups()
-                start_t = _parse_ts(start_str)
-                end_t = _parse_ts(end_str)
-                segments.append({
-                    "id": str(idx),
-                    "start_time": float(start_t),
-                    "end_time": float(end_t),
-                    "text": text,
-                    "subtitle": text,
-                })
-                idx += 1
-        else:
-            blocks = [b.strip() for b in norm.split("\n\n") if b.strip()]
-            for idx, block in enumerate(blocks, start=1):
-                ls = [l for l in block.splitlines() if l.strip()]
-                if len(ls) < 2:
-                    continue
-                timing_line = ls[1] if "-->" in ls[1] else ls[0]
-                if "-->" not in timing_line:
-                    continue
-                start_str, end_str = [t.strip() for t in timing_line.split("-->")]
-                start_t = _parse_ts(start_str)
-                end_t = _parse_ts(end_str)
-                text_lines = ls[2:] if timing_line == ls[1] else ls[1:]
-                text = " ".join([ln.strip() for ln in text_lines if ln.strip()])
-                if not text:
-                    text = f"字幕段{idx}"
-                segments.append({
-                    "id": str(idx),
-                    "start_time": float(start_t),
-                    "end_time": float(end_t),
-                    "text": text,
-                    "subtitle": text,
-                })
-    except Exception:
-        pass
-    return segments
+    return load_segments(srt_path)
 
 
 def _read_video_duration(video_path: Path) -> float:
@@ -327,7 +259,8 @@ async def _ensure_models_ready_for_script(project_id: Optional[str] = None) -> N
 
 class GenerateScriptService:
     @staticmethod
-    async def generate_script(project_id: str, video_path: str, subtitle_path: Optional[str], narration_type: str) -> Dict[str, Any]:
+    async def generate_script(project_id: str, video_path: str, subtitle_path: Optional[str], narration_type: str,
+                              use_cache: bool = True) -> Dict[str, Any]:
         p: Optional[Project] = projects_store.get_project(project_id)
         if not p:
             try:
@@ -416,124 +349,209 @@ class GenerateScriptService:
 
         if not sub_abs:
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # 识别结果缓存：源视频内容指纹命中时跳过 ASR 服务检测、音频提取与识别
+            data: Optional[Dict[str, Any]] = None
+            src_key: Optional[str] = None
+            asr_backend_name = resolve_asr_backend(p)
+            asr_cls = get_asr_backend(asr_backend_name)
             try:
-                await manager.broadcast(json.dumps({
-                    "type": "progress",
-                    "scope": "generate_script",
-                    "project_id": project_id,
-                    "phase": "validating_asr",
-                    "message": "正在验证ASR服务是否可用",
-                    "progress": 25,
-                    "timestamp": _now_ts(),
-                }))
-            except Exception:
-                pass
-
-            asr_check = await _run_in_thread(BcutASR.test_connection)
-            if not asr_check.get("success", False):
+                src_fp = await asyncio.to_thread(source_fingerprint, video_abs)
+                src_key = asr_cls.cache_key_for(src_fp)
+                data = await asr_result_cache.aget(src_key)
+            except Exception as e:
+                logger.warning(f"计算源视频指纹失败，跳过识别缓存查询: {e}")
+            if data is not None:
                 try:
                     await manager.broadcast(json.dumps({
-                        "type": "error",
+                        "type": "progress",
+                        "scope": "generate_script",
+                        "project_id": project_id,
+                        "phase": "asr_cache_hit",
+                        "message": "命中语音识别缓存，跳过音频提取与识别",
+                        "progress": 55,
+                        "timestamp": _now_ts(),
+                    }))
+                except Exception:
+                    pass
+            else:
+                try:
+                    await manager.broadcast(json.dumps({
+                        "type": "progress",
                         "scope": "generate_script",
                         "project_id": project_id,
-                        "phase": "asr_unavailable",
-                        "message": asr_check.get("error") or asr_check.get("message") or "ASR服务不可用",
+                        "phase": "validating_asr",
+                        "message": "正在验证ASR服务是否可用",
+                        "progress": 25,
                         "timestamp": _now_ts(),
                     }))
                 except Exception:
                     pass
-                raise HTTPException(status_code=400, detail=asr_check.get("error") or asr_check.get("message") or "ASR服务不可用")
 
-            audio_abs: Optional[Path] = None
-            if getattr(p, "audio_path", None):
-                a_cand = _resolve_path(p.audio_path)
-                if a_cand.exists():
-                    audio_abs = a_cand
+                asr_check = await asr_cls.test_connection_async()
+                if not asr_check.get("success", False):
+                    try:
+                        await manager.broadcast(json.dumps({
+                            "type": "error",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "asr_unavailable",
+                            "message": asr_check.get("error") or asr_check.get("message") or "ASR服务不可用",
+                            "timestamp": _now_ts(),
+                        }))
+                    except Exception:
+                        pass
+                    raise HTTPException(status_code=400, detail=asr_check.get("error") or asr_check.get("message") or "ASR服务不可用")
+
+                audio_abs: Optional[Path] = None
+                # 识别音频格式由后端决定：必剪只收 MP3；本地引擎可直接使用流复制的 AAC
+                audio_profile = asr_cls.AUDIO_PROFILE
+                # 上传/合并完成后已在后台按当前视频预提取时优先取用（未完成则等待同一任务）
+                prefetched = await video_processor.take_prefetched_asr_audio(str(video_abs), audio_profile, owner=project_id)
+                if prefetched:
+                    audio_abs = Path(prefetched)
+                    _replace_project_audio(project_id, getattr(p, "audio_path", None), audio_abs)
+                    try:
+                        await manager.broadcast(json.dumps({
+                            "type": "progress",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "audio_ready",
+                            "message": "已使用上传后预提取的音频",
+                            "progress": 40,
+                            "timestamp": _now_ts(),
+                        }))
+                    except Exception:
+                        pass
+                elif getattr(p, "audio_path", None):
+                    a_cand = _resolve_path(p.audio_path)
+                    if a_cand.exists() and (
+                        audio_profile == "aac_copy"
+                        or a_cand.suffix.lower() == ASR_AUDIO_PROFILES.get(audio_profile, (".mp3",))[0]
+                    ):
+                        audio_abs = a_cand
+                        try:
+                            await manager.broadcast(json.dumps({
+                                "type": "progress",
+                                "scope": "generate_script",
+                                "project_id": project_id,
+                                "phase": "audio_exists",
+                                "message": "已存在提取音频，跳过音频提取",
+                                "progress": 35,
+                                "timestamp": _now_ts(),
+                            }))
+                        except Exception:
+                            pass
+
+                if not audio_abs:
+                    audio_stem = _uploads_dir() / "audios" / f"{project_id}_audio_{ts}"
+                    try:
+                        await manager.broadcast(json.dumps({
+                            "type": "progress",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "extract_audio",
+                            "message": "正在提取音频",
+                            "progress": 30,
+                            "timestamp": _now_ts(),
+                        }))
+                    except Exception:
+                        pass
+                    out_audio = await video_processor.extract_audio_for_asr(str(video_abs), str(audio_stem), audio_profile)
+                    if not out_audio:
+                        try:
+                            await manager.broadcast(json.dumps({
+                                "type": "error",
+                                "scope": "generate_script",
+                                "project_id": project_id,
+                                "phase": "extract_audio_failed",
+                                "message": "音频提取失败",
+                                "timestamp": _now_ts(),
+                            }))
+                        except Exception:
+                            pass
+                        raise HTTPException(status_code=500, detail="音频提取失败")
                     try:
                         await manager.broadcast(json.dumps({
                             "type": "progress",
                             "scope": "generate_script",
                             "project_id": project_id,
-                            "phase": "audio_exists",
-                            "message": "已存在提取音频，跳过音频提取",
-                            "progress": 35,
+                            "phase": "audio_ready",
+                            "message": "音频提取完成",
+                            "progress": 40,
                             "timestamp": _now_ts(),
                         }))
                     except Exception:
                         pass
+                    audio_out = Path(out_audio)
+                    _replace_project_audio(project_id, getattr(p, "audio_path", None), audio_out)
+                    audio_abs = audio_out
 
-            if not audio_abs:
-                audio_out = _uploads_dir() / "audios" / f"{project_id}_audio_{ts}.mp3"
-                try:
-                    await manager.broadcast(json.dumps({
-                        "type": "progress",
-                        "scope": "generate_script",
-                        "project_id": project_id,
-                        "phase": "extract_audio",
-                        "message": "正在提取音频",
-                        "progress": 30,
-                        "timestamp": _now_ts(),
-                    }))
-                except Exception:
-                    pass
-                ok_audio = await video_processor.extract_audio_mp3(str(video_abs), str(audio_out))
-                if not ok_audio:
+                async def _asr_partial(u: Dict[str, Any]) -> None:
                     try:
                         await manager.broadcast(json.dumps({
-                            "type": "error",
+                            "type": "asr_partial",
                             "scope": "generate_script",
                             "project_id": project_id,
-                            "phase": "extract_audio_failed",
-                            "message": "音频提取失败",
+                            "utterance": u,
                             "timestamp": _now_ts(),
                         }))
                     except Exception:
                         pass
-                    raise HTTPException(status_code=500, detail="音频提取失败")
+
+                # 音频按解码后 PCM 指纹缓存：重新提取得到的 MP3 字节不同也能命中
+                # 远端服务：长音频在静音处切分后并行识别；本地引擎：整段流式识别并逐句推送部分结果
+                audio_fp = await pcm_fingerprint(audio_abs)
+                if asr_cls.CHUNKED:
+                    asr = ChunkedASR(str(audio_abs), fingerprint=audio_fp, backend=asr_cls)
+                else:
+                    asr = asr_cls(str(audio_abs), fingerprint=audio_fp, on_utterance=_asr_partial)
+
+                def _asr_progress(progress: int, message: str) -> None:
+                    try:
+                        asyncio.ensure_future(manager.broadcast(json.dumps({
+                            "type": "progress",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "asr_running",
+                            "message": message,
+                            # 识别内部进度 0-100 映射到整体 45-58
+                            "progress": 45 + int(max(0, min(100, progress)) * 0.13),
+                            "timestamp": _now_ts(),
+                        })))
+                    except Exception:
+                        pass
                 try:
                     await manager.broadcast(json.dumps({
                         "type": "progress",
                         "scope": "generate_script",
                         "project_id": project_id,
-                        "phase": "audio_ready",
-                        "message": "音频提取完成",
-                        "progress": 40,
+                        "phase": "asr_start",
+                        "message": f"正在提取视频字幕（ASR: {asr_backend_name}）",
+                        "progress": 45,
                         "timestamp": _now_ts(),
                     }))
                 except Exception:
                     pass
-                web_audio_path = _to_web_path(audio_out)
-                projects_store.update_project(project_id, {"audio_path": web_audio_path})
-                audio_abs = audio_out
-
-            asr = BcutASR(str(audio_abs))
-            try:
-                await manager.broadcast(json.dumps({
-                    "type": "progress",
-                    "scope": "generate_script",
-                    "project_id": project_id,
-                    "phase": "asr_start",
-                    "message": "正在提取视频字幕（ASR）",
-                    "progress": 45,
-                    "timestamp": _now_ts(),
-                }))
-            except Exception:
-                pass
-            try:
-                data = asr.run()
-            except Exception as e:
                 try:
-                    await manager.broadcast(json.dumps({
-                        "type": "error",
-                        "scope": "generate_script",
-                        "project_id": project_id,
-                        "phase": "asr_exception",
-                        "message": f"语音识别服务异常：{str(e)}",
-                        "timestamp": _now_ts(),
-                    }))
-                except Exception:
-                    pass
-                raise HTTPException(status_code=500, detail="语音识别失败")
+                    # 异步识别：上传/轮询不阻塞事件循环，请求取消时随之中止
+                    data = await asr.run_async(callback=_asr_progress)
+                except Exception as e:
+                    try:
+                        await manager.broadcast(json.dumps({
+                            "type": "error",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "asr_exception",
+                            "message": f"语音识别服务异常：{str(e)}",
+                            "timestamp": _now_ts(),
+                        }))
+                    except Exception:
+                        pass
+                    raise HTTPException(status_code=500, detail="语音识别失败")
+                if isinstance(data, dict) and data.get("rtf") is not None:
+                    logger.info(f"语音识别实时率（{asr_backend_name}）: RTF={data.get('rtf')}")
+                if src_key:
+                    await asr_result_cache.aput(src_key, data, meta={"backend": asr_cls.__name__, "model_id": asr_cls.MODEL_ID, "fingerprint": "source"})
 
             utterances = data.get("utterances") if isinstance(data, dict) else None
             if not isinstance(utterances, list) or not utterances:
@@ -550,8 +568,12 @@ class GenerateScriptService:
                     pass
                 raise HTTPException(status_code=500, detail="语音识别失败")
 
-            srt_text = utterances_to_srt(utterances)
-            srt_text = _compress_srt(srt_text)
+            # 识别结果直接生成压缩行格式（不再先拼 SRT 再解析）
+            srt_text = compress_cues(
+                Cue(i, int(u.get("start_time") or 0), int(u.get("end_time") or 0),
+                    (u.get("text") or u.get("transcript") or ""))
+                for i, u in enumerate(utterances, start=1) if isinstance(u, dict)
+            )
             srt_out = _uploads_dir() / "subtitles" / f"{project_id}_subtitle_{ts}.srt"
             srt_out.write_text(srt_text, encoding="utf-8")
             web_path = _to_web_path(srt_out)
@@ -604,10 +626,15 @@ class GenerateScriptService:
         except Exception:
             pass
 
+        # 本次运行的大模型调用追踪：其后创建的剧情分析/脚本生成任务继承该上下文
+        trace_run_id = llm_tracer.start_run(project_id)
+        trace_status = "failed"
         try:
             drama_name = p.name or "剧名"
             plot_analysis: str = ""
             reused_analysis = False
+            plot_run = None
+            analysis_task = None
             if getattr(p, "plot_analysis_path", None):
                 plot_abs_cand = _resolve_path(p.plot_analysis_path)
                 if plot_abs_cand.exists():
@@ -629,27 +656,36 @@ class GenerateScriptService:
                     }))
                 except Exception:
                     pass
-                plot_analysis = await ScriptGenerationService.generate_plot_analysis_pipeline(subtitle_text)
-                ts_pa = datetime.now().strftime("%Y%m%d_%H%M%S")
-                pa_out = _uploads_dir() / "analyses" / f"{project_id}_analysis_{ts_pa}.txt"
-                try:
-                    pa_out.write_text(plot_analysis, encoding="utf-8")
-                    web_pa = _to_web_path(pa_out)
-                    projects_store.update_project(project_id, {"plot_analysis_path": web_pa})
-                except Exception:
-                    pass
-                try:
-                    await manager.broadcast(json.dumps({
-                        "type": "progress",
-                        "scope": "generate_script",
-                        "project_id": project_id,
-                        "phase": "llm_analysis_done",
-                        "message": "字幕分析完成",
-                        "progress": 75,
-                        "timestamp": _now_ts(),
-                    }))
-                except Exception:
-                    pass
+                # 剧情点提取在后台进行；脚本生成的各时间窗口在覆盖它的剧情分块完成后即开始（流水线并行）
+                plot_run = ScriptGenerationService.start_plot_analysis(
+                    subtitle_text, project_id=project_id, use_cache=use_cache
+                )
+
+                async def _finish_analysis() -> str:
+                    text = await plot_run.text()
+                    ts_pa = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    pa_out = _uploads_dir() / "analyses" / f"{project_id}_analysis_{ts_pa}.txt"
+                    try:
+                        pa_out.write_text(text, encoding="utf-8")
+                        web_pa = _to_web_path(pa_out)
+                        projects_store.update_project(project_id, {"plot_analysis_path": web_pa})
+                    except Exception:
+                        pass
+                    try:
+                        await manager.broadcast(json.dumps({
+                            "type": "progress",
+                            "scope": "generate_script",
+                            "project_id": project_id,
+                            "phase": "llm_analysis_done",
+                            "message": "字幕分析完成",
+                            # 与脚本生成并行完成，不回退进度条
+                            "timestamp": _now_ts(),
+                        }))
+                    except Exception:
+                        pass
+                    return text
+
+                analysis_task = asyncio.ensure_future(_finish_analysis())
             else:
                 try:
                     await manager.broadcast(json.dumps({
@@ -676,12 +712,23 @@ class GenerateScriptService:
                 }))
             except Exception:
                 pass
-            script_json = await ScriptGenerationService.generate_script_json(
-                drama_name=drama_name,
-                plot_analysis=plot_analysis,
-                subtitle_content=subtitle_text,
-                project_id=project_id,
-            )
+            try:
+                script_json = await ScriptGenerationService.generate_script_json(
+                    drama_name=drama_name,
+                    plot_analysis=plot_analysis,
+                    subtitle_content=subtitle_text,
+                    project_id=project_id,
+                    plot_run=plot_run,
+                    use_cache=use_cache,
+                )
+                if analysis_task is not None:
+                    plot_analysis = await analysis_task
+            except BaseException:
+                if plot_run is not None:
+                    plot_run.cancel()
+                if analysis_task is not None and not analysis_task.done():
+                    analysis_task.cancel()
+                raise
             try:
                 await manager.broadcast(json.dumps({
                     "type": "progress",
@@ -722,6 +769,7 @@ class GenerateScriptService:
                 }))
             except Exception:
                 pass
+            trace_status = "completed"
             return {
                 "message": "解说脚本生成成功",
                 "data": {
@@ -747,6 +795,13 @@ class GenerateScriptService:
             except Exception:
                 pass
             raise HTTPException(status_code=500, detail=f"脚本生成失败: {str(e)}")
+        finally:
+            trace_path = llm_tracer.finish_run(trace_run_id, trace_status)
+            if trace_path is not None:
+                try:
+                    projects_store.update_project(project_id, {"llm_trace_path": _to_web_path(trace_path)})
+                except Exception:
+                    pass
 
 
 generate_script_service = GenerateScriptService()
@@ -12,20 +12,40 @@
 
 from __future__ import annotations
 
+import json
 import logging
+import os
 import re
-from typing import Any, Dict, List, Tuple
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import asyncio
 
 from modules.ai import ChatMessage
+from modules.ai.tracing import llm_tracer
 from modules.prompts.prompt_manager import prompt_manager
 from services.ai_service import ai_service
 from modules.json_sanitizer import sanitize_json_text_to_dict, validate_script_items
+from modules.plot_index import PlotPointIndex
+from modules.subtitle_parser import iter_cues
 from modules.projects_store import projects_store
+from modules.ws_manager import manager
 
 logger = logging.getLogger(__name__)
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except Exception:
+        return default
+
+
+# 剧情点提取：每约 PLOT_POINT_INPUT_TOKENS 个字幕 token 提取 1 个剧情点，单个剧情点 JSON 输出约 PLOT_POINT_OUTPUT_TOKENS
+PLOT_POINT_INPUT_TOKENS = max(50, _env_int("PLOT_POINT_INPUT_TOKENS", 400))
+PLOT_POINT_OUTPUT_TOKENS = max(20, _env_int("PLOT_POINT_OUTPUT_TOKENS", 160))
+PLOT_POINTS_MIN_PER_CHUNK = 3
+
+
 def _parse_timestamp_pair(ts_range: str) -> Tuple[float, float]:
     """将 "HH:MM:SS,mmm-HH:MM:SS,mmm" 解析为秒数对"""
     def _to_seconds(ts: str) -> float:
@@ -53,15 +73,67 @@ def _format_timestamp_range(start_s: float, end_s: float) -> str:
     return _format_timestamp(start_s) + "-" + _format_timestamp(end_s)
 
 
+class PlotAnalysisRun:
+    """
+    进行中的剧情分析：各字幕分块的剧情点提取任务及其覆盖的时间范围。
+    脚本生成可按时间窗口只等待相关分块（analysis_for_range），完整结果通过 text() 获取。
+    """
+
+    def __init__(self, tasks: List["asyncio.Future"], spans: List[Optional[Tuple[float, float]]]):
+        self.tasks = tasks
+        self.spans = spans
+        self._index: Optional[PlotPointIndex] = None
+
+    @staticmethod
+    def chunk_span(chunk: str) -> Optional[Tuple[float, float]]:
+        """分块内字幕的时间范围；无可识别的时间轴时返回 None（视为覆盖全片）"""
+        start_ms = end_ms = None
+        for cue in iter_cues(chunk or ""):
+            start_ms = cue.start_ms if start_ms is None else min(start_ms, cue.start_ms)
+            end_ms = cue.end_ms if end_ms is None else max(end_ms, cue.end_ms)
+        if start_ms is None:
+            return None
+        return start_ms / 1000.0, end_ms / 1000.0
+
+    @staticmethod
+    async def _merged_index(tasks: List["asyncio.Future"]) -> PlotPointIndex:
+        results = await asyncio.gather(*(asyncio.shield(t) for t in tasks))
+        points = [dict(p) for pts in results for p in (pts or [])]
+        return PlotPointIndex.from_dicts(ScriptGenerationService._merge_plot_points(points))
+
+    async def index_for_range(self, start_s: float, end_s: float) -> PlotPointIndex:
+        """等待与 [start_s, end_s] 重叠的分块完成，返回这些分块剧情点合并后的索引"""
+        return await self._merged_index([
+            self.tasks[i] for i, span in enumerate(self.spans)
+            if span is None or not (span[1] < start_s or span[0] > end_s)
+        ])
+
+    async def index(self) -> PlotPointIndex:
+        """全部分块完成后的完整剧情点索引"""
+        if self._index is None:
+            self._index = await self._merged_index(self.tasks)
+        return self._index
+
+    async def text(self) -> str:
+        """完整剧情分析文本（仅在需要写入文件或拼装提示词时渲染）"""
+        return (await self.index()).render()
+
+    def cancel(self) -> None:
+        for t in self.tasks:
+            if not t.done():
+                t.cancel()
+
+
 class ScriptGenerationService:
     """短剧脚本文案生成服务"""
 
     @staticmethod
-    async def generate_plot_analysis(subtitle_content: str) -> str:
+    async def generate_plot_analysis(subtitle_content: str, use_cache: bool = True) -> str:
         """
         调用模型生成爆点分析提取（plot_analysis）。
         使用指定系统提示词：
         "你是一位专业的剧本分析师和剧情概括助手。请仔细分析字幕内容，提取关键剧情信息。"
+        use_cache=False 时跳过大模型响应缓存（重新生成）。
         """
         system_prompt = (
             "你是一位专业的剧本分析师和剧情概括助手。请仔细分析字幕内容，提取关键剧情信息。"
@@ -76,68 +148,68 @@ class ScriptGenerationService:
                 ),
             ),
         ]
-        resp = await ai_service.send_chat(messages)
+        with llm_tracer.stage("plot_analysis"):
+            resp = await ai_service.send_chat(messages, use_cache=use_cache)
         return resp.content
 
     @staticmethod
-    def _chunk_text(
+    def _split_subtitle_units(text: str) -> Tuple[List[str], str]:
+        """按字幕边界拆分：SRT 以空行分隔的字幕块为单位，其他格式以行为单位；返回 (单元列表, 拼接分隔符)"""
+        text = str(text or "").strip()
+        if not text:
+            return [], "\n"
+        blocks = [b.strip() for b in re.split(r"\n\s*\n", text) if b.strip()]
+        if len(blocks) > 1:
+            return blocks, "\n\n"
+        return [ln for ln in text.splitlines() if ln.strip()], "\n"
+
+    @staticmethod
+    def _chunk_by_tokens(
         text: str,
-        chunk_chars_max: int = 15000,
+        budget_tokens: int,
+        count_tokens: Callable[[str], int],
         overlap_ratio: float = 0.12,
-        min_last_ratio: float = 0.4,
     ) -> List[str]:
-        text = str(text or "").strip()
-        if not text:
+        """
+        按 token 预算在字幕边界切块：先按总量求出最少块数，再按均分目标装箱（每块不超过预算），
+        相邻块之间回带约 overlap_ratio 比例的尾部字幕作为上下文重叠。
+        """
+        units, sep = ScriptGenerationService._split_subtitle_units(text)
+        if not units:
             return []
-        max_len = max(1000, int(chunk_chars_max))
-        overlap = max(0, int(max_len * overlap_ratio))
+        budget = max(1, int(budget_tokens))
+        overlap_budget = int(budget * max(0.0, min(0.5, overlap_ratio)))
+        sizes = [count_tokens(u) + 1 for u in units]
+        total = sum(sizes)
+        if total <= budget:
+            return [sep.join(units)]
+        stride = max(1, budget - overlap_budget)
+        n_chunks = max(2, -(-(total - overlap_budget) // stride))
+        target = min(budget, -(-total // n_chunks) + overlap_budget)
+
         chunks: List[str] = []
         i = 0
-        n = len(text)
+        n = len(units)
         while i < n:
-            end = min(n, i + max_len)
-            cand = text[i:end]
-            cut = len(cand)
-            for sep in ["\n\n", "\n", "。", "！", "？"]:
-                pos = cand.rfind(sep)
-                if pos >= int(max_len * 0.6):
-                    cut = pos + len(sep)
-                    break
-            chunk = cand[:cut]
-            chunks.append(chunk)
-            if end >= n:
+            j = i
+            used = 0
+            while j < n and (j == i or used + sizes[j] <= target):
+                used += sizes[j]
+                j += 1
+            chunks.append(sep.join(units[i:j]))
+            if j >= n:
                 break
-            i = i + cut - overlap if overlap > 0 else i + cut
-            if i < 0:
-                i = 0
-        if len(chunks) >= 2:
-            last_len = len(chunks[-1])
-            if last_len < int(max_len * min_last_ratio):
-                prev = chunks[-2]
-                needed = int(max_len * min_last_ratio) - last_len
-                movable = min(needed, int(max_len * 0.5), max(0, len(prev) // 2))
-                start_region = max(0, len(prev) - movable - int(max_len * 0.1))
-                cut_pos = max(start_region, len(prev) - movable)
-                for sep in ["\n\n", "\n", "。", "！", "？"]:
-                    pos = prev.rfind(sep, start_region)
-                    if pos != -1:
-                        cut_pos = pos + len(sep)
-                        break
-                move = prev[cut_pos:]
-                chunks[-2] = prev[:cut_pos]
-                chunks[-1] = move + chunks[-1]
-                if len(chunks[-2]) == 0:
-                    merged = chunks[-1]
-                    chunks = chunks[:-2]
-                    chunks.append(merged)
+            # 回带尾部字幕作为重叠，但保证前进
+            k = j
+            back = 0
+            while k - 1 > i and back + sizes[k - 1] <= overlap_budget:
+                k -= 1
+                back += sizes[k]
+            i = k
         return chunks
 
     @staticmethod
-    async def _extract_plot_points_for_chunk(
-        subtitle_chunk: str,
-        chunk_id: int,
-        max_points: int = 12,
-    ) -> List[Dict[str, Any]]:
+    def _plot_points_messages(subtitle_chunk: str, max_points: int) -> List[ChatMessage]:
         sys_prompt = (
             "你是一位专业的剧本分析师。请基于提供的字幕片段，提取包含时间范围的关键剧情爆点，严格输出JSON。"
         )
@@ -168,12 +240,28 @@ class ScriptGenerationService:
             + "\n字幕片段:\n\n"
             + subtitle_chunk
         )
-        messages = [
+        return [
             ChatMessage(role="system", content=sys_prompt),
             ChatMessage(role="user", content=user_prompt),
         ]
-        resp = await ai_service.send_chat(messages, response_format={"type": "json_object"})
-        data, _raw = sanitize_json_text_to_dict(resp.content)
+
+    @staticmethod
+    async def _extract_plot_points_for_chunk(
+        subtitle_chunk: str,
+        chunk_id: int,
+        max_points: int = 12,
+        project_id: Optional[str] = None,
+        use_cache: bool = True,
+    ) -> List[Dict[str, Any]]:
+        messages = ScriptGenerationService._plot_points_messages(subtitle_chunk, max_points)
+        with llm_tracer.stage("plot_points", chunk_id):
+            data = await ai_service.send_chat_json_stream(
+                messages,
+                array_keys=("plot_points",),
+                on_item=ScriptGenerationService._stream_progress(project_id, "llm_plot_points", f"剧情分块{chunk_id + 1}：已提取剧情点"),
+                response_format={"type": "json_object"},
+                use_cache=use_cache,
+            )
         items = data.get("plot_points") or []
         if not isinstance(items, list):
             items = []
@@ -203,6 +291,29 @@ class ScriptGenerationService:
             })
         return out
 
+    @staticmethod
+    def _stream_progress(project_id: Optional[str], phase: str, label: str) -> Callable[[Dict[str, Any]], Any]:
+        """流式条目回调：每收到一个闭合条目向前端推送一次进度（无项目ID时不推送）"""
+        counter = {"n": 0}
+
+        async def _on_item(_item: Dict[str, Any]) -> None:
+            counter["n"] += 1
+            if not project_id:
+                return
+            try:
+                await manager.broadcast(json.dumps({
+                    "type": "progress",
+                    "scope": "generate_script",
+                    "project_id": project_id,
+                    "phase": phase,
+                    "message": f"{label} {counter['n']} 条",
+                    "timestamp": datetime.now().isoformat(),
+                }))
+            except Exception:
+                pass
+
+        return _on_item
+
     @staticmethod
     def _normalize_title(s: str) -> str:
         return re.sub(r"\s+", "", str(s or "").lower())
@@ -248,157 +359,99 @@ class ScriptGenerationService:
 
     @staticmethod
     def _compose_plot_analysis_text(points: List[Dict[str, Any]]) -> str:
-        lines: List[str] = []
-        for i, pt in enumerate(points, start=1):
-            ts = str(pt.get("timestamp"))
-            title = str(pt.get("title"))
-            summary = str(pt.get("summary", ""))
-            kws = ",".join([str(k) for k in (pt.get("keywords") or [])])
-            line = (
-                "爆点{}：{}\n".format(i, title)
-                + "时间：{}\n".format(ts)
-                + "摘要：{}\n".format(summary)
-                + "关键词：{}\n".format(kws)
-            )
-            lines.append(line)
-        return "\n".join(lines).strip()
+        return PlotPointIndex.from_dicts(points).render()
 
     @staticmethod
     async def generate_plot_analysis_pipeline(
         subtitle_content: str,
-        chunk_chars_max: int = 15000,
+        chunk_tokens_max: Optional[int] = None,
         overlap_ratio: float = 0.12,
         max_points_per_chunk: int = 20,
+        project_id: Optional[str] = None,
+        use_cache: bool = True,
     ) -> str:
-        chunks = ScriptGenerationService._chunk_text(
+        run = ScriptGenerationService.start_plot_analysis(
+            subtitle_content, chunk_tokens_max, overlap_ratio, max_points_per_chunk, project_id, use_cache
+        )
+        return await run.text()
+
+    @staticmethod
+    def start_plot_analysis(
+        subtitle_content: str,
+        chunk_tokens_max: Optional[int] = None,
+        overlap_ratio: float = 0.12,
+        max_points_per_chunk: int = 20,
+        project_id: Optional[str] = None,
+        use_cache: bool = True,
+    ) -> "PlotAnalysisRun":
+        """
+        启动各分块的剧情点提取（后台并发执行），返回可按时间范围等待结果的 PlotAnalysisRun。
+        每块剧情点数按字幕 token 数缩放（上限为 max_points_per_chunk 与输出 token 预算可容纳的条数），
+        分块大小再受该上限对应的字幕量约束：长片切成多块，脚本生成可按时间窗口逐块流水线等待。
+        """
+        # 输出预算留约 20% 给 JSON 外层结构与摘要长度波动
+        point_cap = max(1, int(ai_service.output_token_budget() * 0.8) // PLOT_POINT_OUTPUT_TOKENS)
+        if max_points_per_chunk:
+            point_cap = min(point_cap, int(max_points_per_chunk))
+        # 按当前模型的真实上下文窗口（扣除提示词模板与输出预留）切块
+        budget, count_tokens = ai_service.token_budget(
+            ScriptGenerationService._plot_points_messages("", point_cap)
+        )
+        budget = min(budget, point_cap * PLOT_POINT_INPUT_TOKENS)
+        if chunk_tokens_max:
+            budget = min(budget, int(chunk_tokens_max))
+        chunks = ScriptGenerationService._chunk_by_tokens(
             subtitle_content,
-            chunk_chars_max,
+            budget,
+            count_tokens,
             overlap_ratio,
         )
-        all_points: List[Dict[str, Any]] = []
-        sem = asyncio.Semaphore(4)
+        logger.info(f"剧情分析分块: {len(chunks)} 块（每块预算约 {budget} tokens，至多 {point_cap} 个剧情点）")
 
+        # 并发度由 ai_service 内按提供商的自适应并发控制器决定
         async def run_one(i: int, ch: str) -> List[Dict[str, Any]]:
-            async with sem:
-                try:
-                    return await ScriptGenerationService._extract_plot_points_for_chunk(
-                        ch,
-                        i,
-                        max_points_per_chunk,
-                    )
-                except Exception:
-                    return []
-        tasks = [run_one(idx, ch) for idx, ch in enumerate(chunks)]
-        results = await asyncio.gather(*tasks)
-        for pts in results:
-            if pts:
-                all_points.extend(pts)
-        merged = ScriptGenerationService._merge_plot_points(all_points)
-        return ScriptGenerationService._compose_plot_analysis_text(merged)
+            max_points = min(point_cap, max(PLOT_POINTS_MIN_PER_CHUNK, -(-count_tokens(ch) // PLOT_POINT_INPUT_TOKENS)))
+            try:
+                return await ScriptGenerationService._extract_plot_points_for_chunk(
+                    ch,
+                    i,
+                    max_points,
+                    project_id,
+                    use_cache,
+                )
+            except Exception as e:
+                logger.warning(f"Plot chunk {i} extraction failed: {e}")
+                return []
+        tasks = [asyncio.ensure_future(run_one(idx, ch)) for idx, ch in enumerate(chunks)]
+        spans = [PlotAnalysisRun.chunk_span(ch) for ch in chunks]
+        return PlotAnalysisRun(tasks, spans)
 
     @staticmethod
     def _parse_srt_subtitles(subtitle_content: str) -> List[Dict[str, Any]]:
-        """解析字幕文本为结构化列表，支持标准SRT与压缩行内时间戳格式"""
-        subs: List[Dict[str, Any]] = []
-        content = subtitle_content.strip().replace("\r\n", "\n").replace("\r", "\n")
+        """解析字幕文本为结构化列表，支持 SRT/VTT/ASS 与压缩行内时间戳格式"""
+        content = subtitle_content.strip()
         if content.startswith('"') and content.endswith('"'):
             content = content[1:-1]
-        lines = [ln.strip() for ln in content.split("\n") if ln.strip()]
-
-        bracket_pattern = re.compile(r"^\[(\d{2}:\d{2}:\d{2},\d{3})-(\d{2}:\d{2}:\d{2},\d{3})\]\s*(.+)$")
-        bracket_matches = [bracket_pattern.match(ln) for ln in lines]
-        if any(bracket_matches):
-            idx = 1
-            for m in bracket_matches:
-                if not m:
-                    continue
-                start_str, end_str, text = m.groups()
-                try:
-                    start_s = ScriptGenerationService._parse_timestamp_str(start_str)
-                    end_s = ScriptGenerationService._parse_timestamp_str(end_str)
-                except Exception:
-                    continue
-                subs.append({
-                    "index": idx,
-                    "start": start_s,
-                    "end": end_s,
-                    "text": text.strip(),
-                })
-                idx += 1
-            subs.sort(key=lambda s: (s["start"], s["end"]))
-            return subs
-
-        pattern = re.compile(r"(\d+)\s+(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})\s+(.+?)(?=\n\s*\d+\s+\d{2}:\d{2}:\d{2}|\Z)", re.DOTALL)
-        norm = content + "\n"
-        matches = pattern.findall(norm)
-        for m in matches:
-            idx_str, start_str, end_str, text = m
-            try:
-                start_s = ScriptGenerationService._parse_timestamp_str(start_str)
-                end_s = ScriptGenerationService._parse_timestamp_str(end_str)
-            except Exception:
+        subs: List[Dict[str, Any]] = []
+        for cue in iter_cues(content):
+            text = cue.text.strip()
+            if not text:
                 continue
             subs.append({
-                "index": int(idx_str),
-                "start": start_s,
-                "end": end_s,
-                "text": text.strip(),
+                "index": cue.index,
+                "start": cue.start,
+                "end": cue.end,
+                "text": text,
             })
         subs.sort(key=lambda s: (s["start"], s["end"]))
         return subs
 
-    @staticmethod
-    def _parse_timestamp_str(ts: str) -> float:
-        """解析单个时间戳 00:00:00,000 为秒数"""
-        try:
-            h, m, s = ts.replace(',', '.').split(':')
-            return int(h) * 3600 + int(m) * 60 + float(s)
-        except Exception:
-            return 0.0
-
     @staticmethod
     def _filter_plot_analysis_by_time(plot_analysis: str, start_s: float, end_s: float) -> str:
-        """从剧情分析文本中筛选出当前时间窗口相关的爆点"""
+        """从剧情分析文本中筛选出当前时间窗口相关的爆点（多窗口时应复用 PlotPointIndex，避免反复解析）"""
         if not plot_analysis:
             return ""
-        # 假设 plot_analysis 是由 _compose_plot_analysis_text 生成的格式
-        # 爆点X：Title
-        # 时间：HH:MM:SS,mmm-HH:MM:SS,mmm
-        lines = plot_analysis.split('\n')
-        relevant_lines: List[str] = []
-        current_block: List[str] = []
-        in_block = False
-        block_time_range = None
-        for line in lines:
-            if line.startswith("爆点"):
-                if current_block and block_time_range:
-                    # 检查上一块是否相关
-                    bs, be = block_time_range
-                    # 简单的重叠判断
-                    if not (be < start_s or bs > end_s):
-                        relevant_lines.extend(current_block)
-                current_block = [line]
-                in_block = True
-                block_time_range = None
-            elif line.startswith("时间：") and in_block:
-                current_block.append(line)
-                try:
-                    ts_str = line.replace("时间：", "").strip()
-                    block_time_range = _parse_timestamp_pair(ts_str)
-                except Exception:
-                    pass
-            elif in_block:
-                current_block.append(line)
-
-        # 处理最后一块
-        if current_block and block_time_range:
-            bs, be = block_time_range
-            if not (be < start_s or bs > end_s):
-                relevant_lines.extend(current_block)
-        if not relevant_lines:
-            # 如果没有匹配到，为了上下文，返回前300个字符或摘要
-            return plot_analysis[:500] + "..."
-        return "\n".join(relevant_lines)
+        return PlotPointIndex.from_text(plot_analysis).render_window(start_s, end_s, fallback=plot_analysis)
 
     @staticmethod
     def _resolve_prompt_key(project_id: Optional[str], default_key: str) -> str:
@@ -428,35 +481,58 @@ class ScriptGenerationService:
         plot_analysis_snippet: str,
         drama_name: str,
         project_id: Optional[str] = None,
+        use_cache: bool = True,
     ) -> List[Dict[str, Any]]:
         subs_text_lines = []
         for s in subtitles:
             ts = _format_timestamp_range(float(s["start"]), float(s["end"]))
             subs_text_lines.append(f"[{ts}] {s['text']}")
-        subs_text = "\n".join(subs_text_lines)
-        if len(subs_text) > 6000:
-            subs_text = subs_text[:6000]
         default_key = "short_drama_narration:script_generation"
         key = ScriptGenerationService._resolve_prompt_key(project_id, default_key)
         variables = {
             "drama_name": drama_name,
             "plot_analysis": plot_analysis_snippet or "",
-            "subtitle_content": subs_text,
+            "subtitle_content": "",
         }
         try:
-            messages_dicts = prompt_manager.build_chat_messages(key, variables)
+            template_dicts = prompt_manager.build_chat_messages(key, variables)
         except KeyError:
             try:
                 from modules.prompts.short_drama_narration import register_prompts
                 register_prompts()
-                messages_dicts = prompt_manager.build_chat_messages(key, variables)
+                template_dicts = prompt_manager.build_chat_messages(key, variables)
             except Exception as e:
                 key = default_key
-                messages_dicts = prompt_manager.build_chat_messages(key, variables)
+                template_dicts = prompt_manager.build_chat_messages(key, variables)
+        # 字幕按整行放入，直到用尽扣除提示词模板后的 token 预算（不在行中间截断）
+        budget, count_tokens = ai_service.token_budget(template_dicts)
+        kept: List[str] = []
+        used = 0
+        for line in subs_text_lines:
+            cost = count_tokens(line) + 1
+            if kept and used + cost > budget:
+                logger.warning(f"Chunk {chunk_idx} subtitles exceed token budget ({budget}), kept {len(kept)}/{len(subs_text_lines)} lines")
+                break
+            kept.append(line)
+            used += cost
+        variables["subtitle_content"] = "\n".join(kept)
+        messages_dicts = prompt_manager.build_chat_messages(key, variables)
         messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages_dicts]
         try:
-            resp = await ai_service.send_chat(messages, response_format={"type": "json_object"})
-            data, _ = sanitize_json_text_to_dict(resp.content)
+            # 重试/对冲/故障转移均已在 ai_service 内处理；仍失败时向上抛出，避免脚本中出现静默缺口
+            # 流式输出被截断时返回已闭合条目恢复的部分数组
+            with llm_tracer.stage("script_chunk", chunk_idx):
+                data = await ai_service.send_chat_json_stream(
+                    messages,
+                    array_keys=("items", "segments", "data"),
+                    on_item=ScriptGenerationService._stream_progress(project_id, "llm_script_items", f"脚本分块{chunk_idx + 1}：已生成解说"),
+                    response_format={"type": "json_object"},
+                    use_cache=use_cache,
+                )
+        except Exception as e:
+            logger.error(f"Chunk {chunk_idx} generation failed: {e}")
+            raise
+        try:
             data = validate_script_items(data)
             items = data.get("items") or []
             valid_items: List[Dict[str, Any]] = []
@@ -477,7 +553,7 @@ class ScriptGenerationService:
                     continue
             return valid_items
         except Exception as e:
-            logger.error(f"Chunk {chunk_idx} generation failed: {e}")
+            logger.error(f"Chunk {chunk_idx} response parsing failed: {e}")
             return []
 
     @staticmethod
@@ -513,55 +589,171 @@ class ScriptGenerationService:
             it["_id"] = i
         return merged
 
+    @staticmethod
+    async def _refine_window(
+        core: List[Dict[str, Any]],
+        drama_name: str,
+        plot_text: str,
+        project_id: Optional[str] = None,
+        before: Optional[List[Dict[str, Any]]] = None,
+        after: Optional[List[Dict[str, Any]]] = None,
+        seam: bool = False,
+        use_cache: bool = True,
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        润色一段连续条目，返回 {_id: 模型返回条目}（仅包含 core 中的 _id）。
+        before/after 为只读上下文，帮助模型衔接前后文，其结果不会被采用。
+        """
+        def _lines(rows: List[Dict[str, Any]]) -> str:
+            return "\n".join(f"ID:{it['_id']} | {it['timestamp']} | {it['narration']}" for it in rows)
+
+        if seam:
+            system_prompt = (
+                "你是一位解说脚本衔接助手。给定的条目位于两段分别润色的脚本交界处。"
+                "必须严格保留每条 '_id' 与 'timestamp' 不变，不增删、不重排条目。"
+                "只在必要时微调 'narration' 的措辞，消除交界处的重复、断裂或指代不清，使前后自然衔接；不要改变原有信息与含义。"
+                "一般不修改 'picture' 与 'OST'，如无必要变更则原样返回。"
+                "仅返回一个 JSON 对象，键为 'items'，每个元素包含 '_id', 'timestamp', 'picture', 'narration', 'OST'；不要输出除 JSON 以外的任何内容。"
+            )
+        else:
+            system_prompt = (
+                "你是一位分块脚本合并助手。你的任务是将已按时间分块生成的解说脚本进行轻量合并与顺畅衔接。"
+                "必须严格保留每条 '_id' 与 'timestamp' 不变，不增删、不重排条目。"
+                "仅对部分的 'narration' 进行小幅润色，比如补充必要的连接词、消除重复或断裂，让上下文自然连贯；不要改变原有信息与含义，不做大幅改写。"
+                "一般不修改 'picture' 与 'OST'，如无必要变更则原样返回。"
+                "仅返回一个 JSON 对象，键为 'items'，每个元素包含 '_id', 'timestamp', 'picture', 'narration', 'OST'；不要输出除 JSON 以外的任何内容。"
+            )
+        parts = [f"剧名：{drama_name}\n", f"剧情背景：\n{plot_text}\n\n"]
+        if before:
+            parts.append(f"前文（只读，仅供衔接参考，不要返回）：\n{_lines(before)}\n\n")
+        parts.append(f"草稿：\n{_lines(core)}\n\n")
+        if after:
+            parts.append(f"后文（只读，仅供衔接参考，不要返回）：\n{_lines(after)}\n\n")
+        parts.append("请仅针对“草稿”中的条目按要求返回 JSON。")
+        messages = [
+            ChatMessage(role="system", content=system_prompt),
+            ChatMessage(role="user", content="".join(parts))
+        ]
+        # 截断时只拿到部分润色结果，未返回的条目保留草稿（追踪记录的分块序号取窗口首条 _id）
+        with llm_tracer.stage("refine_seam" if seam else "refine_window", int(core[0]["_id"]) if core else None):
+            data = await ai_service.send_chat_json_stream(
+                messages,
+                array_keys=("items",),
+                on_item=ScriptGenerationService._stream_progress(
+                    project_id, "llm_refine_items", "衔接润色：已完成" if seam else "整体润色：已完成"
+                ),
+                response_format={"type": "json_object"},
+                use_cache=use_cache,
+            )
+        data = validate_script_items(data)
+        core_ids = {int(it["_id"]) for it in core}
+        out: Dict[int, Dict[str, Any]] = {}
+        for it in data.get("items", []):
+            try:
+                _id = int(it.get("_id"))
+            except Exception:
+                continue
+            if _id in core_ids:
+                out[_id] = it
+        return out
+
     @staticmethod
     async def _refine_full_script(
         segments: List[Dict[str, Any]],
         drama_name: str,
-        plot_analysis: str
+        plot_analysis: str,
+        project_id: Optional[str] = None,
+        use_cache: bool = True,
     ) -> List[Dict[str, Any]]:
+        """
+        整体润色（分层 Map-Reduce）：
+        - 条目较少时单次调用
+        - 否则按 SCRIPT_REFINE_WINDOW（默认 30）条切成窗口并发润色，每个窗口附带前后 SCRIPT_REFINE_CONTEXT（默认 3）条只读上下文
+        - 再对每个窗口交界处前后各 2 条做一次轻量衔接润色（各交界并发）
+        任何窗口失败都只保留该窗口的草稿；'_id' / 'timestamp' / 条目顺序始终不变，润色耗时不随脚本长度线性增长。
+        """
         items = segments
         if not items:
             return []
-        draft_lines = [f"ID:{it['_id'] or i+1} | {it['timestamp']} | {it['narration']}" for i, it in enumerate(items)]
-        draft_str = "\n".join(draft_lines)
-        system_prompt = (
-            "你是一位分块脚本合并助手。你的任务是将已按时间分块生成的解说脚本进行轻量合并与顺畅衔接。"
-            "必须严格保留每条 '_id' 与 'timestamp' 不变，不增删、不重排条目。"
-            "仅对部分的 'narration' 进行小幅润色，比如补充必要的连接词、消除重复或断裂，让上下文自然连贯；不要改变原有信息与含义，不做大幅改写。"
-            "一般不修改 'picture' 与 'OST'，如无必要变更则原样返回。"
-            "仅返回一个 JSON 对象，键为 'items'，每个元素包含 '_id', 'timestamp', 'picture', 'narration', 'OST'；不要输出除 JSON 以外的任何内容。"
-        )
-        user_content = (
-            f"剧名：{drama_name}\n"
-            f"剧情背景：\n{plot_analysis[:1000]}...\n\n"
-            f"草稿：\n{draft_str}\n\n"
-            "请按要求返回 JSON。"
-        )
-        messages = [
-            ChatMessage(role="system", content=system_prompt),
-            ChatMessage(role="user", content=user_content)
-        ]
-        try:
-            resp = await ai_service.send_chat(messages, response_format={"type": "json_object"})
-            data, _ = sanitize_json_text_to_dict(resp.content)
-            data = validate_script_items(data)
-            new_items_map = {int(it.get("_id")): it for it in data.get("items", []) if it.get("_id") is not None}
-            final_items: List[Dict[str, Any]] = []
-            for i, it in enumerate(items, start=1):
-                _id = int(it.get("_id") or i)
-                if _id in new_items_map:
-                    new_it = new_items_map[_id]
+        for i, it in enumerate(items, start=1):
+            it["_id"] = int(it.get("_id") or i)
+        window = max(8, _env_int("SCRIPT_REFINE_WINDOW", 30))
+        ctx = max(0, _env_int("SCRIPT_REFINE_CONTEXT", 3))
+        plot_index = PlotPointIndex.from_text(plot_analysis)
+
+        def _plot_for(rows: List[Dict[str, Any]]) -> str:
+            try:
+                s_t = _parse_timestamp_pair(str(rows[0]["timestamp"]))[0]
+                e_t = _parse_timestamp_pair(str(rows[-1]["timestamp"]))[1]
+                text = plot_index.render_window(s_t, e_t, fallback=plot_analysis) if len(plot_index) else ""
+            except Exception:
+                text = ""
+            return (text or plot_analysis or "")[:1000] + "..."
+
+        def _apply(refined: Dict[int, Dict[str, Any]]) -> None:
+            for it in items:
+                new_it = refined.get(int(it["_id"]))
+                if new_it is not None:
                     it["narration"] = str(new_it.get("narration", it.get("narration", "")))
                     it["picture"] = new_it.get("picture")
-                it["_id"] = _id
-                final_items.append(it)
-            return final_items
-        except Exception as e:
-            logger.warning(f"Refine script failed, returning draft: {e}")
+
+        async def _safe(coro, label: str) -> Dict[int, Dict[str, Any]]:
+            try:
+                return await coro
+            except Exception as e:
+                logger.warning(f"Refine {label} failed, keeping draft: {e}")
+                return {}
+
+        if len(items) <= window:
+            _apply(await _safe(
+                ScriptGenerationService._refine_window(items, drama_name, _plot_for(items), project_id, use_cache=use_cache),
+                "script",
+            ))
             return items
 
+        # Map：窗口并发润色
+        bounds = list(range(0, len(items), window))
+        results = await asyncio.gather(*(
+            _safe(
+                ScriptGenerationService._refine_window(
+                    items[b:b + window], drama_name, _plot_for(items[b:b + window]), project_id,
+                    before=items[max(0, b - ctx):b], after=items[b + window:b + window + ctx],
+                    use_cache=use_cache,
+                ),
+                f"window {k}",
+            )
+            for k, b in enumerate(bounds)
+        ))
+        for refined in results:
+            _apply(refined)
+
+        # Reduce：交界处衔接润色（基于各窗口润色后的文本）
+        seams = bounds[1:]
+        seam_results = await asyncio.gather(*(
+            _safe(
+                ScriptGenerationService._refine_window(
+                    items[b - 2:b + 2], drama_name, _plot_for(items[b - 2:b + 2]), project_id,
+                    before=items[max(0, b - 2 - ctx):b - 2], after=items[b + 2:b + 2 + ctx], seam=True,
+                    use_cache=use_cache,
+                ),
+                f"seam {b}",
+            )
+            for b in seams
+        ))
+        for refined in seam_results:
+            _apply(refined)
+        logger.info(f"分层润色完成: {len(bounds)} 个窗口, {len(seams)} 处衔接")
+        return items
+
     @staticmethod
-    async def generate_script_json(drama_name: str, plot_analysis: str, subtitle_content: str, project_id: Optional[str] = None) -> Dict[str, Any]:
+    async def generate_script_json(
+        drama_name: str,
+        plot_analysis: str,
+        subtitle_content: str,
+        project_id: Optional[str] = None,
+        plot_run: Optional["PlotAnalysisRun"] = None,
+        use_cache: bool = True,
+    ) -> Dict[str, Any]:
         """
         生成解说脚本（Map-Reduce-Refine 模式）
         1. 解析字幕
@@ -569,22 +761,34 @@ class ScriptGenerationService:
         3. 并发生成各块脚本
         4. 合并去重 (Reduce)
         5. 全局润色 (Refine)
+        传入 plot_run（进行中的剧情分析）时与剧情点提取流水线并行：
+        每个时间窗口只等待覆盖它的剧情分块完成即开始生成，整体耗时趋近各阶段最大值而非之和。
+        use_cache=False 时各阶段均跳过大模型响应缓存（用户主动重新生成）。
         """
+        async def _full_plot() -> str:
+            return await plot_run.text() if plot_run is not None else plot_analysis
+
         # 1. 解析字幕
         subtitles = ScriptGenerationService._parse_srt_subtitles(subtitle_content)
         if not subtitles:
             # Fallback to simple generation if parsing fails
             logger.warning("Subtitle parsing failed, fallback to simple generation")
-            return await ScriptGenerationService._generate_script_json_simple(drama_name, plot_analysis, subtitle_content, project_id)
+            return await ScriptGenerationService._generate_script_json_simple(
+                drama_name, await _full_plot(), subtitle_content, project_id, use_cache
+            )
         total_duration = subtitles[-1]["end"] if subtitles else 0
         if total_duration == 0:
-            return await ScriptGenerationService._generate_script_json_simple(drama_name, plot_analysis, subtitle_content, project_id)
+            return await ScriptGenerationService._generate_script_json_simple(
+                drama_name, await _full_plot(), subtitle_content, project_id, use_cache
+            )
 
         # 2. 分块配置
         WINDOW_SIZE = 2500  # 5分钟
         OVERLAP = 60       # 1分钟重叠
         if total_duration < WINDOW_SIZE * 1.8:
-            return await ScriptGenerationService._generate_script_json_simple(drama_name, plot_analysis, subtitle_content, project_id)
+            return await ScriptGenerationService._generate_script_json_simple(
+                drama_name, await _full_plot(), subtitle_content, project_id, use_cache
+            )
         chunks = []
         curr_time = 0
         idx = 0
@@ -604,29 +808,36 @@ class ScriptGenerationService:
                 break
             curr_time += (WINDOW_SIZE - OVERLAP)
 
-        # 3. 并发生成 (限制并发数为 5)
-        sem = asyncio.Semaphore(5)
+        # 剧情点只解析一次为区间索引，各窗口按时间对数复杂度查询
+        plot_index = PlotPointIndex.from_text(plot_analysis) if plot_run is None else None
 
+        # 3. 并发生成（并发度由 ai_service 内按提供商的自适应并发控制器决定）
         async def generate_one(chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
-            async with sem:
-                # 筛选相关的剧情爆点
-                local_plot = ScriptGenerationService._filter_plot_analysis_by_time(plot_analysis, chunk["start"], chunk["end"])
-                return await ScriptGenerationService._generate_script_chunk(
-                    chunk["idx"], chunk["start"], chunk["end"], chunk["subs"], local_plot, drama_name, project_id
-                )
+            # 筛选相关的剧情爆点（流水线模式下仅等待覆盖该窗口的剧情分块）
+            if plot_run is not None:
+                window_index = await plot_run.index_for_range(chunk["start"], chunk["end"])
+                local_plot = window_index.render_window(chunk["start"], chunk["end"])
+            else:
+                local_plot = plot_index.render_window(chunk["start"], chunk["end"], fallback=plot_analysis)
+            return await ScriptGenerationService._generate_script_chunk(
+                chunk["idx"], chunk["start"], chunk["end"], chunk["subs"], local_plot, drama_name, project_id, use_cache
+            )
         tasks = [generate_one(c) for c in chunks]
         results = await asyncio.gather(*tasks)
         all_items: List[Dict[str, Any]] = []
         for res in results:
             all_items.extend(res)
         merged_items = ScriptGenerationService._merge_items(all_items)
-        final_items = await ScriptGenerationService._refine_full_script(merged_items, drama_name, plot_analysis)
+        final_items = await ScriptGenerationService._refine_full_script(
+            merged_items, drama_name, await _full_plot(), project_id, use_cache
+        )
         data = {"items": final_items}
         data = validate_script_items(data)
         return data
 
     @staticmethod
-    async def _generate_script_json_simple(drama_name: str, plot_analysis: str, subtitle_content: str, project_id: Optional[str] = None) -> Dict[str, Any]:
+    async def _generate_script_json_simple(drama_name: str, plot_analysis: str, subtitle_content: str,
+                                           project_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
         """(旧版逻辑) 直接调用提示词模块生成"""
         default_key = "short_drama_narration:script_generation"
         key = ScriptGenerationService._resolve_prompt_key(project_id, default_key)
@@ -647,7 +858,13 @@ class ScriptGenerationService:
                 key = default_key
                 messages_dicts = prompt_manager.build_chat_messages(key, variables)
         messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages_dicts]
-        resp = await ai_service.send_chat(messages, response_format={"type": "json_object"})
+        with llm_tracer.stage("script_simple"):
+            resp = await ai_service.send_chat(
+                messages,
+                response_format={"type": "json_object"},
+                use_cache=use_cache,
+                validate=lambda r: validate_script_items(sanitize_json_text_to_dict(r.content)[0]),
+            )
         raw_text = resp.content
 
         # 清洗与校验
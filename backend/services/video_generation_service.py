@@ -6,20 +6,57 @@
 根据项目中的脚本（script.segments）对原视频进行剪辑并拼接，输出生成视频文件。
 """
 
+import asyncio
 import logging
+import os
 from datetime import datetime
 import shutil
+import uuid
+from collections import Counter
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from modules.projects_store import Project, projects_store
 from modules.video_processor import video_processor
+from modules.encoder_registry import encoder_registry, ffmpeg_concurrency
+from modules.media_probe import media_probe
+from modules.segment_manifest import SegmentManifest, gc_stale_tmp_dirs
 from modules.tts_service import tts_service
 from modules.ws_manager import manager
 
 logger = logging.getLogger(__name__)
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, "") or default))
+    except Exception:
+        return default
+
+
+# 片段渲染并发上限：ffmpeg 与编码器基准共用同一定义；TTS 为 I/O 密集型，单独限流
+FFMPEG_CONCURRENCY = ffmpeg_concurrency()
+TTS_CONCURRENCY = _env_int("VIDEO_TTS_CONCURRENCY", 4)
+# 本地推理引擎（IndexTTS2）共享同一个模型与 GPU，并发推理只会争抢显存，默认串行
+LOCAL_TTS_CONCURRENCY = _env_int("VIDEO_LOCAL_TTS_CONCURRENCY", 1)
+LOCAL_TTS_PROVIDERS = {"index_tts"}
+# 渲染模式：segments（逐片段临时文件 + 拼接 + 标准化）/ filtergraph（单个滤镜图一次性渲染）
+RENDER_MODE = (os.getenv("VIDEO_RENDER_MODE", "segments") or "segments").strip().lower()
+# 一次性渲染的片段数上限：每个片段对应独立的解码输入，过多时回退分段模式
+FILTERGRAPH_MAX_SEGMENTS = _env_int("VIDEO_FILTERGRAPH_MAX_SEGMENTS", 150)
+
+
+# 正在渲染的项目 -> 进行中的渲染数（同一项目可能并发渲染，归零才移除），临时目录回收时跳过
+_active_renders: Counter = Counter()
+# 有渲染任务时推迟编码器基准，避免测得的吞吐被实际任务干扰
+encoder_registry.add_busy_check(lambda: bool(_active_renders))
+
+
+def _tts_concurrency(provider: str) -> int:
+    """按当前 TTS 引擎取合成并发：云端接口为 I/O 密集可并发，本地推理串行"""
+    return LOCAL_TTS_CONCURRENCY if provider in LOCAL_TTS_PROVIDERS else TTS_CONCURRENCY
+
+
 def _backend_root_dir() -> Path:
     # backend/services/... -> backend -> project root
     backend_dir = Path(__file__).resolve().parents[1]
@@ -63,159 +100,203 @@ class VideoGenerationService:
         return safe
 
     @staticmethod
-    async def generate_from_script(project_id: str) -> Dict[str, Any]:
+    async def _render_segment(
+        idx: int,
+        seg: Dict[str, Any],
+        input_abs: Path,
+        input_dur: float,
+        clip_abs: Path,
+        aud_tmp_dir: Path,
+        ffmpeg_sem: asyncio.Semaphore,
+        tts_sem: asyncio.Semaphore,
+    ) -> None:
         """
-        根据项目的脚本生成视频：剪辑+拼接。
+        渲染单个片段到 clip_abs，失败时抛出异常。
 
-        Returns: { output_path: str, segments_count: int, started_at: str, finished_at: str }
+        播放原片片段走智能剪切（两端不完整 GOP 重编码、中间流拷贝，时长与脚本一致）；配音片段先合成 TTS，再由单次 ffmpeg 完成
+        取材定位、按配音时长裁剪/补帧与混音，不落地中间剪切文件。
+        ffmpeg 任务受 ffmpeg_sem 限流（CPU 密集），TTS 调用受 tts_sem 限流（I/O 密集）。
         """
-        p: Optional[Project] = projects_store.get_project(project_id)
-        if not p:
-            raise ValueError("项目不存在")
-
-        if not p.video_path:
-            raise ValueError("项目未设置原始视频文件")
-
-        if not p.script or not isinstance(p.script, dict):
-            raise ValueError("项目未设置有效的脚本")
-
-        # 广播：开始生成视频
-        try:
-            await manager.broadcast(
-                __import__("json").dumps({
-                    "type": "progress",
-                    "scope": "generate_video",
-                    "project_id": project_id,
-                    "phase": "start",
-                    "message": "开始生成视频",
-                    "progress": 1,
-                    "timestamp": datetime.now().isoformat(),
-                })
+        start = float(seg.get("start_time", 0.0))
+        end = float(seg.get("end_time", 0.0))
+        if end <= start:
+            raise ValueError(f"无效片段: idx={idx} start={start} end={end}")
+        duration = max(0.0, end - start)
+
+        text = str(seg.get("text", "") or "").strip()
+        if text.startswith("播放原片"):
+            async with ffmpeg_sem:
+                ok = await video_processor.smart_cut_segment(
+                    str(input_abs), str(clip_abs), start, duration
+                )
+            if not ok:
+                raise RuntimeError(f"剪切片段失败: {idx}")
+            return
+
+        seg_audio = aud_tmp_dir / f"seg_{idx:04d}.mp3"
+        async with tts_sem:
+            sy = await tts_service.synthesize(text, str(seg_audio), None)
+        if not sy.get("success"):
+            raise RuntimeError(f"TTS合成失败: {idx} - {sy.get('error')}")
+
+        async with ffmpeg_sem:
+            ok = await video_processor.render_narrated_segment(
+                str(input_abs), start, duration, str(seg_audio), str(clip_abs),
+                input_duration=input_dur,
             )
-        except Exception:
-            pass
-
-        segments: List[Dict[str, Any]] = p.script.get("segments") or []
-        if not segments:
-            raise ValueError("脚本中没有可用的 segments")
+        if not ok:
+            raise RuntimeError(f"片段配音渲染失败: {idx}")
 
-        input_abs = VideoGenerationService._resolve_path(p.video_path)
-        if not input_abs.exists():
-            raise ValueError("原始视频文件不存在")
-        input_dur = await video_processor._ffprobe_duration(str(input_abs), "format") or 0.0
+    @staticmethod
+    async def _generate_one_shot(
+        project_id: str,
+        segments: List[Dict[str, Any]],
+        input_abs: Path,
+        input_dur: float,
+        aud_tmp_dir: Path,
+        output_abs: Path,
+    ) -> int:
+        """
+        一次性渲染模式：并发合成全部配音后，由单个 ffmpeg 滤镜图完成剪切、拼接与响度标准化，
+        画面只编码一次，不写入任何临时视频片段。
 
-        # 片段输出与最终输出路径
-        uploads_root = _uploads_dir()
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # 输出目录：uploads/videos/outputs/{project_name}
-        project_dir_name = VideoGenerationService._safe_dir_name(p.name or p.id, p.id)
-        outputs_dir = uploads_root / "videos" / "outputs" / project_dir_name
-        outputs_dir.mkdir(parents=True, exist_ok=True)
-        output_name = f"{p.id}_output_{ts}.mp4"
-        output_abs = outputs_dir / output_name
+        Returns: 渲染的片段数
+        """
+        total_segments = len(segments)
+        tts_sem = asyncio.Semaphore(_tts_concurrency(tts_service.config_fingerprint()[0]))
+        done_count = 0
 
-        # 片段临时目录：uploads/videos/tmp/{project_id}_{ts}
-        tmp_dir = uploads_root / "videos" / "tmp" / f"{p.id}_{ts}"
-        tmp_dir.mkdir(parents=True, exist_ok=True)
-        # 配音临时目录：uploads/audios/tmp/{project_id}_{ts}
-        aud_tmp_dir = uploads_root / "audios" / "tmp" / f"{p.id}_{ts}"
-        aud_tmp_dir.mkdir(parents=True, exist_ok=True)
+        async def _prepare(idx: int, seg: Dict[str, Any]) -> Dict[str, Any]:
+            nonlocal done_count
+            start = float(seg.get("start_time", 0.0))
+            end = float(seg.get("end_time", 0.0))
+            if end <= start:
+                raise ValueError(f"无效片段: idx={idx} start={start} end={end}")
+            item: Dict[str, Any] = {"start": start, "duration": end - start, "narration": None}
+            text = str(seg.get("text", "") or "").strip()
+            if not text.startswith("播放原片"):
+                seg_audio = aud_tmp_dir / f"seg_{idx:04d}.mp3"
+                async with tts_sem:
+                    sy = await tts_service.synthesize(text, str(seg_audio), None)
+                if not sy.get("success"):
+                    raise RuntimeError(f"TTS合成失败: {idx} - {sy.get('error')}")
+                item["narration"] = str(seg_audio)
+            done_count += 1
+            # 广播：配音进度（15% -> 40% 区间）
+            try:
+                progress = 15 + int((done_count / max(1, total_segments)) * 25)
+                await manager.broadcast(
+                    __import__("json").dumps({
+                        "type": "progress",
+                        "scope": "generate_video",
+                        "project_id": project_id,
+                        "phase": "segment_processed",
+                        "message": f"已处理片段 {done_count}/{total_segments}",
+                        "progress": min(40, progress),
+                        "timestamp": datetime.now().isoformat(),
+                    })
+                )
+            except Exception:
+                pass
+            return item
 
-        # 广播：准备输出目录
+        tasks = [
+            asyncio.create_task(_prepare(idx, seg))
+            for idx, seg in enumerate(segments, start=1)
+        ]
         try:
-            await manager.broadcast(
-                __import__("json").dumps({
-                    "type": "progress",
-                    "scope": "generate_video",
-                    "project_id": project_id,
-                    "phase": "prepare_output",
-                    "message": "准备输出与临时目录",
-                    "progress": 10,
-                    "timestamp": datetime.now().isoformat(),
-                })
-            )
+            items: List[Dict[str, Any]] = list(await asyncio.gather(*tasks))
         except Exception:
-            pass
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
 
-        # 逐段剪切
-        clip_paths: List[str] = []
-        total_segments = len(segments)
-        # 广播：开始剪切片段
         try:
             await manager.broadcast(
                 __import__("json").dumps({
                     "type": "progress",
                     "scope": "generate_video",
                     "project_id": project_id,
-                    "phase": "cutting_segments_start",
-                    "message": "正在剪切视频片段并生成配音",
-                    "progress": 15,
+                    "phase": "render_start",
+                    "message": "正在一次性渲染成片",
+                    "progress": 45,
                     "timestamp": datetime.now().isoformat(),
                 })
             )
         except Exception:
             pass
 
-        clip_paths: List[str] = []
-        for idx, seg in enumerate(segments, start=1):
-            start = float(seg.get("start_time", 0.0))
-            end = float(seg.get("end_time", 0.0))
-            if end <= start:
-                raise ValueError(f"无效片段: idx={idx} start={start} end={end}")
-            duration = max(0.0, end - start)
-            clip_name = f"clip_{idx:04d}.mp4"
-            clip_abs = tmp_dir / clip_name
+        async def _on_render_progress(pct: float) -> None:
+            # 广播：渲染进度（45% -> 95% 区间）
+            try:
+                await manager.broadcast(
+                    __import__("json").dumps({
+                        "type": "progress",
+                        "scope": "generate_video",
+                        "project_id": project_id,
+                        "phase": "render_progress",
+                        "message": f"正在渲染 {pct:.0f}%",
+                        "progress": 45 + int(pct * 0.5),
+                        "timestamp": datetime.now().isoformat(),
+                    })
+                )
+            except Exception:
+                pass
 
-            ok = await video_processor.cut_video_segment(
-                str(input_abs), str(clip_abs), start, duration
-            )
-            if not ok:
-                raise RuntimeError(f"剪切片段失败: {idx}")
+        ok = await video_processor.render_script_filtergraph(
+            str(input_abs), items, str(output_abs), on_progress=_on_render_progress, input_duration=input_dur
+        )
+        if not ok:
+            raise RuntimeError("一次性渲染视频失败")
+        return len(items)
 
-            text = str(seg.get("text", "") or "").strip()
-            if text.startswith("播放原片"):
-                clip_paths.append(str(clip_abs))
-            else:
-                seg_audio = aud_tmp_dir / f"seg_{idx:04d}.mp3"
-                sy = await tts_service.synthesize(text, str(seg_audio), None)
-                if not sy.get("success"):
-                    raise RuntimeError(f"TTS合成失败: {idx} - {sy.get('error')}")
-                adur = float(sy.get("duration") or 0.0) if isinstance(sy.get("duration"), (int, float)) else 0.0
-                if adur <= 0.0:
-                    adur = await video_processor._ffprobe_duration(str(seg_audio), "audio") or 0.0
-                if adur > 0.0 and input_dur > 0.0 and adur > duration:
-                    ext = adur - duration
-                    fwd = max(0.0, input_dur - end)
-                    if fwd >= ext:
-                        new_start = start
-                        new_dur = duration + ext
-                    else:
-                        shortage = ext - fwd
-                        new_start = max(0.0, start - shortage)
-                        new_dur = input_dur - new_start
-                    ok2 = await video_processor.cut_video_segment(
-                        str(input_abs), str(clip_abs), new_start, new_dur
-                    )
-                    if not ok2:
-                        raise RuntimeError(f"片段延长失败: {idx}")
-                clip_nar_abs = clip_abs.with_name(f"{clip_abs.stem}_nar{clip_abs.suffix}")
-                rep_ok = await video_processor.replace_audio_with_narration(str(clip_abs), str(seg_audio), str(clip_nar_abs))
-                if not rep_ok:
-                    raise RuntimeError(f"片段配音替换失败: {idx}")
-                clip_paths.append(str(clip_nar_abs))
+    @staticmethod
+    async def _generate_by_segments(
+        project_id: str,
+        segments: List[Dict[str, Any]],
+        input_abs: Path,
+        input_dur: float,
+        aud_tmp_dir: Path,
+        output_abs: Path,
+    ) -> int:
+        """
+        分段渲染模式：逐片段生成片段文件（同时测量响度）-> 拼接，响度标准化融合在拼接输出中完成。
+        片段按清单键缓存在项目片段目录中，键未变化的片段直接复用（增量重渲染）。
 
+        Returns: 参与拼接的片段数
+        """
+        total_segments = len(segments)
+        manifest = SegmentManifest.for_project(project_id)
+        source_fp = media_probe.fingerprint(str(input_abs)) or str(input_abs)
+        tts_provider, tts_params = tts_service.config_fingerprint()
+        tts_key = {"provider": tts_provider, **tts_params}
+        # 渲染中的片段文件名带本次运行标识，同一项目并发渲染互不覆盖
+        run_id = uuid.uuid4().hex[:8]
+        reused_count = 0
+
+        # 片段级并发：每个片段内部为 TTS -> 单次渲染（剪切+配音混流）的依赖链，
+        # 片段之间按 ffmpeg/TTS 两类信号量分别限流；结果按片段序号回填，保证拼接顺序确定
+        ffmpeg_sem = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+        tts_sem = asyncio.Semaphore(_tts_concurrency(tts_provider))
+        done_count = 0
+
+        async def _on_segment_done() -> None:
+            nonlocal done_count
+            done_count += 1
             # 广播：片段进度（15% -> 70% 区间）
             try:
                 base = 15
                 span = 55
-                progress = base + int((idx / max(1, total_segments)) * span)
+                progress = base + int((done_count / max(1, total_segments)) * span)
                 await manager.broadcast(
                     __import__("json").dumps({
                         "type": "progress",
                         "scope": "generate_video",
                         "project_id": project_id,
                         "phase": "segment_processed",
-                        "message": f"已处理片段 {idx}/{total_segments}",
+                        "message": f"已处理片段 {done_count}/{total_segments}",
                         "progress": min(70, progress),
                         "timestamp": datetime.now().isoformat(),
                     })
@@ -223,6 +304,58 @@ class VideoGenerationService:
             except Exception:
                 pass
 
+        async def _run_segment(idx: int, seg: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, float]]]:
+            nonlocal reused_count
+            text = str(seg.get("text", "") or "").strip()
+            key = SegmentManifest.make_key(
+                source_fp,
+                float(seg.get("start_time", 0.0)),
+                float(seg.get("end_time", 0.0)),
+                text,
+                None if text.startswith("播放原片") else tts_key,
+            )
+            async with manifest.key_lock(key):
+                hit = manifest.lookup(key)
+                if hit is not None:
+                    reused_count += 1
+                    out = hit["path"]
+                    measured = hit.get("loudness")
+                else:
+                    part = manifest.segments_dir / f"seg_{key[:24]}.{run_id}.part.mp4"
+                    await VideoGenerationService._render_segment(
+                        idx, seg, input_abs, input_dur, part, aud_tmp_dir, ffmpeg_sem, tts_sem
+                    )
+                    out = str(manifest.commit(key, part, meta={"index": idx}))
+                    measured = None
+                if measured is None:
+                    # 片段产出后立即测量响度（仅解码音轨），供拼接时一次性应用 loudnorm
+                    async with ffmpeg_sem:
+                        measured = await video_processor.audio_normalizer.measure_file(out)
+                    manifest.update_loudness(key, measured)
+            await _on_segment_done()
+            return out, measured
+
+        tasks = [
+            asyncio.create_task(_run_segment(idx, seg))
+            for idx, seg in enumerate(segments, start=1)
+        ]
+        try:
+            rendered = list(await asyncio.gather(*tasks))
+        except Exception:
+            # 任一片段失败即取消其余片段，避免继续占用 ffmpeg/TTS 资源
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            # 清单每次渲染只落盘一次（含失败时已完成片段的登记）
+            await asyncio.to_thread(manifest.flush)
+        clip_paths: List[str] = [r[0] for r in rendered]
+        loudness = [r[1] for r in rendered]
+        if reused_count:
+            logger.info(f"增量渲染: 复用片段 {reused_count}/{total_segments}")
+
         if not clip_paths:
             raise ValueError("未生成任何有效片段，无法拼接")
 
@@ -242,14 +375,37 @@ class VideoGenerationService:
         except Exception:
             pass
 
-        ok_concat = await video_processor.concat_videos(clip_paths, str(output_abs))
-        if not ok_concat:
-            # 失败也清理临时片段
+        # 响度：逐片段测量值解析合并；缺失时对全部片段音轨做一次旁路测量，均失败则用单遍 loudnorm
+        infos = await media_probe.probe_many(clip_paths)
+        merged = video_processor.audio_normalizer.merge_measurements([
+            (m, (info.duration("format") if info is not None else None) or 0.0)
+            for m, info in zip(loudness, infos)
+        ])
+        if merged is None:
+            merged = await video_processor.measure_concat_loudness(clip_paths)
+        audio_filter = video_processor.audio_normalizer.loudnorm_filter(merged)
+
+        async def _on_concat_progress(pct: float) -> None:
+            # 广播：拼接+响度标准化进度（75% -> 95% 区间）
             try:
-                if tmp_dir.exists():
-                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                await manager.broadcast(
+                    __import__("json").dumps({
+                        "type": "progress",
+                        "scope": "generate_video",
+                        "project_id": project_id,
+                        "phase": "concat_progress",
+                        "message": f"正在拼接视频片段 {pct:.0f}%",
+                        "progress": 75 + int(pct * 0.2),
+                        "timestamp": datetime.now().isoformat(),
+                    })
+                )
             except Exception:
                 pass
+
+        ok_concat = await video_processor.concat_videos(
+            clip_paths, str(output_abs), on_progress=_on_concat_progress, audio_filter=audio_filter
+        )
+        if not ok_concat:
             raise RuntimeError("拼接视频失败")
 
         try:
@@ -259,63 +415,150 @@ class VideoGenerationService:
                     "scope": "generate_video",
                     "project_id": project_id,
                     "phase": "concat_done",
-                    "message": "片段拼接完成",
-                    "progress": 85,
+                    "message": "片段拼接与响度标准化完成",
+                    "progress": 95,
                     "timestamp": datetime.now().isoformat(),
                 })
             )
         except Exception:
             pass
 
-        norm_abs = outputs_dir / f"{p.id}_output_{ts}_normalized.mp4"
+        return len(clip_paths)
+
+    @staticmethod
+    async def gc_tmp_dirs() -> Dict[str, int]:
+        try:
+            loop = asyncio.get_running_loop()
+            # 在事件循环内取快照，避免回收线程遍历时计数被并发修改
+            active = {pid for pid, n in _active_renders.items() if n > 0}
+            return await loop.run_in_executor(
+                None,
+                lambda: gc_stale_tmp_dirs(
+                    project_exists=lambda pid: projects_store.get_project(pid) is not None,
+                    active_project_ids=active,
+                ),
+            )
+        except Exception as e:
+            logger.warning(f"回收临时目录失败: {e}")
+            return {}
+
+    @staticmethod
+    async def generate_from_script(project_id: str) -> Dict[str, Any]:
+        """
+        根据项目的脚本生成视频：剪辑+拼接。
+
+        Returns: { output_path: str, segments_count: int, started_at: str, finished_at: str }
+        """
+        p: Optional[Project] = projects_store.get_project(project_id)
+        if not p:
+            raise ValueError("项目不存在")
+
+        if not p.video_path:
+            raise ValueError("项目未设置原始视频文件")
+
+        if not p.script or not isinstance(p.script, dict):
+            raise ValueError("项目未设置有效的脚本")
+
+        # 广播：开始生成视频
         try:
             await manager.broadcast(
                 __import__("json").dumps({
                     "type": "progress",
                     "scope": "generate_video",
                     "project_id": project_id,
-                    "phase": "normalize_start",
-                    "message": "正在统一响度标准化",
-                    "progress": 90,
+                    "phase": "start",
+                    "message": "开始生成视频",
+                    "progress": 1,
                     "timestamp": datetime.now().isoformat(),
                 })
             )
         except Exception:
             pass
 
-        ok_norm = await video_processor.audio_normalizer.normalize_video_loudness(str(output_abs), str(norm_abs))
-        if not ok_norm:
-            raise RuntimeError("响度标准化失败")
-        final_abs = norm_abs
-        web_output = _to_web_path(final_abs)
-        projects_store.update_project(project_id, {"output_video_path": web_output, "status": "completed"})
+        segments: List[Dict[str, Any]] = p.script.get("segments") or []
+        if not segments:
+            raise ValueError("脚本中没有可用的 segments")
+
+        input_abs = VideoGenerationService._resolve_path(p.video_path)
+        if not input_abs.exists():
+            raise ValueError("原始视频文件不存在")
+        input_dur = await video_processor._ffprobe_duration(str(input_abs), "format") or 0.0
+
+        # 回收过期临时目录与长期未使用的片段缓存（清理失败不影响主流程）
+        await VideoGenerationService.gc_tmp_dirs()
+
+        # 片段输出与最终输出路径
+        uploads_root = _uploads_dir()
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 输出目录：uploads/videos/outputs/{project_name}
+        project_dir_name = VideoGenerationService._safe_dir_name(p.name or p.id, p.id)
+        outputs_dir = uploads_root / "videos" / "outputs" / project_dir_name
+        outputs_dir.mkdir(parents=True, exist_ok=True)
+        output_name = f"{p.id}_output_{ts}.mp4"
+        output_abs = outputs_dir / output_name
+
+        # 配音临时目录：uploads/audios/tmp/{project_id}_{ts}
+        aud_tmp_dir = uploads_root / "audios" / "tmp" / f"{p.id}_{ts}"
+        aud_tmp_dir.mkdir(parents=True, exist_ok=True)
 
+        # 广播：准备输出目录
         try:
             await manager.broadcast(
                 __import__("json").dumps({
                     "type": "progress",
                     "scope": "generate_video",
                     "project_id": project_id,
-                    "phase": "normalize_done",
-                    "message": "响度标准化完成",
-                    "progress": 95,
+                    "phase": "prepare_output",
+                    "message": "准备输出与临时目录",
+                    "progress": 10,
                     "timestamp": datetime.now().isoformat(),
                 })
             )
         except Exception:
             pass
 
-        # # 清理临时片段缓存
-        # try:
-        #     if tmp_dir.exists():
-        #         shutil.rmtree(tmp_dir, ignore_errors=True)
-        # except Exception:
-        #     # 清理失败不影响主流程
-        #     pass
+        # 片段剪切与配音
+        total_segments = len(segments)
+        # 广播：开始剪切片段
+        try:
+            await manager.broadcast(
+                __import__("json").dumps({
+                    "type": "progress",
+                    "scope": "generate_video",
+                    "project_id": project_id,
+                    "phase": "cutting_segments_start",
+                    "message": "正在剪切视频片段并生成配音",
+                    "progress": 15,
+                    "timestamp": datetime.now().isoformat(),
+                })
+            )
+        except Exception:
+            pass
+
+        _active_renders[project_id] += 1
+        try:
+            if RENDER_MODE == "filtergraph" and total_segments <= FILTERGRAPH_MAX_SEGMENTS:
+                segments_count = await VideoGenerationService._generate_one_shot(
+                    project_id, segments, input_abs, input_dur, aud_tmp_dir, output_abs
+                )
+            else:
+                if RENDER_MODE == "filtergraph":
+                    logger.info(f"片段数 {total_segments} 超过一次性渲染上限 {FILTERGRAPH_MAX_SEGMENTS}，改用分段渲染")
+                segments_count = await VideoGenerationService._generate_by_segments(
+                    project_id, segments, input_abs, input_dur, aud_tmp_dir, output_abs
+                )
+        finally:
+            _active_renders[project_id] -= 1
+            if _active_renders[project_id] <= 0:
+                del _active_renders[project_id]
+            # 配音已进入 TTS 缓存、片段已进入项目片段目录，本次配音临时目录不再需要
+            shutil.rmtree(aud_tmp_dir, ignore_errors=True)
+        web_output = _to_web_path(output_abs)
+        projects_store.update_project(project_id, {"output_video_path": web_output, "status": "completed"})
 
         result = {
             "output_path": web_output,
-            "segments_count": len(clip_paths),
+            "segments_count": segments_count,
             "started_at": datetime.now().isoformat(),
             "finished_at": datetime.now().isoformat(),
         }
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""大模型请求自适应并发控制（AIMD）测试"""
+
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+
+from modules.ai.base import AIModelConfig, ChatMessage, ResiliencePolicy
+from modules.ai.concurrency import MIN_SAMPLES, AdaptiveLimiter, classify_error, parse_retry_after
+from modules.ai.providers.openrouter import OpenRouterProvider
+from modules.ai.providers.qwen import QwenProvider
+
+
+def _provider(cls, handler):
+    provider = cls(AIModelConfig(provider="stub", api_key="k", base_url="http://stub.local/v1", model_name="m"))
+    provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return provider
+
+
+def _ok_body():
+    return {"choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}], "model": "m"}
+
+
+@pytest.mark.parametrize("cls", [QwenProvider, OpenRouterProvider])
+def test_provider_429_shrinks_limiter(cls):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": "0"}, json={"error": {"message": "rate limited"}})
+
+    async def run():
+        provider = _provider(cls, handler)
+        provider.limiter = AdaptiveLimiter("stub", initial=8)
+        with pytest.raises(httpx.HTTPStatusError) as info:
+            await provider.chat_completion([ChatMessage(role="user", content="hi")],
+                                           policy=ResiliencePolicy(max_attempts=1, hedge_percentile=None))
+        await provider.client.aclose()
+        return provider.limiter, info.value
+
+    limiter, error = asyncio.run(run())
+    assert "rate limited" in str(error)
+    assert classify_error(error)["overload"] is True
+    # 乘性减半
+    assert limiter.limit == 4.0
+    assert limiter.stats["overloads"] == 1
+    assert limiter.stats["decreases"] == 1
+
+
+def test_provider_retries_after_429():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"}, json={"error": {"message": "busy"}})
+        return httpx.Response(200, json=_ok_body())
+
+    async def run():
+        provider = _provider(QwenProvider, handler)
+        provider.limiter = AdaptiveLimiter("stub", initial=4)
+        resp = await provider.chat_completion([ChatMessage(role="user", content="hi")],
+                                              policy=ResiliencePolicy(max_attempts=2, base_delay=0.0,
+                                                                      hedge_percentile=None))
+        await provider.client.aclose()
+        return provider, resp
+
+    provider, resp = asyncio.run(run())
+    assert resp.content == "ok"
+    assert len(calls) == 2
+    assert provider.resilience_stats["retries"] == 1
+    assert provider.limiter.limit == 2.0
+
+
+def test_client_error_is_not_overload():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(401, json={"error": {"message": "bad key"}})
+
+    async def run():
+        provider = _provider(QwenProvider, handler)
+        provider.limiter = AdaptiveLimiter("stub", initial=4)
+        with pytest.raises(httpx.HTTPStatusError):
+            await provider.chat_completion([ChatMessage(role="user", content="hi")],
+                                           policy=ResiliencePolicy(max_attempts=3, hedge_percentile=None))
+        await provider.client.aclose()
+        return provider
+
+    provider = asyncio.run(run())
+    # 鉴权错误不重试，也不收缩并发
+    assert provider.resilience_stats["attempts"] == 1
+    assert provider.limiter.limit == 4.0
+
+
+def _overload(status=429, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "http://stub.local/v1"))
+    return httpx.HTTPStatusError("overload", request=response.request, response=response)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-2") == 0.0
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25.0 <= parse_retry_after(date) <= 30.0
+    assert parse_retry_after(email.utils.formatdate(time.time() - 30, usegmt=True)) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after(None) is None
+
+
+def test_additive_increase_after_steady_latency():
+    limiter = AdaptiveLimiter("stub", initial=2, max_limit=8)
+    for _ in range(MIN_SAMPLES - 1):
+        limiter._on_success(0.1)
+    # 样本不足时不调整
+    assert limiter.limit == 2.0
+    # 每次成功 +1/limit：约一个并发窗口的请求后上限 +1
+    for _ in range(3):
+        limiter._on_success(0.1)
+    assert int(limiter.limit) == 3
+    assert limiter.stats["increases"] == 1
+
+
+def test_latency_degradation_decreases():
+    limiter = AdaptiveLimiter("stub", initial=4, max_limit=4)
+    for _ in range(MIN_SAMPLES):
+        limiter._on_success(0.1)
+    limiter._on_success(5.0)
+    assert limiter.limit == 3.6
+    assert limiter.stats["decreases"] == 1
+
+
+def test_decrease_cooldown():
+    limiter = AdaptiveLimiter("stub", initial=8)
+    limiter._on_error(_overload(429))
+    limiter._on_error(_overload(503))
+    # 同一冷却期内的连续过载只减半一次
+    assert limiter.limit == 4.0
+    assert limiter.stats["overloads"] == 2
+    assert limiter.stats["decreases"] == 1
+    limiter._last_decrease -= 10.0
+    limiter._on_error(httpx.ReadTimeout("timeout"))
+    assert limiter.limit == 2.0
+
+
+def test_retry_after_blocks_new_slots():
+    limiter = AdaptiveLimiter("stub", initial=4)
+    before = time.monotonic()
+    limiter._on_error(_overload(429, retry_after="0.2"))
+    assert limiter.blocked_until >= before + 0.2
+
+    async def acquire():
+        t0 = time.monotonic()
+        async with limiter.slot():
+            return time.monotonic() - t0
+
+    assert asyncio.run(acquire()) >= 0.15
+
+
+def test_min_limit_floor():
+    limiter = AdaptiveLimiter("stub", initial=3, min_limit=2)
+    for _ in range(3):
+        limiter._last_decrease = 0.0
+        limiter._on_error(_overload(503))
+    assert limiter.limit == 2.0
+
+
+def test_slot_respects_limit():
+    limiter = AdaptiveLimiter("stub", initial=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.inflight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(work() for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+    assert limiter.inflight == 0
+    assert limiter.stats["completed"] == 6
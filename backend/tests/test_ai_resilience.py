@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""大模型请求重试/对冲策略测试"""
+
+from collections import deque
+
+from modules.ai.base import AIModelConfig, ResiliencePolicy
+from modules.ai.providers.qwen import QwenProvider
+from modules.ai.tracing import llm_tracer
+
+
+def _provider():
+    return QwenProvider(AIModelConfig(provider="qwen", api_key="k", base_url="http://stub.local/v1", model_name="m"))
+
+
+def test_hedging_is_opt_in(monkeypatch):
+    monkeypatch.delenv("AI_HEDGE", raising=False)
+    assert ResiliencePolicy.from_env().hedge_percentile is None
+    assert ResiliencePolicy().hedge_percentile is None
+    monkeypatch.setenv("AI_HEDGE", "1")
+    assert ResiliencePolicy.from_env().hedge_percentile == 0.9
+
+
+def test_hedge_delay_uses_stage_latencies():
+    provider = _provider()
+    policy = ResiliencePolicy(hedge_percentile=0.9, hedge_min_samples=5)
+    provider._latencies["plot_points"] = deque([1.0] * 10, maxlen=100)
+    provider._latencies["refine_window"] = deque([30.0] * 10, maxlen=100)
+    with llm_tracer.stage("plot_points"):
+        assert provider._hedge_delay(policy) == 1.0
+    with llm_tracer.stage("refine_window"):
+        assert provider._hedge_delay(policy) == 30.0
+    # 该阶段样本不足时不对冲
+    with llm_tracer.stage("script_chunk"):
+        assert provider._hedge_delay(policy) is None
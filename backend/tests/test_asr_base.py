@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ASR 基类测试"""
+
+import zlib
+
+from services.asr_base import BaseASR
+
+
+def test_crc32_is_lazy_and_skipped_with_fingerprint(tmp_path):
+    audio = tmp_path / "a.mp3"
+    audio.write_bytes(b"\x00\x01" * 4096)
+    asr = BaseASR(str(audio), use_cache=False, fingerprint="video:abc")
+    assert asr._crc32_hex is None
+    assert asr.content_fingerprint() == "video:abc"
+    # 传入指纹时不读取文件内容
+    assert asr._crc32_hex is None
+
+
+def test_crc32_fallback_matches_file(tmp_path):
+    data = b"audio-bytes" * 100000
+    audio = tmp_path / "a.mp3"
+    audio.write_bytes(data)
+    asr = BaseASR(str(audio), use_cache=False)
+    assert asr._crc32_hex is None
+    expected = format(zlib.crc32(data) & 0xFFFFFFFF, "08x")
+    assert asr.content_fingerprint() == f"crc32:{expected}"
+    assert BaseASR(data, use_cache=False).crc32_hex == expected
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""必剪 ASR 异步链路测试（本地桩服务：申请上传 / 分片上传 / 提交 / 建任务 / 轮询）"""
+
+import asyncio
+import importlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from services import asr_bcut
+from services.asr_bcut import BcutASR
+
+PER_SIZE = 1024
+RESULT = {"utterances": [{"transcript": "你好", "start_time": 0, "end_time": 1200}]}
+
+
+class _Stub:
+    """桩服务状态：states 为每次查询结果依次返回的 state，用尽后重复最后一个"""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.polls = 0
+        self.parts = {}
+        self.complete = None
+        self.task_resource = None
+
+
+def _serve(stub: _Stub):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _json(self, data, headers=None):
+            payload = json.dumps({"code": 0, "data": data}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = json.loads(self._body() or b"{}")
+            base = f"http://127.0.0.1:{self.server.server_port}"
+            if self.path == "/resource/create":
+                clips = -(-int(body["size"]) // PER_SIZE)
+                self._json({
+                    "in_boss_key": "boss",
+                    "resource_id": "res",
+                    "upload_id": "up",
+                    "upload_urls": [f"{base}/upload/{i}" for i in range(clips)],
+                    "per_size": PER_SIZE,
+                    "size": body["size"],
+                })
+            elif self.path == "/resource/create/complete":
+                stub.complete = body
+                self._json({"download_url": f"{base}/download/audio.mp3"})
+            elif self.path == "/task":
+                stub.task_resource = body["resource"]
+                self._json({"task_id": "task-1"})
+            else:
+                self.send_error(404)
+
+        def do_PUT(self):
+            clip = int(self.path.rsplit("/", 1)[-1])
+            stub.parts[clip] = self._body()
+            self._json({}, headers={"Etag": f"etag-{clip}"})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/task/result":
+                self.send_error(404)
+                return
+            assert parse_qs(url.query)["task_id"] == ["task-1"]
+            state = stub.states[min(stub.polls, len(stub.states) - 1)]
+            stub.polls += 1
+            data = {"state": state}
+            if state == 4:
+                data["result"] = json.dumps(RESULT)
+            elif state == 3:
+                data["remark"] = "模型出错"
+            self._json(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(asr_bcut, "POLL_INTERVAL_INITIAL", 0.01)
+    monkeypatch.setattr(asr_bcut, "POLL_INTERVAL_MAX", 0.02)
+
+
+def _run(states, data: bytes = b"\x01\x02\x03" * 1000):
+    stub = _Stub(states)
+    server = _serve(stub)
+    try:
+        asr = BcutASR(data, use_cache=False, api_base=f"http://127.0.0.1:{server.server_port}/")
+        result = asyncio.run(asr._run_async())
+    finally:
+        server.shutdown()
+        server.server_close()
+    return stub, result
+
+
+def test_upload_and_poll_until_done(fast_poll):
+    data = bytes(range(256)) * 13
+    stub, result = _run([1, 2, 4], data)
+    assert result == RESULT
+    # 分片按序号完整上传，Etag 按分片顺序提交
+    assert len(stub.parts) == 4
+    assert b"".join(stub.parts[i] for i in range(4)) == data
+    assert stub.complete["Etags"] == "etag-0,etag-1,etag-2,etag-3"
+    assert stub.complete["InBossKey"] == "boss"
+    assert stub.task_resource.endswith("/download/audio.mp3")
+    assert stub.polls == 3
+
+
+def test_failed_task_raises(fast_poll):
+    with pytest.raises(RuntimeError, match="模型出错"):
+        _run([1, 3])
+
+
+def test_poll_timeout(fast_poll, monkeypatch):
+    monkeypatch.setattr(asr_bcut, "POLL_TIMEOUT", 0.05)
+    with pytest.raises(TimeoutError):
+        _run([1])
+
+
+def test_api_base_from_env(monkeypatch):
+    monkeypatch.setenv("BCUT_API_BASE", "http://127.0.0.1:9/bcut/")
+    try:
+        module = importlib.reload(asr_bcut)
+        assert module.API_BASE_URL == "http://127.0.0.1:9/bcut"
+        assert module.BcutASR(b"x", use_cache=False).api_base == "http://127.0.0.1:9/bcut"
+    finally:
+        monkeypatch.delenv("BCUT_API_BASE")
+        importlib.reload(asr_bcut)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""长音频分段识别规划与拼接测试"""
+
+from services.asr_chunked import plan_chunks, stitch_utterances
+
+
+def test_short_audio_single_chunk():
+    assert plan_chunks(300.0, [], target=300.0) == [
+        {"start": 0.0, "end": 300.0, "own_start": 0.0, "own_end": 300.0}
+    ]
+
+
+def test_cuts_at_silence_midpoints():
+    chunks = plan_chunks(700.0, [(290.0, 292.0), (598.0, 602.0)], target=300.0, search_window=60.0)
+    assert [(c["own_start"], c["own_end"]) for c in chunks] == [(0.0, 291.0), (291.0, 600.0), (600.0, 700.0)]
+    # 静音处切分不加重叠
+    assert all(c["start"] == c["own_start"] and c["end"] == c["own_end"] for c in chunks)
+
+
+def test_hard_cut_adds_overlap():
+    chunks = plan_chunks(700.0, [], target=300.0, overlap=1.5)
+    assert [(c["own_start"], c["own_end"]) for c in chunks] == [(0.0, 300.0), (300.0, 600.0), (600.0, 700.0)]
+    assert (chunks[0]["start"], chunks[0]["end"]) == (0.0, 301.5)
+    assert (chunks[1]["start"], chunks[1]["end"]) == (298.5, 601.5)
+    assert (chunks[2]["start"], chunks[2]["end"]) == (598.5, 700.0)
+
+
+def test_silence_outside_window_is_ignored():
+    chunks = plan_chunks(700.0, [(100.0, 101.0)], target=300.0, search_window=60.0, overlap=0.0)
+    assert chunks[0]["own_end"] == 300.0
+
+
+def test_stitch_shifts_and_filters_by_own_range():
+    parts = [
+        ({"start": 0.0, "end": 11.0, "own_start": 0.0, "own_end": 10.0}, [
+            {"text": "a", "start_time": 1000, "end_time": 2000},
+            # 中点 10.5s 落在下一段归属区间
+            {"text": "b", "start_time": 10000, "end_time": 11000},
+        ]),
+        ({"start": 9.0, "end": 20.0, "own_start": 10.0, "own_end": 20.0}, [
+            # 中点 9.5s 属于上一段
+            {"text": "x", "start_time": 0, "end_time": 1000},
+            {"text": "b", "start_time": 1000, "end_time": 2000,
+             "words": [{"text": "b", "start_time": 1000, "end_time": 2000}]},
+        ]),
+    ]
+    out = stitch_utterances(parts)
+    assert [(u["text"], u["start_time"], u["end_time"]) for u in out] == [("a", 1000, 2000), ("b", 10000, 11000)]
+    assert out[1]["words"][0]["start_time"] == 10000
+
+
+def test_stitch_dedupes_overlapping_same_text():
+    parts = [
+        ({"start": 0.0, "end": 10.0, "own_start": 0.0, "own_end": 10.0}, [
+            {"text": "同一句", "start_time": 9000, "end_time": 10200},
+        ]),
+        ({"start": 9.5, "end": 20.0, "own_start": 9.99, "own_end": 20.0}, [
+            {"text": "同一句", "start_time": 500, "end_time": 1500},
+            {"text": "同一句", "start_time": 5000, "end_time": 6000},
+        ]),
+    ]
+    out = stitch_utterances(parts)
+    # 时间重叠的重复句去掉，不重叠的同文本句保留
+    assert [(u["start_time"], u["end_time"]) for u in out] == [(9000, 10200), (14500, 15500)]
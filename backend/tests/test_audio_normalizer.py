@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""逐片段响度测量合并测试"""
+
+import pytest
+
+from modules.audio_normalizer import AudioNormalizer
+
+merge = AudioNormalizer.merge_measurements
+
+
+def _m(i, tp=-3.0, lra=5.0, offset=None):
+    m = {"input_i": i, "input_tp": tp, "input_lra": lra, "input_thresh": i - 10.0}
+    if offset is not None:
+        m["target_offset"] = offset
+    return m
+
+
+def test_missing_measurement_returns_none():
+    assert merge([]) is None
+    assert merge([(_m(-20.0), 10.0), (None, 10.0)]) is None
+    assert merge([(_m(-20.0), 0.0)]) is None
+
+
+def test_energy_weighted_integrated_loudness():
+    out = merge([(_m(-20.0, offset=0.5), 10.0), (_m(-22.0, offset=0.5), 10.0)])
+    assert out["input_i"] == pytest.approx(-20.89, abs=0.01)
+    assert out["input_thresh"] == pytest.approx(out["input_i"] - 10.0, abs=0.01)
+    # 相同偏移合并后不变
+    assert out["target_offset"] == pytest.approx(0.5, abs=0.01)
+
+
+def test_target_offset_energy_mean():
+    out = merge([(_m(-20.0, offset=1.0), 10.0), (_m(-20.0, offset=-1.0), 10.0)])
+    assert out["target_offset"] == pytest.approx(-0.11, abs=0.01)
+
+
+def test_offset_omitted_without_segment_offsets():
+    assert "target_offset" not in merge([(_m(-20.0), 10.0)])
+
+
+def test_true_peak_is_max_and_lra_covers_spread():
+    out = merge([(_m(-20.0, tp=-4.0, lra=3.0), 5.0), (_m(-26.0, tp=-1.5, lra=2.0), 5.0)])
+    assert out["input_tp"] == -1.5
+    # 片段间响度跨度 6 LU 大于各片段 LRA
+    assert out["input_lra"] == pytest.approx(6.0, abs=0.01)
+
+
+def test_silent_segments_are_gated():
+    loud = merge([(_m(-20.0), 10.0)])
+    gated = merge([(_m(-20.0), 10.0), (_m(-80.0), 10.0)])
+    assert gated["input_i"] == loud["input_i"]
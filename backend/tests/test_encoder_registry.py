@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""编码器注册表基准选择测试"""
+
+import asyncio
+
+from modules import encoder_registry as registry_module
+from modules.encoder_registry import DEFAULT_X264_PRESET, EncoderRegistry, allowed_presets
+
+
+def _registry(tmp_path, fps_by_preset):
+    reg = EncoderRegistry(registry_path=tmp_path / "encoder_registry.json")
+    reg._data = {"usable_encoders": ["libx264"]}
+
+    async def _bench(encoder, preset, concurrency):
+        return fps_by_preset.get(preset)
+
+    reg._bench_preset = _bench
+    return reg
+
+
+def test_chooses_slowest_preset_meeting_target(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENCODER_TARGET_FPS", "90")
+    reg = _registry(tmp_path, {"ultrafast": 300.0, "superfast": 120.0})
+    data = asyncio.run(reg.run_benchmark())
+    assert data["benchmark"]["chosen_presets"]["libx264"] == "superfast"
+
+
+def test_falls_back_to_default_preset_when_target_unreachable(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENCODER_TARGET_FPS", "1000")
+    reg = _registry(tmp_path, {p: 50.0 for p in allowed_presets()})
+    data = asyncio.run(reg.run_benchmark())
+    assert data["benchmark"]["chosen_presets"]["libx264"] == DEFAULT_X264_PRESET
+
+
+def test_benchmark_ignores_own_load_but_aborts_on_render(tmp_path, monkeypatch):
+    # 基准开始后系统负载升高（自身编码所致）不中止
+    monkeypatch.setattr(registry_module, "_load_per_core", lambda: 10.0)
+    reg = _registry(tmp_path, {"ultrafast": 300.0, "superfast": 120.0})
+    assert reg._host_busy() is True
+    data = asyncio.run(reg.run_benchmark())
+    assert "benchmark" in data
+
+    rendering = {"on": True}
+    reg2 = _registry(tmp_path, {"ultrafast": 300.0})
+    reg2.add_busy_check(lambda: rendering["on"])
+    data2 = asyncio.run(reg2.run_benchmark())
+    assert "benchmark" not in data2
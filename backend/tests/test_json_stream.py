@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""流式 JSON 增量解析测试"""
+
+import json
+
+from modules.json_stream import IncrementalJsonArrayParser
+
+DOC = {
+    "meta": {"items": [{"ignored": True}]},
+    "items": [
+        {"id": 1, "text": "含 } 与 ] 的 \\\"字符串\\\""},
+        {"id": 2, "nested": {"tags": ["a", "b"]}},
+    ],
+}
+
+
+def _feed_chars(parser, text):
+    out = []
+    for ch in text:
+        out.extend(parser.feed(ch))
+    return out
+
+
+def test_elements_emitted_as_they_close():
+    text = json.dumps(DOC, ensure_ascii=False)
+    parser = IncrementalJsonArrayParser(("items",))
+    emitted = _feed_chars(parser, text)
+    # 嵌套对象中的同名键不参与匹配
+    assert [e["id"] for e in emitted] == [1, 2]
+    assert parser.array_key == "items"
+    data, complete = parser.result()
+    assert complete is True
+    assert data == DOC
+
+
+def test_each_element_emitted_once_at_close():
+    parser = IncrementalJsonArrayParser(("plot_points",))
+    assert parser.feed('{"plot_points": [{"title": "A"}, {"tit') == [{"title": "A"}]
+    assert parser.feed('le": "B"}') == [{"title": "B"}]
+    assert parser.feed("]}") == []
+    assert parser.items == [{"title": "A"}, {"title": "B"}]
+
+
+def test_truncated_stream_recovers_closed_elements():
+    parser = IncrementalJsonArrayParser(("items",))
+    parser.feed('```json\n{"items": [{"id": 1}, {"id": 2}, {"id": 3, "text": "被截')
+    data, complete = parser.result()
+    assert complete is False
+    assert data == {"items": [{"id": 1}, {"id": 2}]}
+
+
+def test_top_level_array():
+    parser = IncrementalJsonArrayParser(("items",))
+    emitted = parser.feed('[{"id": 1}, {"id": 2},]')
+    assert emitted == [{"id": 1}, {"id": 2}]
+    data, complete = parser.result()
+    assert complete is True
+    assert data == {"items": [{"id": 1}, {"id": 2}]}
+
+
+def test_lenient_element_with_trailing_comma():
+    parser = IncrementalJsonArrayParser(("items",))
+    assert parser.feed('{"items": [{"id": 1, "tags": ["x"],},') == [{"id": 1, "tags": ["x"]}]
+    # 损坏的元素跳过，不影响后续元素
+    assert parser.feed('{"id": oops}, {"id": 3}') == [{"id": 3}]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""媒体探测缓存测试"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from modules.media_probe import MediaInfo, MediaProbe
+
+
+def _probe(tmp_path, **kwargs):
+    return MediaProbe(cache_dir=tmp_path / "uploads" / "probe_cache", **kwargs)
+
+
+def test_memory_cache_is_lru_bounded(tmp_path):
+    probe = _probe(tmp_path)
+    probe.memory_entries = 2
+    keys = [(f"/v/{i}.mp4", 1, 1) for i in range(3)]
+    for k in keys[:2]:
+        probe._lru_put(probe._memory, k, MediaInfo(path=k[0], size=1, mtime_ns=1), probe.memory_entries)
+    # 访问第一个，使第二个成为最久未用
+    assert probe._lru_get(probe._memory, keys[0]) is not None
+    probe._lru_put(probe._memory, keys[2], MediaInfo(path=keys[2][0], size=1, mtime_ns=1), probe.memory_entries)
+    assert list(probe._memory) == [keys[0], keys[2]]
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    probe = _probe(tmp_path, max_entries=2)
+    probe.cache_dir.mkdir(parents=True)
+    for i, name in enumerate(["a.json", "b.kf.json", "c.json"]):
+        fp = probe.cache_dir / name
+        fp.write_text("{}", encoding="utf-8")
+        os.utime(fp, (1000 + i, 1000 + i))
+    # 命中刷新访问时间
+    probe._touch(probe.cache_dir / "a.json")
+    assert probe.evict() == 1
+    assert sorted(p.name for p in probe.cache_dir.glob("*.json")) == ["a.json", "c.json"]
+
+
+def test_disk_cache_size_bound(tmp_path):
+    probe = _probe(tmp_path, max_bytes=10)
+    probe.cache_dir.mkdir(parents=True)
+    for i in range(3):
+        fp = probe.cache_dir / f"{i}.json"
+        fp.write_text("x" * 8, encoding="utf-8")
+        os.utime(fp, (1000 + i, 1000 + i))
+    assert probe.evict() == 2
+    assert [p.name for p in probe.cache_dir.glob("*.json")] == ["2.json"]
+
+
+def test_tmp_files_skip_disk_cache(tmp_path):
+    probe = _probe(tmp_path)
+    uploads = (tmp_path / "uploads").resolve()
+    assert probe._persistent((str(uploads / "videos" / "movie.mp4"), 1, 1))
+    assert not probe._persistent((str(uploads / "videos" / "tmp" / "p1" / "segments" / "seg.mp4"), 1, 1))
+    assert not probe._persistent((str(Path(tempfile.gettempdir()).resolve() / "x" / "clip.mp4"), 1, 1))
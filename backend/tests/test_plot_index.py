@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""剧情点区间索引测试"""
+
+import random
+
+from modules.plot_index import PlotPointIndex
+
+ITEMS = [
+    {"timestamp": "00:00:10-00:00:40", "title": "开场", "summary": "主角登场", "keywords": ["登场"]},
+    {"timestamp": "00:01:00,500-00:02:00", "title": "冲突", "summary": "第一次交锋", "confidence": 0.9},
+    {"timestamp": "未知", "title": "伏笔", "summary": "时间缺失"},
+    {"timestamp": "00:05:00-00:06:00", "title": "反转", "summary": "身份揭晓\n全场震惊", "keywords": ["反转", "身份"]},
+    {"timestamp": "00:00:00-00:00:05", "summary": "无标题被丢弃"},
+]
+
+
+def test_from_dicts_parses_times_and_ranks():
+    idx = PlotPointIndex.from_dicts(ITEMS)
+    assert len(idx) == 4
+    assert [p.rank for p in idx.points] == [1, 2, 3, 4]
+    conflict = idx.points[1]
+    assert (conflict.start, conflict.end, conflict.confidence) == (60.5, 120.0, 0.9)
+    assert idx.points[2].start is None
+
+
+def test_query_overlap():
+    idx = PlotPointIndex.from_dicts(ITEMS)
+    assert [p.title for p in idx.query(30, 70)] == ["开场", "冲突"]
+    # 端点相接也算重叠
+    assert [p.title for p in idx.query(120, 300)] == ["冲突", "反转"]
+    assert idx.query(130, 290) == []
+    # 时间无法解析的剧情点不参与查询
+    assert all(p.title != "伏笔" for p in idx.query(0, 10000))
+
+
+def test_query_matches_linear_scan():
+    rng = random.Random(7)
+    items = []
+    for i in range(300):
+        s = rng.randint(0, 3600)
+        e = s + rng.randint(0, 300)
+        items.append({"timestamp": f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}-"
+                                   f"{e // 3600:02d}:{e // 60 % 60:02d}:{e % 60:02d}", "title": f"p{i}"})
+    idx = PlotPointIndex.from_dicts(items)
+    for _ in range(50):
+        a = rng.randint(0, 3900)
+        b = a + rng.randint(0, 600)
+        got = {p.title for p in idx.query(a, b)}
+        expected = {p.title for p in idx.points if p.start <= b and p.end >= a}
+        assert got == expected
+
+
+def test_render_roundtrip_through_text():
+    idx = PlotPointIndex.from_dicts(ITEMS)
+    text = idx.render()
+    again = PlotPointIndex.from_text("剧情分析：\n\n" + text)
+    assert [(p.rank, p.title, p.timestamp, p.summary, p.keywords, p.start, p.end) for p in again.points] == \
+        [(p.rank, p.title, p.timestamp, p.summary, p.keywords, p.start, p.end) for p in idx.points]
+    assert again.render() == text
+
+
+def test_render_window_keeps_untimed_and_falls_back():
+    idx = PlotPointIndex.from_dicts(ITEMS)
+    window = idx.render_window(290, 310)
+    assert window.startswith("爆点3：伏笔")
+    assert "爆点4：反转" in window
+    assert "开场" not in window
+    # 无匹配时返回全文前 500 字
+    full = idx.render()
+    assert idx.render_window(1000, 2000) == full[:500] + "..."
+    assert idx.render_window(1000, 2000, fallback="全文") == "全文..."
+    assert PlotPointIndex.from_dicts([]).render_window(0, 10) == ""
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""片段清单测试"""
+
+import asyncio
+
+from modules.segment_manifest import SegmentManifest
+
+
+def _commit(manifest, key, data=b"clip"):
+    part = manifest.segments_dir / f"seg_{key[:24]}.run1.part.mp4"
+    part.write_bytes(data)
+    return manifest.commit(key, part, meta={"index": 1})
+
+
+def test_shared_instance_per_directory(tmp_path):
+    a = SegmentManifest.shared(tmp_path)
+    b = SegmentManifest.shared(tmp_path)
+    assert a is b
+    assert SegmentManifest.shared(tmp_path / "other") is not a
+
+
+def test_saves_once_per_flush(tmp_path):
+    manifest = SegmentManifest.shared(tmp_path)
+    key = SegmentManifest.make_key("src", 0.0, 2.0, "台词", {"provider": "edge_tts"})
+    _commit(manifest, key)
+    assert manifest.lookup(key) is not None
+    # 登记与命中只在内存中更新，flush 时才写入清单
+    assert not manifest.manifest_path.exists()
+    manifest.flush()
+    assert manifest.manifest_path.exists()
+    reloaded = SegmentManifest(tmp_path)
+    hit = reloaded.lookup(key)
+    assert hit is not None and hit["index"] == 1
+
+
+def test_key_lock_serializes_same_key(tmp_path):
+    manifest = SegmentManifest.shared(tmp_path)
+    renders = []
+
+    async def render(key):
+        async with manifest.key_lock(key):
+            if manifest.lookup(key) is None:
+                renders.append(key)
+                await asyncio.sleep(0.01)
+                _commit(manifest, key)
+
+    async def run():
+        await asyncio.gather(render("k" * 64), render("k" * 64), render("j" * 64))
+
+    asyncio.run(run())
+    assert sorted(renders) == ["j" * 64, "k" * 64]
+    assert manifest._key_locks == {}
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""字幕流式解析测试"""
+
+import pytest
+
+from modules.subtitle_parser import _compress_srt, compress_cues, compress_subtitles, iter_cues
+
+SRT = (
+    "﻿1\r\n00:00:01,000 --> 00:00:02,500\r\n<i>第一句</i>  台词\r\n第二行\r\n\r\n"
+    "2\r\n00:00:03,000 --> 00:00:04,000\r\n\r\n"
+    "3\r\n00:01:05,120 --> 00:01:06,000\r\n最后一句"
+)
+
+
+def _generic(content: str) -> str:
+    return compress_cues(iter_cues(content, joiner=" "), strip_tags=True)
+
+
+def test_compress_srt_fast_path_matches_generic():
+    fast = _compress_srt(SRT)
+    assert fast is not None
+    assert fast == _generic(SRT)
+    assert fast == (
+        "[00:00:01,000-00:00:02,500] 第一句 台词 第二行\n"
+        "[00:01:05,120-00:01:06,000] 最后一句\n"
+    )
+
+
+@pytest.mark.parametrize("content", [
+    "WEBVTT\n\n00:01.000 --> 00:02.000\nhello\n",
+    "1\n00:00:01.000 --> 00:00:02.000\nvtt 风格毫秒\n",
+    "[00:00:01,000-00:00:02,000] 压缩行\n",
+    "1\n00:00:01,000 --> 00:00:02,000\na\n2\n00:00:03,000 --> 00:00:04,000\nb\n",
+])
+def test_non_standard_srt_falls_back_to_generic(content):
+    assert _compress_srt(content) is None
+    assert compress_subtitles(content) == _generic(content)
+
+
+def _tuples(content, **kwargs):
+    return [(c.index, c.start_ms, c.end_ms, c.text) for c in iter_cues(content, **kwargs)]
+
+
+def test_iter_cues_srt():
+    assert _tuples(SRT) == [
+        (1, 1000, 2500, "<i>第一句</i>  台词\n第二行"),
+        (2, 3000, 4000, ""),
+        (3, 65120, 66000, "最后一句"),
+    ]
+    assert _tuples(SRT, joiner=" ", strip_tags=True)[0][3] == "第一句  台词 第二行"
+
+
+def test_iter_cues_vtt():
+    vtt = (
+        "WEBVTT - 标题\n\n"
+        "NOTE 这是注释\n00:00.000 --> 00:01.000\n注释块内的时间行不解析\n\n"
+        "STYLE\n::cue { color: red }\n\n"
+        "intro\n00:01.500 --> 00:03.000 align:start position:10%\n<v 甲>你好\n\n"
+        "01:02:03.004 --> 01:02:04.5\n省略与补全毫秒\n"
+    )
+    assert _tuples(vtt, strip_tags=True) == [
+        (1, 1500, 3000, "你好"),
+        (2, 3723004, 3724500, "省略与补全毫秒"),
+    ]
+
+
+def test_iter_cues_ass_dialogue():
+    ass = (
+        "[Script Info]\nTitle: x\n\n[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Dialogue: 0,0:00:01.50,0:00:03.00,Default,,0,0,0,,{\\i1}第一行{\\i0}\\N第二行, 含逗号\n"
+        "Comment: 0,0:00:04.00,0:00:05.00,Default,,0,0,0,,忽略\n"
+    )
+    assert _tuples(ass) == [(1, 1500, 3000, "第一行\n第二行, 含逗号")]
+
+
+def test_iter_cues_bracket_lines_roundtrip():
+    compressed = _generic(SRT)
+    assert _tuples(compressed) == [(1, 1000, 2500, "第一句 台词 第二行"), (2, 65120, 66000, "最后一句")]
+    assert compress_cues(iter_cues(compressed)) == compressed
+
+
+def test_iter_cues_mixed_input():
+    mixed = (
+        "[00:00:00,500-00:00:01,000] 压缩行\n"
+        "7\n00:00:02,000 --> 00:00:03,000\nSRT 条目\n"
+        "[00:00:04,000-00:00:05,000] 紧跟的压缩行\n"
+    )
+    assert _tuples(mixed) == [
+        (1, 500, 1000, "压缩行"),
+        (7, 2000, 3000, "SRT 条目"),
+        (3, 4000, 5000, "紧跟的压缩行"),
+    ]
+
+
+def test_iter_cues_missing_blank_line():
+    content = "1\n00:00:01,000 --> 00:00:02,000\na\n2\n00:00:03,000 --> 00:00:04,000\nb\n"
+    # 缺少空行时，下一条的序号不并入上一条文本
+    assert _tuples(content) == [(1, 1000, 2000, "a"), (2, 3000, 4000, "b")]
+
+
+def test_iter_cues_accepts_line_iterable(tmp_path):
+    path = tmp_path / "a.srt"
+    path.write_text(SRT, encoding="utf-8")
+    with open(path, encoding="utf-8") as f:
+        assert _tuples(f) == _tuples(SRT)
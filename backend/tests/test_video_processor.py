@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""关键帧感知智能剪切规划测试"""
+
+from modules.video_processor import VideoProcessor
+
+plan = VideoProcessor.plan_smart_cut
+
+
+def test_no_keyframe_in_range_encodes_whole():
+    assert plan([0.0, 10.0], 2.0, 8.0) == [("encode", 2.0, 8.0)]
+
+
+def test_short_copy_span_encodes_whole():
+    # 区间内关键帧跨度 0.3s < min_copy
+    assert plan([3.0, 3.3], 2.0, 8.0, min_copy=0.5) == [("encode", 2.0, 8.0)]
+
+
+def test_encode_copy_encode_split():
+    assert plan([0.0, 2.5, 5.0, 7.5, 10.0], 1.0, 9.0) == [
+        ("encode", 1.0, 2.5),
+        ("copy", 2.5, 7.5),
+        ("encode", 7.5, 9.0),
+    ]
+
+
+def test_start_on_keyframe_has_no_leading_encode():
+    assert plan([0.0, 2.0, 4.0, 6.0], 2.0, 5.0) == [("copy", 2.0, 4.0), ("encode", 4.0, 5.0)]
+
+
+def test_both_ends_on_keyframes_copies_only():
+    assert plan([0.0, 2.0, 4.0, 6.0], 2.0, 6.0) == [("copy", 2.0, 6.0)]